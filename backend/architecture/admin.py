@@ -1,9 +1,9 @@
 from django.contrib import admin
 from .models import (
-    ComponentType, OperationType, InfoObject,
+    ComponentType, ComponentTypeStyleRule, OperationType, InfoObject,
     DdGroupType, DdGroup, C2GroupType, C2Group,
     C2Component, DdComponent, DdLinkProtocol, DdLinkPort,
-    DdLink, C2Link, C2LinksInfoObjects
+    DdLink, C2Link, C2LinksInfoObjects, ExportJob
 )
 
 
@@ -13,6 +13,13 @@ class ComponentTypeAdmin(admin.ModelAdmin):
     search_fields = ['name']
 
 
+@admin.register(ComponentTypeStyleRule)
+class ComponentTypeStyleRuleAdmin(admin.ModelAdmin):
+    list_display = ['id', 'pattern', 'style', 'priority']
+    list_editable = ['priority']
+    search_fields = ['pattern']
+
+
 @admin.register(OperationType)
 class OperationTypeAdmin(admin.ModelAdmin):
     list_display = ['id', 'name']
@@ -102,3 +109,10 @@ class C2LinksInfoObjectsAdmin(admin.ModelAdmin):
     list_filter = ['operation_type']
     search_fields = ['c2_link__name', 'infoobject__name']
     raw_id_fields = ['c2_link', 'infoobject', 'operation_type']
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'progress', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status']
+    readonly_fields = ['params_hash', 'created_at', 'started_at', 'finished_at']
@@ -1,14 +1,18 @@
-from ninja import Router
+from ninja import File, Query, Router
+from ninja.files import UploadedFile
 from django.shortcuts import get_object_or_404
-from django.http import Http404, HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from itertools import chain
 from typing import List, Optional
+from pydantic import ValidationError
 from django.db import models
+from django.middleware.gzip import GZipMiddleware
 
 from .models import (
     ComponentType, OperationType, InfoObject,
     DdGroupType, DdGroup, C2GroupType, C2Group,
     C2Component, DdComponent, DdLinkProtocol, DdLinkPort,
-    C2Link, DdLink, C2LinksInfoObjects
+    C2Link, DdLink, C2LinksInfoObjects, ExportJob
 )
 from .schemas import (
     ComponentTypeSchema, ComponentTypeCreateSchema,
@@ -25,15 +29,30 @@ from .schemas import (
     DdLinkSchema, DdLinkCreateSchema, DdLinkUpdateSchema, DdLinkDetailSchema,
     C2LinkSchema, C2LinkCreateSchema, C2LinkUpdateSchema,
     C2LinksInfoObjectsSchema, C2LinksInfoObjectsCreateSchema, C2LinksInfoObjectsUpdateSchema,
-    ErrorSchema, ExportElementSchema, ExportMultipleElementsSchema, ExportAllGroupsSchema
+    GroupFilterSchema, ComponentFilterSchema, DdLinkFilterSchema, DdLinkPortFilterSchema,
+    C2LinkFilterSchema, C2LinksInfoObjectsFilterSchema,
+    DdGroupBulkUpdateSchema, DdComponentBulkUpdateSchema, DdLinkBulkUpdateSchema,
+    BulkResultSchema, BulkErrorSchema, BulkDeleteSchema,
+    ErrorSchema, paginated, ExportElementSchema, ExportMultipleElementsSchema, ExportAllGroupsSchema,
+    ExportJobCreateSchema, ExportJobSchema, DrawioImportResultSchema
 )
-from .export.drawio_export import DrawioExporter
+from .export.c2_export import ELEMENT_TYPES, EXPORTER_CLASSES, get_exporter_class
+from .export.drawio_export import DrawioExporter, ElementsNotFound
+from .export.drawio_import import DrawioImporter, DrawioImportError
+from .bulk import BulkValidationError, bulk_create, bulk_delete, bulk_update
+from .pagination import keyset_paginated
+from .conditional import conditional, document_not_modified, etag_matches, set_document_etag
+from .export.cache import export_cache, get_model_version
+from .export.jobs import get_download_filename, submit_export_job
+from .export.packing import PACKING_STRATEGIES
 
 router = Router()
 
 
 # Component Types
-@router.get("/component-types", response=List[ComponentTypeSchema])
+@router.get("/component-types", response=paginated(ComponentTypeSchema))
+@conditional(ComponentType)
+@keyset_paginated
 def list_component_types(request):
     """Получить список всех типов компонентов"""
     return ComponentType.objects.all()
@@ -71,7 +90,9 @@ def delete_component_type(request, component_type_id: int):
 
 
 # Operation Types
-@router.get("/operation-types", response=List[OperationTypeSchema])
+@router.get("/operation-types", response=paginated(OperationTypeSchema))
+@conditional(OperationType)
+@keyset_paginated
 def list_operation_types(request):
     """Получить список всех типов операций"""
     return OperationType.objects.all()
@@ -109,7 +130,9 @@ def delete_operation_type(request, operation_type_id: int):
 
 
 # Info Objects
-@router.get("/info-objects", response=List[InfoObjectSchema])
+@router.get("/info-objects", response=paginated(InfoObjectSchema))
+@conditional(InfoObject)
+@keyset_paginated
 def list_info_objects(request):
     """Получить список всех информационных объектов"""
     return InfoObject.objects.all()
@@ -147,7 +170,9 @@ def delete_info_object(request, info_object_id: int):
 
 
 # DD Group Types
-@router.get("/dd-group-types", response=List[DdGroupTypeSchema])
+@router.get("/dd-group-types", response=paginated(DdGroupTypeSchema))
+@conditional(DdGroupType)
+@keyset_paginated
 def list_dd_group_types(request):
     """Получить список всех типов групп DD"""
     return DdGroupType.objects.all()
@@ -185,10 +210,12 @@ def delete_dd_group_type(request, dd_group_type_id: int):
 
 
 # DD Groups
-@router.get("/dd-groups", response=List[DdGroupSchema])
-def list_dd_groups(request):
+@router.get("/dd-groups", response=paginated(DdGroupSchema))
+@conditional(DdGroup, DdGroupType)
+@keyset_paginated
+def list_dd_groups(request, filters: GroupFilterSchema = Query(...)):
     """Получить список всех групп DD"""
-    return DdGroup.objects.select_related('type').all()
+    return filters.filter(DdGroup.objects.select_related('type').all())
 
 
 @router.post("/dd-groups", response=DdGroupSchema)
@@ -198,6 +225,33 @@ def create_dd_group(request, payload: DdGroupCreateSchema):
     return dd_group
 
 
+@router.post("/dd-groups/bulk", response={200: BulkResultSchema, 400: BulkErrorSchema})
+def bulk_create_dd_groups(request, payload: List[DdGroupCreateSchema]):
+    """Создать группы DD пакетом в одной транзакции (ID - в порядке запроса)"""
+    try:
+        return {"ids": bulk_create(DdGroup, [item.dict() for item in payload])}
+    except BulkValidationError as e:
+        return 400, e.as_dict()
+
+
+@router.put("/dd-groups/bulk", response={200: BulkResultSchema, 400: BulkErrorSchema})
+def bulk_update_dd_groups(request, payload: List[DdGroupBulkUpdateSchema]):
+    """Обновить группы DD пакетом в одной транзакции (передаются id и изменяемые поля)"""
+    try:
+        return {"ids": bulk_update(DdGroup, [item.dict(exclude_unset=True) for item in payload])}
+    except BulkValidationError as e:
+        return 400, e.as_dict()
+
+
+@router.post("/dd-groups/bulk/delete", response={200: BulkResultSchema, 400: BulkErrorSchema})
+def bulk_delete_dd_groups(request, payload: BulkDeleteSchema):
+    """Удалить группы DD по списку ID в одной транзакции"""
+    try:
+        return {"ids": bulk_delete(DdGroup, payload.ids)}
+    except BulkValidationError as e:
+        return 400, e.as_dict()
+
+
 @router.get("/dd-groups/{dd_group_id}", response=DdGroupSchema)
 def get_dd_group(request, dd_group_id: int):
     """Получить группу DD по ID"""
@@ -222,8 +276,33 @@ def delete_dd_group(request, dd_group_id: int):
     return {"success": True}
 
 
+
+@router.get("/dd-groups/{dd_group_id}/path", response=List[DdGroupSchema])
+def get_dd_group_path(request, dd_group_id: int):
+    """Получить путь от корневой группы DD до указанной группы (одним запросом)"""
+    path = DdGroup.objects.select_related('type').path_to_root(dd_group_id)
+    if not path:
+        raise Http404("Группа DD не найдена")
+    return path
+
+
+@router.get("/dd-groups/{dd_group_id}/subtree", response=List[DdGroupSchema])
+def get_dd_group_subtree(request, dd_group_id: int):
+    """Получить группу DD и все вложенные в нее группы (одним запросом)"""
+    subtree = list(
+        DdGroup.objects.select_related('type')
+        .descendants(dd_group_id, include_self=True)
+        .order_by('id')
+    )
+    if not subtree:
+        raise Http404("Группа DD не найдена")
+    return subtree
+
+
 # C2 Group Types
-@router.get("/c2-group-types", response=List[C2GroupTypeSchema])
+@router.get("/c2-group-types", response=paginated(C2GroupTypeSchema))
+@conditional(C2GroupType)
+@keyset_paginated
 def list_c2_group_types(request):
     """Получить список всех типов групп C2"""
     return C2GroupType.objects.all()
@@ -261,10 +340,12 @@ def delete_c2_group_type(request, c2_group_type_id: int):
 
 
 # C2 Groups
-@router.get("/c2-groups", response=List[C2GroupSchema])
-def list_c2_groups(request):
+@router.get("/c2-groups", response=paginated(C2GroupSchema))
+@conditional(C2Group)
+@keyset_paginated
+def list_c2_groups(request, filters: GroupFilterSchema = Query(...)):
     """Получить список всех групп C2"""
-    return C2Group.objects.all()
+    return filters.filter(C2Group.objects.all())
 
 
 @router.post("/c2-groups", response=C2GroupSchema)
@@ -298,11 +379,31 @@ def delete_c2_group(request, c2_group_id: int):
     return {"success": True}
 
 
+@router.get("/c2-groups/{c2_group_id}/path", response=List[C2GroupSchema])
+def get_c2_group_path(request, c2_group_id: int):
+    """Получить путь от корневой группы C2 до указанной группы (одним запросом)"""
+    path = C2Group.objects.path_to_root(c2_group_id)
+    if not path:
+        raise Http404("Группа C2 не найдена")
+    return path
+
+
+@router.get("/c2-groups/{c2_group_id}/subtree", response=List[C2GroupSchema])
+def get_c2_group_subtree(request, c2_group_id: int):
+    """Получить группу C2 и все вложенные в нее группы (одним запросом)"""
+    subtree = list(C2Group.objects.descendants(c2_group_id, include_self=True).order_by('id'))
+    if not subtree:
+        raise Http404("Группа C2 не найдена")
+    return subtree
+
+
 # C2 Components
-@router.get("/c2-components", response=List[C2ComponentSchema])
-def list_c2_components(request):
+@router.get("/c2-components", response=paginated(C2ComponentSchema))
+@conditional(C2Component)
+@keyset_paginated
+def list_c2_components(request, filters: ComponentFilterSchema = Query(...)):
     """Получить список всех компонентов C2"""
-    return C2Component.objects.all()
+    return filters.filter(C2Component.objects.all())
 
 
 @router.post("/c2-components", response=C2ComponentSchema)
@@ -337,10 +438,12 @@ def delete_c2_component(request, c2_component_id: int):
 
 
 # DD Components
-@router.get("/dd-components", response=List[DdComponentSchema])
-def list_dd_components(request):
+@router.get("/dd-components", response=paginated(DdComponentSchema))
+@conditional(DdComponent, ComponentType)
+@keyset_paginated
+def list_dd_components(request, filters: ComponentFilterSchema = Query(...)):
     """Получить список всех компонентов DD"""
-    return DdComponent.objects.select_related('type').all()
+    return filters.filter(DdComponent.objects.select_related('type').all())
 
 
 @router.post("/dd-components", response=DdComponentSchema)
@@ -350,6 +453,33 @@ def create_dd_component(request, payload: DdComponentCreateSchema):
     return dd_component
 
 
+@router.post("/dd-components/bulk", response={200: BulkResultSchema, 400: BulkErrorSchema})
+def bulk_create_dd_components(request, payload: List[DdComponentCreateSchema]):
+    """Создать компоненты DD пакетом в одной транзакции (ID - в порядке запроса)"""
+    try:
+        return {"ids": bulk_create(DdComponent, [item.dict() for item in payload])}
+    except BulkValidationError as e:
+        return 400, e.as_dict()
+
+
+@router.put("/dd-components/bulk", response={200: BulkResultSchema, 400: BulkErrorSchema})
+def bulk_update_dd_components(request, payload: List[DdComponentBulkUpdateSchema]):
+    """Обновить компоненты DD пакетом в одной транзакции (передаются id и изменяемые поля)"""
+    try:
+        return {"ids": bulk_update(DdComponent, [item.dict(exclude_unset=True) for item in payload])}
+    except BulkValidationError as e:
+        return 400, e.as_dict()
+
+
+@router.post("/dd-components/bulk/delete", response={200: BulkResultSchema, 400: BulkErrorSchema})
+def bulk_delete_dd_components(request, payload: BulkDeleteSchema):
+    """Удалить компоненты DD по списку ID в одной транзакции"""
+    try:
+        return {"ids": bulk_delete(DdComponent, payload.ids)}
+    except BulkValidationError as e:
+        return 400, e.as_dict()
+
+
 @router.get("/dd-components/{dd_component_id}", response=DdComponentSchema)
 def get_dd_component(request, dd_component_id: int):
     """Получить компонент DD по ID"""
@@ -374,8 +504,11 @@ def delete_dd_component(request, dd_component_id: int):
     return {"success": True}
 
 
+
 # DD Link Protocols
-@router.get("/dd-link-protocols", response=List[DdLinkProtocolSchema])
+@router.get("/dd-link-protocols", response=paginated(DdLinkProtocolSchema))
+@conditional(DdLinkProtocol)
+@keyset_paginated
 def list_dd_link_protocols(request):
     """Получить список всех протоколов связи DD"""
     return DdLinkProtocol.objects.all()
@@ -413,10 +546,12 @@ def delete_dd_link_protocol(request, dd_link_protocol_id: int):
 
 
 # DD Link Ports
-@router.get("/dd-link-ports", response=List[DdLinkPortSchema])
-def list_dd_link_ports(request):
+@router.get("/dd-link-ports", response=paginated(DdLinkPortSchema))
+@conditional(DdLinkPort)
+@keyset_paginated
+def list_dd_link_ports(request, filters: DdLinkPortFilterSchema = Query(...)):
     """Получить список всех портов связи DD"""
-    return DdLinkPort.objects.all()
+    return filters.filter(DdLinkPort.objects.all())
 
 
 @router.post("/dd-link-ports", response=DdLinkPortSchema)
@@ -451,10 +586,12 @@ def delete_dd_link_port(request, dd_link_port_id: int):
 
 
 # DD Links
-@router.get("/dd-links", response=List[DdLinkSchema])
-def list_dd_links(request):
+@router.get("/dd-links", response=paginated(DdLinkSchema))
+@conditional(DdLink)
+@keyset_paginated
+def list_dd_links(request, filters: DdLinkFilterSchema = Query(...)):
     """Получить список всех связей DD"""
-    return DdLink.objects.all()
+    return filters.filter(DdLink.objects.all())
 
 
 @router.post("/dd-links", response=DdLinkSchema)
@@ -464,6 +601,33 @@ def create_dd_link(request, payload: DdLinkCreateSchema):
     return dd_link
 
 
+@router.post("/dd-links/bulk", response={200: BulkResultSchema, 400: BulkErrorSchema})
+def bulk_create_dd_links(request, payload: List[DdLinkCreateSchema]):
+    """Создать связи DD пакетом в одной транзакции (ID - в порядке запроса)"""
+    try:
+        return {"ids": bulk_create(DdLink, [item.dict() for item in payload])}
+    except BulkValidationError as e:
+        return 400, e.as_dict()
+
+
+@router.put("/dd-links/bulk", response={200: BulkResultSchema, 400: BulkErrorSchema})
+def bulk_update_dd_links(request, payload: List[DdLinkBulkUpdateSchema]):
+    """Обновить связи DD пакетом в одной транзакции (передаются id и изменяемые поля)"""
+    try:
+        return {"ids": bulk_update(DdLink, [item.dict(exclude_unset=True) for item in payload])}
+    except BulkValidationError as e:
+        return 400, e.as_dict()
+
+
+@router.post("/dd-links/bulk/delete", response={200: BulkResultSchema, 400: BulkErrorSchema})
+def bulk_delete_dd_links(request, payload: BulkDeleteSchema):
+    """Удалить связи DD по списку ID в одной транзакции"""
+    try:
+        return {"ids": bulk_delete(DdLink, payload.ids)}
+    except BulkValidationError as e:
+        return 400, e.as_dict()
+
+
 @router.get("/dd-links/{dd_link_id}", response=DdLinkSchema)
 def get_dd_link(request, dd_link_id: int):
     """Получить связь DD по ID"""
@@ -488,6 +652,7 @@ def delete_dd_link(request, dd_link_id: int):
     return {"success": True}
 
 
+
 @router.get("/dd-groups/{group_id}/links", response=List[DdLinkDetailSchema])
 def get_group_links(request, group_id: int):
     """Получить все связи для группы (входящие и исходящие)"""
@@ -502,10 +667,12 @@ def get_group_links(request, group_id: int):
 
 
 # C2 Links
-@router.get("/c2-links", response=List[C2LinkSchema])
-def list_c2_links(request):
+@router.get("/c2-links", response=paginated(C2LinkSchema))
+@conditional(C2Link)
+@keyset_paginated
+def list_c2_links(request, filters: C2LinkFilterSchema = Query(...)):
     """Получить список всех связей C2"""
-    return C2Link.objects.all()
+    return filters.filter(C2Link.objects.all())
 
 
 @router.post("/c2-links", response=C2LinkSchema)
@@ -540,10 +707,12 @@ def delete_c2_link(request, c2_link_id: int):
 
 
 # C2 Links Info Objects
-@router.get("/c2-links-info-objects", response=List[C2LinksInfoObjectsSchema])
-def list_c2_links_info_objects(request):
+@router.get("/c2-links-info-objects", response=paginated(C2LinksInfoObjectsSchema))
+@conditional(C2LinksInfoObjects)
+@keyset_paginated
+def list_c2_links_info_objects(request, filters: C2LinksInfoObjectsFilterSchema = Query(...)):
     """Получить список всех связей C2 - Информационные объекты"""
-    return C2LinksInfoObjects.objects.all()
+    return filters.filter(C2LinksInfoObjects.objects.all())
 
 
 @router.post("/c2-links-info-objects", response=C2LinksInfoObjectsSchema)
@@ -580,26 +749,128 @@ def delete_c2_links_info_objects(request, c2_links_info_objects_id: int):
 # Экспорт в drawio
 # Унифицированные эндпоинты экспорта
 
+# GZipMiddleware используется только для ответов экспорта: он учитывает
+# Accept-Encoding, выставляет Vary и поддерживает потоковые ответы
+_gzip_middleware = GZipMiddleware(lambda request: None)
+
+
+def _negotiate_encoding(request, response):
+    """Сжимает ответ gzip, если клиент его поддерживает"""
+    return _gzip_middleware.process_response(request, response)
+
+
+def _drawio_response(request, kind, params, render, filename):
+    """
+    Формирует ответ с drawio документом, используя кэш экспорта.
+    При попадании в кэш (и для 304) выполняется только запрос версии модели,
+    расчет layout не затрагивается.
+    
+    Экспорт не меняет данных (POST - из-за тела запроса), поэтому при
+    совпадении If-None-Match с ETag документа, как и для GET, отдается 304.
+    """
+    version = get_model_version()
+    etag = export_cache.make_etag(kind, params, version)
+    if etag_matches(request, etag):
+        return document_not_modified(etag)
+    
+    xml_content, cache_hit = export_cache.get_or_render(kind, params, render, version)
+    
+    response = HttpResponse(xml_content, content_type='application/xml')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['X-Export-Cache'] = 'HIT' if cache_hit else 'MISS'
+    return set_document_etag(_negotiate_encoding(request, response), etag)
+
+
+def _streaming_drawio_response(request, kind, params, stream, filename):
+    """
+    Формирует потоковый ответ с drawio документом. Готовый документ берется
+    из кэша, иначе stream() возвращает итератор частей документа, который
+    отдается клиенту по мере формирования и попутно кэшируется.
+    ETag и 304 - как в _drawio_response.
+    
+    Первая часть документа формируется до создания ответа: ошибки загрузки
+    дерева и layout первых групп выбрасываются здесь и доходят до обработчика
+    эндпоинта ({"error": ...}). Ошибка в середине потока возникает уже после
+    отправки статуса 200 и заголовков: соединение обрывается, клиент получает
+    незавершенный документ, а в кэш он не попадает (см. ExportCache.cache_stream).
+    """
+    version = get_model_version()
+    etag = export_cache.make_etag(kind, params, version)
+    if etag_matches(request, etag):
+        return document_not_modified(etag)
+    
+    xml_content = export_cache.get(kind, params, version)
+    if xml_content is not None:
+        response = HttpResponse(xml_content, content_type='application/xml')
+        response['X-Export-Cache'] = 'HIT'
+    else:
+        chunks = export_cache.cache_stream(kind, params, _start_stream(stream()), version)
+        response = StreamingHttpResponse(chunks, content_type='application/xml')
+        response['X-Export-Cache'] = 'MISS'
+    
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return set_document_etag(_negotiate_encoding(request, response), etag)
+
+
+def _start_stream(chunks):
+    """Формирует первую часть потока сразу и возвращает итератор всех частей"""
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        return chunks
+    return chain([first], chunks)
+
+
+def _collapse_options(payload):
+    """Заданные в запросе параметры свертки поддеревьев (max_depth, collapse_threshold)"""
+    options = {'max_depth': payload.max_depth, 'collapse_threshold': payload.collapse_threshold}
+    return {name: value for name, value in options.items() if value is not None}
+
+
+def _collapse_options_error(options):
+    """Сообщение об ошибке в параметрах свертки или None"""
+    for name, value in options.items():
+        if value < 0:
+            return f"{name} не может быть отрицательным"
+    return None
+
+
 @router.post("/export")
 def export_single_element(request, payload: ExportElementSchema):
     """Экспортировать один элемент в формат drawio XML
     
-    Body: {"element_id": 1, "element_type": "ddgroup"}
+    Body: {"element_id": 1, "element_type": "ddgroup", "compressed": false, "packing": "shelf"}
+    element_type - ddgroup, ddcomponent (диаграмма развертывания) или c2group, c2component
+    (диаграмма контейнеров)
+    max_depth, collapse_threshold - свертка поддеревьев в ячейку со сводкой (см. /export/all)
     """
     try:
         element_id = payload.element_id
         element_type = payload.element_type
+        compressed = payload.compressed
+        packing = payload.packing
+        collapse = _collapse_options(payload)
         
-        if element_type not in ['ddgroup', 'ddcomponent']:
-            return {"error": "Неподдерживаемый тип элемента. Используйте: ddgroup, ddcomponent"}
-        
-        exporter = DrawioExporter()
-        xml_content = exporter.export_element_to_drawio(element_id, element_type)
+        if element_type not in ELEMENT_TYPES:
+            return {"error": f"Неподдерживаемый тип элемента. Используйте: {', '.join(ELEMENT_TYPES)}"}
+        if packing not in PACKING_STRATEGIES:
+            return {"error": f"Неподдерживаемая стратегия размещения: {packing}. Используйте: {', '.join(PACKING_STRATEGIES)}"}
+        collapse_error = _collapse_options_error(collapse)
+        if collapse_error:
+            return {"error": collapse_error}
         
-        response = HttpResponse(xml_content, content_type='application/xml')
-        response['Content-Disposition'] = f'attachment; filename="{element_type}_{element_id}.drawio"'
-        return response
-    except (DdGroup.DoesNotExist, DdComponent.DoesNotExist):
+        exporter_class = EXPORTER_CLASSES[element_type]
+        return _drawio_response(
+            request,
+            'element',
+            {'element_id': element_id, 'element_type': element_type, 'compressed': compressed, 'packing': packing,
+             **collapse},
+            lambda: exporter_class(compressed=compressed, packing=packing, **collapse).export_element_to_drawio(
+                element_id, element_type
+            ),
+            f'{element_type}_{element_id}.drawio',
+        )
+    except (DdGroup.DoesNotExist, DdComponent.DoesNotExist, C2Group.DoesNotExist, C2Component.DoesNotExist):
         raise Http404("Элемент не найден")
     except Exception as e:
         return {"error": f"Ошибка при экспорте: {str(e)}"}
@@ -610,8 +881,13 @@ def export_multiple_elements(request, payload: ExportMultipleElementsSchema):
     """Экспортировать несколько элементов в формат drawio XML
     
     Body: {
-        "elements": [{"id": 1, "type": "ddgroup"}, {"id": 2, "type": "ddcomponent"}]
+        "elements": [{"id": 1, "type": "ddgroup"}, {"id": 2, "type": "ddcomponent"}],
+        "compressed": false,
+        "packing": "shelf"
     }
+    
+    Если часть элементов не найдена - 404 со списком всех отсутствующих:
+    {"detail": "...", "missing": [{"id": 2, "type": "ddcomponent"}]}
     """
     try:
         elements = payload.elements
@@ -621,20 +897,39 @@ def export_multiple_elements(request, payload: ExportMultipleElementsSchema):
         
         # Валидация элементов
         for element in elements:
-            if element.type not in ['ddgroup', 'ddcomponent']:
-                return {"error": f"Неподдерживаемый тип элемента: {element.type}. Используйте: ddgroup, ddcomponent"}
+            if element.type not in ELEMENT_TYPES:
+                return {"error": f"Неподдерживаемый тип элемента: {element.type}. Используйте: {', '.join(ELEMENT_TYPES)}"}
+        try:
+            exporter_class = get_exporter_class(element.type for element in elements)
+        except ValueError as e:
+            return {"error": str(e)}
         
         # Преобразуем в формат для экспортера
         elements_data = [{"id": elem.id, "type": elem.type} for elem in elements]
         
-        exporter = DrawioExporter()
-        xml_content = exporter.export_multiple_elements_to_drawio(elements_data)
+        compressed = payload.compressed
+        packing = payload.packing
+        collapse = _collapse_options(payload)
+        if packing not in PACKING_STRATEGIES:
+            return {"error": f"Неподдерживаемая стратегия размещения: {packing}. Используйте: {', '.join(PACKING_STRATEGIES)}"}
+        collapse_error = _collapse_options_error(collapse)
+        if collapse_error:
+            return {"error": collapse_error}
         
-        response = HttpResponse(xml_content, content_type='application/xml')
-        response['Content-Disposition'] = 'attachment; filename="multiple_elements.drawio"'
-        return response
-    except (DdGroup.DoesNotExist, DdComponent.DoesNotExist):
-        raise Http404("Один или несколько элементов не найдены")
+        return _drawio_response(
+            request,
+            'multiple',
+            {'elements': elements_data, 'compressed': compressed, 'packing': packing, **collapse},
+            lambda: exporter_class(compressed=compressed, packing=packing, **collapse).export_multiple_elements_to_drawio(
+                elements_data
+            ),
+            'multiple_elements.drawio',
+        )
+    except ElementsNotFound as e:
+        return JsonResponse(
+            {"detail": "Один или несколько элементов не найдены", "missing": e.missing},
+            status=404,
+        )
     except Exception as e:
         return {"error": f"Ошибка при экспорте: {str(e)}"}
 
@@ -643,21 +938,150 @@ def export_multiple_elements(request, payload: ExportMultipleElementsSchema):
 def export_all_groups(request, payload: ExportAllGroupsSchema):
     """Экспортировать все группы или начиная с определенной группы
     
-    Body: {"root_group_id": 1} или {}
+    Body: {"root_group_id": 1, "compressed": false, "packing": "shelf", "pages": false, "page_depth": 0} или {}
+    pages - многостраничный документ: по странице на каждую группу глубины
+    page_depth (0 - корневые группы) и страница содержания со ссылками на них.
+    max_depth - группы ниже этой глубины не загружаются, группы на ней заменяются
+    ячейкой со сводкой по поддереву (число групп, компонентов и экземпляров);
+    collapse_threshold - так же заменяются поддеревья больше указанного числа
+    групп и компонентов.
+    
+    Документ отдается потоком: ошибка после начала отдачи обрывает ответ
+    (статус 200 уже отправлен), такой документ не кэшируется.
     """
     try:
         root_group_id = payload.root_group_id
+        compressed = payload.compressed
+        packing = payload.packing
+        pages = payload.pages
+        page_depth = payload.page_depth
+        collapse = _collapse_options(payload)
         
-        exporter = DrawioExporter()
-        xml_content = exporter.export_dd_groups_to_drawio(root_group_id)
+        if packing not in PACKING_STRATEGIES:
+            return {"error": f"Неподдерживаемая стратегия размещения: {packing}. Используйте: {', '.join(PACKING_STRATEGIES)}"}
+        if page_depth < 0:
+            return {"error": "Глубина страниц не может быть отрицательной"}
+        collapse_error = _collapse_options_error(collapse)
+        if collapse_error:
+            return {"error": collapse_error}
         
-        response = HttpResponse(xml_content, content_type='application/xml')
         if root_group_id:
-            response['Content-Disposition'] = f'attachment; filename="dd_groups_from_{root_group_id}.drawio"'
+            filename = f'dd_groups_from_{root_group_id}.drawio'
         else:
-            response['Content-Disposition'] = 'attachment; filename="all_dd_groups.drawio"'
-        return response
+            filename = 'all_dd_groups.drawio'
+        
+        params = {'root_group_id': root_group_id, 'compressed': compressed, 'packing': packing}
+        if pages:
+            params.update(pages=True, page_depth=page_depth)
+        params.update(collapse)
+        
+        def stream():
+            exporter = DrawioExporter(compressed=compressed, packing=packing, **collapse)
+            if pages:
+                return exporter.stream_pages_to_drawio(root_group_id, page_depth)
+            return exporter.stream_dd_groups_to_drawio(root_group_id)
+        
+        return _streaming_drawio_response(request, 'all', params, stream, filename)
     except DdGroup.DoesNotExist:
         raise Http404("Группа DD не найдена")
     except Exception as e:
         return {"error": f"Ошибка при экспорте: {str(e)}"}
+
+
+@router.get("/export/cache/stats")
+def export_cache_stats(request):
+    """Статистика кэша экспорта: попадания, промахи и текущая версия модели"""
+    return export_cache.stats()
+
+
+# Асинхронные задания экспорта
+EXPORT_JOB_SCHEMAS = {
+    'element': ExportElementSchema,
+    'multiple': ExportMultipleElementsSchema,
+    'all': ExportAllGroupsSchema,
+}
+
+
+@router.post("/export/jobs", response={202: ExportJobSchema, 400: ErrorSchema})
+def create_export_job(request, payload: ExportJobCreateSchema):
+    """Поставить экспорт в очередь. Задание выполняет команда export_worker
+    
+    Body: {"kind": "all", "params": {"root_group_id": 1}}
+    kind - element, multiple или all; params - тело соответствующего эндпоинта экспорта.
+    Если такое же задание уже ожидает или выполняется, возвращается оно.
+    """
+    schema = EXPORT_JOB_SCHEMAS.get(payload.kind)
+    if schema is None:
+        return 400, {"detail": f"Неподдерживаемый вид экспорта: {payload.kind}. Используйте: element, multiple, all"}
+    
+    try:
+        options = schema(**payload.params)
+    except ValidationError as e:
+        return 400, {"detail": f"Некорректные параметры экспорта: {e}"}
+    params = options.dict()
+    
+    element_types = [params['element_type']] if payload.kind == 'element' else [
+        element['type'] for element in params.get('elements', [])
+    ]
+    for element_type in element_types:
+        if element_type not in ELEMENT_TYPES:
+            return 400, {"detail": f"Неподдерживаемый тип элемента: {element_type}. Используйте: {', '.join(ELEMENT_TYPES)}"}
+    try:
+        get_exporter_class(element_types)
+    except ValueError as e:
+        return 400, {"detail": str(e)}
+    if params['packing'] not in PACKING_STRATEGIES:
+        return 400, {"detail": f"Неподдерживаемая стратегия размещения: {params['packing']}. Используйте: {', '.join(PACKING_STRATEGIES)}"}
+    if params.get('page_depth', 0) < 0:
+        return 400, {"detail": "Глубина страниц не может быть отрицательной"}
+    collapse_error = _collapse_options_error(_collapse_options(options))
+    if collapse_error:
+        return 400, {"detail": collapse_error}
+    
+    job, _ = submit_export_job(payload.kind, params)
+    return 202, job
+
+
+@router.get("/export/jobs/{job_id}", response=ExportJobSchema)
+def get_export_job(request, job_id: int):
+    """Получить статус и прогресс задания экспорта"""
+    return get_object_or_404(ExportJob, id=job_id)
+
+
+@router.get("/export/jobs/{job_id}/download", response={409: ErrorSchema})
+def download_export_job(request, job_id: int):
+    """Скачать результат выполненного задания экспорта"""
+    job = get_object_or_404(ExportJob, id=job_id)
+    if job.status != ExportJob.STATUS_DONE:
+        return 409, {"detail": f"Задание еще не выполнено (статус: {job.status})"}
+    
+    try:
+        result = open(job.result_path, 'rb')
+    except OSError:
+        raise Http404("Файл результата не найден")
+    
+    return FileResponse(
+        result,
+        as_attachment=True,
+        filename=get_download_filename(job),
+        content_type='application/xml',
+    )
+
+
+# Импорт из drawio
+@router.post("/import", response={200: DrawioImportResultSchema, 400: ErrorSchema})
+def import_drawio(request, file: UploadedFile = File(...), root_group_id: Optional[int] = None):
+    """Импортировать группы и компоненты DD из документа drawio
+    
+    multipart/form-data с файлом .drawio в поле file; ?root_group_id=1 - поместить
+    корневые группы документа в существующую группу. Вершины с c4Instances или
+    c4Specifications становятся группами, с c4Type или c4Technology - компонентами.
+    Документ читается потоково, строки создаются пакетами в одной транзакции.
+    """
+    try:
+        result = DrawioImporter().import_file(file, root_group_id)
+    except DrawioImportError as e:
+        return 400, {"detail": str(e)}
+    except DdGroup.DoesNotExist:
+        raise Http404("Группа DD не найдена")
+    return result._asdict()
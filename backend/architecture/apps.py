@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ArchitectureConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'architecture'
+
+    def ready(self):
+        from .signals import connect_signals
+        connect_signals()
@@ -0,0 +1,3 @@
+"""
+Бенчмарки экспорта архитектурных диаграмм
+"""
@@ -0,0 +1,277 @@
+"""
+Бенчмарк экспорта в drawio на синтетических деревьях DD
+
+Запуск из каталога backend (создается отдельная тестовая база данных):
+
+    python manage.py benchmark_export
+    python manage.py benchmark_export --shapes wide deep --groups 5000 --output results.json
+    python manage.py benchmark_export --compare results.json
+
+Для каждой формы дерева генерируются группы, компоненты и связи, после чего
+для export_dd_groups_to_drawio, export_element_to_drawio и
+export_multiple_elements_to_drawio (relayout - повторный экспорт всех групп
+с кэшем layout) измеряются время, число запросов, пиковый объем памяти
+(tracemalloc) и размер документа. Данные каждой формы
+создаются в транзакции, которая затем откатывается.
+"""
+
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from ..export.drawio_export import DrawioExporter
+from ..export.layout_cache import LayoutCache
+from ..export.styles import get_component_style_resolver
+from ..models import ComponentType, DdComponent, DdGroup, DdGroupType, DdLink, DdLinkPort, DdLinkProtocol
+
+
+# Формы дерева:
+# wide - две корневые группы, все остальные группы - их прямые дети
+# deep - две цепочки вложенных групп
+# balanced - каждая группа имеет BALANCED_FAN_OUT детей
+# skewed - как balanced, но число компонентов распределено по Парето
+#          (в среднем столько же): у большинства групп компонентов мало,
+#          у нескольких - сотни
+SHAPES = ('wide', 'deep', 'balanced', 'skewed')
+BALANCED_FAN_OUT = 4
+ROOT_COUNT = 2
+SKEWED_ALPHA = 1.2
+SKEWED_MAX_COMPONENTS = 500
+
+# relayout - экспорт всех групп с кэшем layout, в котором перед каждым запуском
+# сброшены записи одного листа и его предков (сравнивается с all)
+OPERATIONS = ('all', 'element', 'multiple', 'relayout')
+BATCH_SIZE = 1000
+
+COMPONENT_TYPES = ('Application', 'Database', 'Message Broker', 'File Storage', 'Service')
+LINK_PROTOCOLS = ('HTTPS', 'gRPC', 'AMQP')
+
+
+def _parent_index(shape: str, index: int) -> Optional[int]:
+    """Индекс родителя группы index (группы создаются в порядке обхода в ширину)"""
+    if index < ROOT_COUNT:
+        return None
+    if shape == 'wide':
+        return index % ROOT_COUNT
+    if shape == 'deep':
+        return index - ROOT_COUNT
+    return (index - ROOT_COUNT) // BALANCED_FAN_OUT
+
+
+def generate_tree(shape: str, groups: int, components_per_group: int, links_per_group: float,
+                  seed: int = 0) -> Dict:
+    """
+    Создает синтетическое дерево DD заданной формы.
+
+    Объекты создаются bulk_create с заранее назначенными ID (сигналы
+    не вызываются). Возвращает описание дерева: число объектов и ID
+    элементов для экспорта отдельных элементов.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Неизвестная форма дерева: {shape}. Используйте: {', '.join(SHAPES)}")
+
+    rnd = random.Random(seed)
+    group_type = DdGroupType.objects.create(name=f'benchmark-{shape}')
+    component_types = [ComponentType.objects.create(name=name) for name in COMPONENT_TYPES]
+    protocols = [DdLinkProtocol.objects.get_or_create(name=name)[0] for name in LINK_PROTOCOLS]
+
+    first_group_id = (DdGroup.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+    group_ids = [first_group_id + index for index in range(groups)]
+    DdGroup.objects.bulk_create(
+        (
+            DdGroup(
+                id=group_id,
+                parent_id=None if _parent_index(shape, index) is None else group_ids[_parent_index(shape, index)],
+                name=f'{shape}-group-{index}',
+                type=group_type,
+                instances=rnd.randint(0, 3),
+                specification='' if index % 3 else f'{rnd.randint(1, 64)} CPU, {rnd.randint(1, 256)} GB RAM',
+            )
+            for index, group_id in enumerate(group_ids)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    def component_count():
+        if shape == 'skewed':
+            # Среднее paretovariate(alpha) - 1 равно 1 / (alpha - 1)
+            count = components_per_group * (SKEWED_ALPHA - 1) * (rnd.paretovariate(SKEWED_ALPHA) - 1)
+            return min(int(count), SKEWED_MAX_COMPONENTS)
+        return components_per_group
+
+    first_component_id = (DdComponent.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+    components = []
+    for group_id in group_ids:
+        for _ in range(component_count()):
+            component_id = first_component_id + len(components)
+            components.append(DdComponent(
+                id=component_id,
+                group_id=group_id,
+                name=f'component-{component_id}',
+                type=rnd.choice(component_types),
+                technology=rnd.choice(('Java', 'Python', 'PostgreSQL', 'Kafka', '')),
+                description='' if component_id % 2 else 'Синтетический компонент',
+            ))
+    DdComponent.objects.bulk_create(components, batch_size=BATCH_SIZE)
+
+    link_count = int(groups * links_per_group)
+    first_link_id = (DdLink.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+    links = [
+        DdLink(
+            id=first_link_id + index,
+            group_from_id=rnd.choice(group_ids),
+            group_to_id=rnd.choice(group_ids),
+            protocol=rnd.choice(protocols),
+        )
+        for index in range(link_count)
+    ]
+    DdLink.objects.bulk_create(links, batch_size=BATCH_SIZE)
+    DdLinkPort.objects.bulk_create(
+        (
+            DdLinkPort(dd_link_id=link.id, port=port)
+            for link in links
+            for port in rnd.sample((80, 443, 5432, 8080, 9092), rnd.randint(0, 2))
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    # Для экспорта элемента - группа из середины дерева (путь до корня + поддерево),
+    # для нескольких элементов - несколько групп и компонентов
+    element_group_id = group_ids[len(group_ids) // 2]
+    multiple = [{'id': group_id, 'type': 'ddgroup'} for group_id in group_ids[-3:]]
+    multiple += [{'id': component.id, 'type': 'ddcomponent'} for component in components[:3]]
+
+    return {
+        'groups': groups,
+        'components': len(components),
+        'links': link_count,
+        'element': {'id': element_group_id, 'type': 'ddgroup'},
+        'leaf': group_ids[-1],
+        'multiple': multiple,
+    }
+
+
+def _operation(name: str, tree: Dict):
+    """Функция экспорта для операции бенчмарка"""
+    def export():
+        if name == 'relayout':
+            # Без настройки сброс записей кэша layout ничего не делает
+            with override_settings(EXPORT_LAYOUT_CACHE_ENABLED=True):
+                LayoutCache().invalidate([tree['leaf']])
+                return DrawioExporter(use_layout_cache=True, use_fragment_cache=False).export_dd_groups_to_drawio()
+        exporter = DrawioExporter(use_layout_cache=False, use_fragment_cache=False)
+        if name == 'all':
+            return exporter.export_dd_groups_to_drawio()
+        if name == 'element':
+            return exporter.export_element_to_drawio(tree['element']['id'], tree['element']['type'])
+        return exporter.export_multiple_elements_to_drawio(tree['multiple'])
+    return export
+
+
+def measure(export, repeat: int) -> Dict:
+    """
+    Время - лучшее и медиана из repeat запусков. Число запросов, пиковая
+    память и размер документа - по отдельному запуску под tracemalloc
+    (трассировка замедляет выполнение и в измерение времени не входит).
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        export()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            document = export()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'time_ms': round(min(timings) * 1000, 2),
+        'time_median_ms': round(statistics.median(timings) * 1000, 2),
+        'queries': len(queries),
+        'peak_memory_mb': round(peak / 2 ** 20, 2),
+        'output_bytes': len(document.encode('utf-8')),
+    }
+
+
+def run_suite(shapes=SHAPES, operations=OPERATIONS, groups: int = 2000, components_per_group: int = 3,
+              links_per_group: float = 0.5, repeat: int = 3, seed: int = 0, log=None) -> Dict:
+    """
+    Выполняет бенчмарк для каждой формы дерева и операции.
+    Возвращает результаты в виде, готовом для сохранения в JSON.
+    """
+    results = []
+    for shape in shapes:
+        with transaction.atomic():
+            tree = generate_tree(shape, groups, components_per_group, links_per_group, seed)
+            # Таблица стилей компонентов загружается один раз на процесс - не в измерении
+            get_component_style_resolver()
+            for operation in operations:
+                result = {
+                    'shape': shape,
+                    'operation': operation,
+                    'groups': tree['groups'],
+                    'components': tree['components'],
+                    'links': tree['links'],
+                }
+                result.update(measure(_operation(operation, tree), repeat))
+                results.append(result)
+                if log is not None:
+                    log(result)
+            transaction.set_rollback(True)
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'params': {
+                'groups': groups,
+                'components_per_group': components_per_group,
+                'links_per_group': links_per_group,
+                'repeat': repeat,
+                'seed': seed,
+            },
+        },
+        'results': results,
+    }
+
+
+def compare(results: List[Dict], baseline: List[Dict]) -> List[Dict]:
+    """
+    Сравнивает результаты с предыдущими: отношение новых значений к старым
+    для каждой пары (форма, операция), присутствующей в обоих наборах
+    """
+    previous = {(item['shape'], item['operation']): item for item in baseline}
+    rows = []
+    for item in results:
+        old = previous.get((item['shape'], item['operation']))
+        if old is None:
+            continue
+        row = {'shape': item['shape'], 'operation': item['operation']}
+        for metric in ('time_ms', 'queries', 'peak_memory_mb', 'output_bytes'):
+            row[metric] = round(item[metric] / old[metric], 3) if old[metric] else None
+        rows.append(row)
+    return rows
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
@@ -0,0 +1,97 @@
+"""
+Бенчмарк памяти и времени расчета layout
+
+Запуск из каталога backend:
+
+    python -m architecture.benchmarks.layout
+    python -m architecture.benchmarks.layout --groups 1000 100000 --components 3
+
+Дерево групп и компонентов строится в памяти из несохраненных объектов
+моделей (база данных не нужна). Для каждого размера измеряется время обоих
+проходов расчета layout и пиковый объем памяти (tracemalloc), занятый
+layout всех корневых групп.
+"""
+
+import argparse
+import os
+import time
+import tracemalloc
+
+
+FAN_OUT = 4
+
+
+def build_tree(groups, components_per_group):
+    """
+    Индекс дерева из groups групп (по FAN_OUT детей у каждой группы, две
+    корневые группы) и components_per_group компонентов в каждой группе
+    """
+    from ..export.tree_loader import DdTreeIndex
+    from ..models import DdComponent, DdGroup
+
+    group_objects = []
+    component_objects = []
+    for group_id in range(1, groups + 1):
+        parent_id = None if group_id <= 2 else (group_id - 3) // FAN_OUT + 1
+        group_objects.append(DdGroup(id=group_id, parent_id=parent_id, name=f'group-{group_id}', instances=1))
+        for index in range(components_per_group):
+            component_id = len(component_objects) + 1
+            component_objects.append(DdComponent(
+                id=component_id, group_id=group_id, name=f'component-{component_id}',
+            ))
+    return DdTreeIndex(group_objects, component_objects)
+
+
+def make_exporter(tree):
+    from ..export.drawio_export import DrawioExporter
+    from ..export.styles import ComponentStyleResolver
+
+    exporter = DrawioExporter(use_layout_cache=False, component_styles=ComponentStyleResolver([], {}))
+    exporter.tree = tree
+    return exporter
+
+
+def calculate_layouts(tree):
+    """Layout всех корневых групп (как при экспорте документа целиком)"""
+    exporter = make_exporter(tree)
+    return [exporter._calculate_group_layout(root) for root in tree.get_roots()]
+
+
+def run(sizes, components_per_group):
+    header = f"{'groups':>9} {'nodes':>9} {'time, ms':>10} {'peak, MB':>10} {'bytes/node':>11}"
+    print(header)
+    print('-' * len(header))
+
+    for groups in sizes:
+        tree = build_tree(groups, components_per_group)
+        nodes = groups * (components_per_group + 1)
+
+        started = time.perf_counter()
+        calculate_layouts(tree)
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        layouts = calculate_layouts(tree)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del layouts
+
+        print(f"{groups:>9} {nodes:>9} {elapsed * 1000:>10.1f} {peak / 2 ** 20:>10.1f} {peak / nodes:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк памяти и времени расчета layout')
+    parser.add_argument('--groups', type=int, nargs='+', default=[1000, 20000, 100000],
+                        help='Число групп в синтетических деревьях')
+    parser.add_argument('--components', type=int, default=3, help='Число компонентов в каждой группе')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'c4drawer.settings')
+    import django
+    django.setup()
+
+    run(args.groups, args.components)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Бенчмарк алгоритмов размещения детей группы
+
+Запуск из каталога backend:
+
+    python -m architecture.benchmarks.packing
+    python -m architecture.benchmarks.packing --sizes 10 1000 50000 --repeat 3
+
+Для каждого числа детей генерируется синтетическая группа (компоненты
+стандартных размеров и вложенные группы разного размера) и измеряется время
+упаковки и заполнение области содержимого. Прежний алгоритм строк (полный
+перебор строк для каждого элемента) запускается только для небольших групп.
+"""
+
+import argparse
+import random
+import time
+
+from ..export.packing import PACKERS
+
+
+SPACING = 30
+MAX_ROW_WIDTH = 1200
+
+# Прежний алгоритм квадратичен - на больших группах он работает минутами
+LEGACY_MAX_CHILDREN = 5000
+
+# Размеры компонентов из палитры и типичные размеры вложенных групп
+COMPONENT_SIZES = [(240, 120), (200, 100)]
+GROUP_WIDTHS = [240, 510, 780, 1050, 1320]
+GROUP_HEIGHTS = [120, 230, 380, 530, 800]
+
+
+def make_children(count, seed=0):
+    """Размеры синтетических детей группы: ~80% компонентов и ~20% вложенных групп"""
+    rnd = random.Random(seed)
+    children = []
+    for _ in range(count):
+        if rnd.random() < 0.8:
+            width, height = rnd.choice(COMPONENT_SIZES)
+        else:
+            width, height = rnd.choice(GROUP_WIDTHS), rnd.choice(GROUP_HEIGHTS)
+        children.append((width, height))
+    return children
+
+
+def legacy_first_fit(children, spacing, max_row_width):
+    """Прежний алгоритм строк: перебор всех строк для каждого маленького элемента"""
+    sorted_children = sorted(children, key=lambda size: size[0] * size[1], reverse=True)
+    width_threshold = max(width for width, _ in sorted_children) * 0.6
+    rows = []
+    for child_width, child_height in sorted_children:
+        if child_width >= width_threshold:
+            rows.append({'width': child_width, 'height': child_height, 'is_single': True})
+            continue
+        for row in rows:
+            if not row['is_single'] and row['width'] + spacing + child_width <= max_row_width:
+                row['width'] += spacing + child_width
+                row['height'] = max(row['height'], child_height)
+                break
+        else:
+            rows.append({'width': child_width, 'height': child_height, 'is_single': False})
+    width = max(row['width'] for row in rows)
+    height = sum(row['height'] for row in rows) + spacing * (len(rows) - 1)
+    return None, width, height
+
+
+def measure(packer, children, repeat):
+    """Лучшее время из repeat запусков и размеры результата"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, width, height = packer(children, SPACING, MAX_ROW_WIDTH)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, width, height
+
+
+def run(sizes, repeat):
+    header = f"{'children':>9} {'strategy':>9} {'time, ms':>10} {'width':>7} {'height':>9} {'fill':>6}"
+    print(header)
+    print('-' * len(header))
+
+    for count in sizes:
+        children = make_children(count)
+        area = sum(width * height for width, height in children)
+
+        packers = dict(PACKERS)
+        if count <= LEGACY_MAX_CHILDREN:
+            packers['legacy'] = legacy_first_fit
+
+        for name, packer in packers.items():
+            elapsed, width, height = measure(packer, children, repeat)
+            fill = area / (width * height) if width and height else 0
+            print(f"{count:>9} {name:>9} {elapsed * 1000:>10.2f} {width:>7} {height:>9} {fill:>6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк алгоритмов размещения детей группы')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 50000],
+                        help='Число детей в синтетических группах')
+    parser.add_argument('--repeat', type=int, default=3, help='Число повторов (берется лучшее время)')
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""
+Пакетное создание, изменение и удаление объектов API
+
+Все объекты пакета проверяются до записи: поля моделей - в памяти, ссылки
+на другие таблицы - одним запросом на таблицу. Если хотя бы один объект
+некорректен, ничего не записывается и возвращаются ошибки по индексам
+объектов. Иначе пакет пишется bulk_create/bulk_update в одной транзакции.
+bulk_create и bulk_update не вызывают сигналы, удаление пакета тоже
+выполняется без них, поэтому версии кэша и layout обновляются здесь так
+же, как это сделали бы сигналы, но один раз на пакет.
+"""
+
+from typing import List, Optional
+
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.db.models.deletion import Collector
+
+from .export.cache import bump_model_version, bump_table_version
+from .export.layout_cache import LayoutCache
+from .models import DdComponent, DdGroup
+from .signals import EXPORT_DEPENDENT_MODELS
+
+
+BULK_BATCH_SIZE = 1000
+
+# Поле родительской группы DD: при его изменении сбрасывается layout веток
+LAYOUT_GROUP_FIELDS = {
+    DdGroup: 'parent_id',
+    DdComponent: 'group_id',
+}
+
+
+class BulkValidationError(Exception):
+    """Пакет не записан: ошибки [{"index", "field", "detail"}] по объектам"""
+
+    def __init__(self, errors: List[dict]):
+        super().__init__(f"Ошибок в пакете: {len(errors)}")
+        self.errors = errors
+
+    def as_dict(self) -> dict:
+        return {"detail": str(self), "errors": self.errors}
+
+
+def _error(index: int, field: Optional[str], detail: str) -> dict:
+    return {"index": index, "field": field, "detail": detail}
+
+
+def _not_found(model, pk) -> str:
+    return f"Объект «{model._meta.verbose_name}» с ID {pk} не найден"
+
+
+def bulk_create(model, items: List[dict]) -> List[int]:
+    """
+    Создает объекты model из словарей полей items и возвращает их ID
+    в порядке items. Выбрасывает BulkValidationError.
+    """
+    objects = [model(**item) for item in items]
+    errors = _check_references(model, items)
+    errors.extend(_check_fields(model, objects))
+    if errors:
+        raise BulkValidationError(sorted(errors, key=lambda error: error['index']))
+
+    with transaction.atomic():
+        objects = _bulk_create(model, objects)
+        _notify([model], _layout_groups(model, objects))
+    return [item.pk for item in objects]
+
+
+def bulk_update(model, items: List[dict]) -> List[int]:
+    """
+    Изменяет объекты model: каждый словарь items содержит id и только
+    изменяемые поля. Возвращает ID в порядке items. Выбрасывает BulkValidationError.
+    """
+    errors = []
+    seen = set()
+    for index, item in enumerate(items):
+        if item['id'] in seen:
+            errors.append(_error(index, 'id', f"ID {item['id']} повторяется в пакете"))
+        seen.add(item['id'])
+        if model is DdGroup and item.get('parent_id') is not None and item['parent_id'] == item['id']:
+            errors.append(_error(index, 'parent_id', "Группа не может быть родителем самой себя"))
+    errors.extend(_check_references(model, items))
+    errors_by_index = {error['index'] for error in errors}
+
+    with transaction.atomic():
+        existing = model.objects.select_for_update().in_bulk(seen)
+        objects = []
+        previous_groups = _layout_groups(model, existing.values())
+        fields = set()
+        for index, item in enumerate(items):
+            instance = existing.get(item['id'])
+            if instance is None:
+                errors.append(_error(index, 'id', _not_found(model, item['id'])))
+                continue
+            for attr, value in item.items():
+                if attr != 'id':
+                    setattr(instance, attr, value)
+                    fields.add(attr)
+            objects.append((index, instance))
+        errors.extend(_check_fields(model, [instance for _, instance in objects], [index for index, _ in objects]))
+        if model is DdGroup:
+            errors.extend(_check_group_cycles(items, errors_by_index))
+        if errors:
+            raise BulkValidationError(sorted(errors, key=lambda error: error['index']))
+
+        instances = [instance for _, instance in objects]
+        if fields and instances:
+            model.objects.bulk_update(instances, sorted(fields), batch_size=BULK_BATCH_SIZE)
+            group_ids = previous_groups | _layout_groups(model, instances)
+            if model is DdGroup:
+                group_ids.update(instance.pk for instance in instances)
+            _notify([model], group_ids)
+    return [item['id'] for item in items]
+
+
+def bulk_delete(model, ids: List[int]) -> List[int]:
+    """
+    Удаляет объекты model по ID (вместе с зависимыми объектами) и возвращает
+    удаленные ID. Выбрасывает BulkValidationError, если какой-то объект не найден.
+
+    Зависимые объекты собираются Collector так же, как в QuerySet.delete(),
+    но удаляются без сигналов: по одному DELETE на таблицу, а версии и
+    layout обновляются один раз на пакет. Число запросов зависит от числа
+    таблиц и глубины каскада, но не от числа объектов.
+    """
+    using = router.db_for_write(model)
+    with transaction.atomic(using=using):
+        existing = set(model.objects.select_for_update().filter(pk__in=ids).values_list('pk', flat=True))
+        errors = [
+            _error(index, 'id', _not_found(model, pk))
+            for index, pk in enumerate(ids) if pk not in existing
+        ]
+        if errors:
+            raise BulkValidationError(errors)
+
+        collector = Collector(using=using)
+        collector.collect(model.objects.filter(pk__in=existing))
+        if collector.field_updates:
+            # SET_NULL и подобные обработчики обновляют объекты по одному - удаляем как обычно
+            model.objects.filter(pk__in=existing).delete()
+            return list(dict.fromkeys(ids))
+
+        collector.sort()
+        deleted = {}
+        layout_group_ids = set()
+        for deleted_model, instances in collector.data.items():
+            deleted[deleted_model] = [instance.pk for instance in instances]
+            layout_group_ids |= _layout_groups(deleted_model, instances)
+        for queryset in collector.fast_deletes:
+            deleted.setdefault(queryset.model, [])
+            queryset._raw_delete(using)
+        for deleted_model, pks in deleted.items():
+            for start in range(0, len(pks), BULK_BATCH_SIZE):
+                deleted_model._base_manager.using(using).filter(
+                    pk__in=pks[start:start + BULK_BATCH_SIZE]
+                )._raw_delete(using)
+        _notify(list(deleted), layout_group_ids)
+    return list(dict.fromkeys(ids))
+
+
+def _check_group_cycles(items: List[dict], skip_indexes: set) -> List[dict]:
+    """
+    Переносы групп DD, замыкающие parent в цикл. Новые родители проверяются
+    вместе с их предками (один запрос) с учетом переносов всего пакета, поэтому
+    находятся и перенос под собственного потомка, и циклы внутри пакета (A -> B, B -> A).
+    """
+    moves = {
+        item['id']: item['parent_id'] for index, item in enumerate(items)
+        if 'parent_id' in item and index not in skip_indexes
+    }
+    new_parent_ids = {parent_id for parent_id in moves.values() if parent_id is not None}
+    if not new_parent_ids:
+        return []
+    parents = dict(DdGroup.objects.ancestors(new_parent_ids, include_self=True).values_list('id', 'parent_id'))
+    parents.update(moves)
+
+    errors = []
+    for index, item in enumerate(items):
+        if index in skip_indexes or item.get('parent_id') is None:
+            continue
+        visited = set()
+        node_id = item['parent_id']
+        while node_id is not None and node_id not in visited:
+            if node_id == item['id']:
+                errors.append(_error(index, 'parent_id', "Группа не может быть вложена в собственного потомка"))
+                break
+            visited.add(node_id)
+            node_id = parents.get(node_id)
+    return errors
+
+
+def _check_references(model, items: List[dict]) -> List[dict]:
+    """Ссылки на другие таблицы: один запрос на каждую таблицу"""
+    errors = []
+    for field in model._meta.concrete_fields:
+        if not field.is_relation:
+            continue
+        values = {item[field.attname] for item in items if item.get(field.attname) is not None}
+        existing = set()
+        if values:
+            existing = set(field.related_model._base_manager.filter(pk__in=values).values_list('pk', flat=True))
+        for index, item in enumerate(items):
+            if field.attname not in item:
+                continue
+            value = item[field.attname]
+            if value is None:
+                if not field.null:
+                    errors.append(_error(index, field.attname, "Поле не может быть пустым"))
+            elif value not in existing:
+                errors.append(_error(index, field.attname, _not_found(field.related_model, value)))
+    return errors
+
+
+def _check_fields(model, objects, indexes: Optional[List[int]] = None) -> List[dict]:
+    """Проверка полей без обращений к базе данных (ссылки проверяет _check_references)"""
+    relations = [field.name for field in model._meta.concrete_fields if field.is_relation]
+    errors = []
+    for position, instance in enumerate(objects):
+        try:
+            instance.clean_fields(exclude=relations)
+        except ValidationError as e:
+            index = indexes[position] if indexes is not None else position
+            for field, messages in e.message_dict.items():
+                errors.extend(_error(index, field, message) for message in messages)
+    return errors
+
+
+def _bulk_create(model, objects: List):
+    """
+    bulk_create с получением первичных ключей. Если бэкенд их не возвращает
+    (PostgreSQL и SQLite 3.35+ возвращают), объекты сохраняются по одному.
+    """
+    if connections[router.db_for_write(model)].features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objects, batch_size=BULK_BATCH_SIZE)
+    for item in objects:
+        item.save(force_insert=True)
+    return objects
+
+
+def _layout_groups(model, objects) -> set:
+    """Группы DD, layout которых зависит от объектов"""
+    field = LAYOUT_GROUP_FIELDS.get(model)
+    if field is None:
+        return set()
+    return {getattr(instance, field) for instance in objects}
+
+
+def _notify(models: List, layout_group_ids) -> None:
+    """То же, что сделали бы сигналы post_save/post_delete для каждого объекта пакета"""
+    for model in models:
+        bump_table_version(model._meta.db_table)
+    if any(model in EXPORT_DEPENDENT_MODELS for model in models):
+        bump_model_version()
+    if layout_group_ids:
+        LayoutCache().invalidate(layout_group_ids)
@@ -0,0 +1,120 @@
+"""
+Условные запросы (ETag, Last-Modified) для эндпоинтов API
+
+Валидаторы строятся из версий таблиц, которые хранятся в таблице
+CacheVersion (общей для всех процессов) и увеличиваются сигналами после
+фиксации транзакции, поэтому ответ 304 отдается после одного запроса
+версий, без чтения самих данных и без экспорта.
+"""
+
+import hashlib
+import inspect
+import time
+from functools import wraps
+from typing import Optional
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, quote_etag
+
+from .export.cache import get_table_versions
+
+
+# Клиент должен проверять актуальность данных при каждом обращении
+CACHE_CONTROL = 'no-cache'
+# Суффикс ETag сжатого представления: у gzip и несжатого ответа разные байты
+GZIP_ETAG_SUFFIX = '-gzip'
+
+
+def conditional(*models):
+    """
+    Декоратор операции ninja со списком объектов моделей models.
+
+    ETag - хэш пути запроса (с параметрами) и версий таблиц моделей,
+    Last-Modified - время последнего изменения этих таблиц (см. _last_modified). Если
+    If-None-Match или If-Modified-Since совпадают, возвращается 304
+    до вызова операции, иначе заголовки добавляются к ее ответу.
+    """
+    tables = [model._meta.db_table for model in models]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, response: HttpResponse, **kwargs):
+            state = get_table_versions(tables)
+            versions = sorted((table, version) for table, (version, _) in state.items())
+            etag = quote_etag(hashlib.sha1(
+                f'{request.path}?{request.GET.urlencode()}|{versions}'.encode('utf-8')
+            ).hexdigest())
+            last_modified = _last_modified(max(modified for _, modified in state.values()))
+
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                _set_validators(not_modified, etag, last_modified)
+                return not_modified
+
+            _set_validators(response, etag, last_modified)
+            return view(request, *args, **kwargs)
+
+        # ninja передает временный ответ (для заголовков) в параметр с аннотацией HttpResponse
+        signature = inspect.signature(view)
+        wrapper.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter('response', inspect.Parameter.KEYWORD_ONLY, annotation=HttpResponse),
+        ])
+        return wrapper
+
+    return decorator
+
+
+def _last_modified(modified: float) -> Optional[int]:
+    """
+    Last-Modified в целых секундах: начало секунды, следующей за последним
+    изменением. Пока она не наступила, в ту же секунду могут попасть новые
+    записи, и If-Modified-Since не отличил бы их от уже отданных данных -
+    такое значение не отдается и не проверяется (остается ETag).
+    """
+    last_modified = int(modified) + 1
+    if last_modified > time.time():
+        return None
+    return last_modified
+
+
+def _set_validators(response, etag: str, last_modified: Optional[int]) -> None:
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = CACHE_CONTROL
+
+
+def etag_matches(request, etag: str) -> bool:
+    """
+    Совпадает ли If-None-Match с ETag документа в любом представлении
+    (несжатом или gzip)
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    client_etags = parse_etags(header)
+    if '*' in client_etags:
+        return True
+    return any(tag in client_etags for tag in (quote_etag(etag), quote_etag(etag + GZIP_ETAG_SUFFIX)))
+
+
+def document_not_modified(etag: str) -> HttpResponseNotModified:
+    """Ответ 304 для документа экспорта"""
+    response = HttpResponseNotModified()
+    response['ETag'] = quote_etag(etag)
+    response['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def set_document_etag(response, etag: str):
+    """
+    Устанавливает сильный ETag документа экспорта после выбора кодировки:
+    у сжатого ответа ETag с суффиксом -gzip (GZipMiddleware сделал бы его слабым)
+    """
+    if response.get('Content-Encoding') == 'gzip':
+        etag += GZIP_ETAG_SUFFIX
+    response['ETag'] = quote_etag(etag)
+    response['Cache-Control'] = CACHE_CONTROL
+    return response
@@ -0,0 +1,128 @@
+"""
+Модуль для экспорта дерева C2Group (диаграмма контейнеров) в формат drawio
+"""
+
+from typing import Iterable
+
+from .drawio_export import DrawioExporter
+from .layout import COMPONENT
+from .palette import DrawioPalette
+from .tree_loader import C2TreeIndex
+
+
+class C2DrawioExporter(DrawioExporter):
+    """
+    Экспорт дерева C2Group/C2Component в формат drawio.
+
+    Загрузка дерева, расчет layout и сериализация ячеек - общие с DrawioExporter.
+    Отличаются стили групп и внешних компонентов и связи: связи C2 соединяют
+    компоненты и подписываются названием, технологией, форматом и
+    информационными объектами.
+    """
+
+    tree_class = C2TreeIndex
+    group_element_type = 'c2group'
+    component_element_type = 'c2component'
+    group_style_name = 'c2_group'
+    collapsed_group_style_name = 'c2_group_collapsed'
+    link_style_name = 'c2_link'
+    link_endpoint_type = COMPONENT
+    group_cell_prefix = 'c2g'
+    component_cell_prefix = 'c2c'
+    link_cell_prefix = 'c2l'
+
+    def __init__(self, compressed=False, **kwargs):
+        # Персистентный кэш layout и его инвалидация сигналами ведутся по ID групп DD
+        kwargs['use_layout_cache'] = False
+        super().__init__(compressed, **kwargs)
+        self.external_component_style = DrawioPalette.get_style('c2_component_external')
+        self._component_groups = None
+        self._standalone_component_ids = ()
+
+    def _load_tree(self, root_ids=None):
+        tree = super()._load_tree(root_ids)
+        tree.extra_component_ids = self._standalone_component_ids
+        return tree
+
+    def export_multiple_elements_to_drawio(self, elements):
+        """
+        Экспортирует несколько элементов C2 (см. DrawioExporter). Связи
+        компонентов, выбранных отдельно от своих групп, тоже попадают на диаграмму.
+        """
+        self._standalone_component_ids = [
+            element_info['id'] for element_info in elements if element_info['type'] == self.component_element_type
+        ]
+        return super().export_multiple_elements_to_drawio(elements)
+
+    def _component_style(self, component):
+        """Внешние компоненты выделяются отдельным стилем того же размера"""
+        if component.is_external:
+            return self.external_component_style
+        return super()._component_style(component)
+
+    def _group_cell_args(self, group_info) -> tuple:
+        """Ячейка группы C2: название и тип группы"""
+        group = group_info.element
+        style, specifications = self._group_style(group, group.type.name if group.type else 'Unknown Type')
+        return (
+            style,
+            group_info.id,
+            group_info.parent,
+            group_info.x,
+            group_info.y,
+            group_info.width,
+            group_info.height,
+            group.name or 'Unknown',
+            '1',
+            specifications,
+        )
+
+    def _link_ends(self, link):
+        return link.component_from_id, link.component_to_id
+
+    def _link_groups(self, link):
+        if self._component_groups is None:
+            self._component_groups = self.tree.get_component_groups()
+        return self._component_groups.get(link.component_from_id), self._component_groups.get(link.component_to_id)
+
+    def _create_link_cell(self, link, link_id, source_id, target_id) -> str:
+        """Создает XML ячейку связи C2"""
+        return self.serializer.link_cell(self.link_style, link_id, source_id, target_id, get_c2_link_label(link))
+
+
+# Экспортер для каждого типа элемента API
+EXPORTER_CLASSES = {
+    'ddgroup': DrawioExporter,
+    'ddcomponent': DrawioExporter,
+    'c2group': C2DrawioExporter,
+    'c2component': C2DrawioExporter,
+}
+ELEMENT_TYPES = tuple(EXPORTER_CLASSES)
+
+
+def get_exporter_class(element_types: Iterable[str]):
+    """
+    Возвращает класс экспортера для типов элементов одного документа.
+    Элементы DD и C2 на одной диаграмме не размещаются - ValueError.
+    """
+    classes = {EXPORTER_CLASSES[element_type] for element_type in element_types}
+    if len(classes) > 1:
+        raise ValueError("Элементы DD и C2 нельзя экспортировать в один документ")
+    return classes.pop() if classes else DrawioExporter
+
+
+def get_c2_link_label(link) -> str:
+    """
+    Подпись связи C2: название, технология и формат, информационные объекты,
+    например 'Заказы [REST, JSON]: Заказ (чтение), Клиент (запись)'
+    """
+    parts = [link.name] if link.name else []
+    details = ', '.join(value for value in (link.technology, link.format) if value)
+    if details:
+        parts.append(f'[{details}]')
+    label = ' '.join(parts)
+
+    if link.info_objects:
+        info_objects = ', '.join(f'{name} ({operation_type})' for name, operation_type in link.info_objects)
+        label = f'{label}: {info_objects}' if label else info_objects
+    return label
@@ -0,0 +1,223 @@
+"""
+Кэш готовых drawio документов с версионированием модели
+"""
+
+import hashlib
+import json
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+
+from ..models import CacheVersion
+
+
+# Версии хранятся в таблице CacheVersion: их должны видеть все процессы,
+# а кэш 'default' у каждого процесса свой (LocMemCache)
+MODEL_VERSION_KEY = 'architecture:model_version'
+
+# Версии отдельных таблиц (ETag и Last-Modified списков)
+TABLE_VERSION_KEY = 'architecture:table_version:{}'
+
+# Счетчики попаданий/промахов - статистика процесса в кэше 'default'
+HITS_KEY = 'drawio_export:hits'
+MISSES_KEY = 'drawio_export:misses'
+
+
+def _state_cache():
+    return caches['default']
+
+
+def _initial_version() -> int:
+    """
+    Начальная версия - текущее время в миллисекундах. Если строка версии
+    удалена, новая версия не совпадет ни с одной из ранее выданных
+    и устаревшие документы не будут отданы.
+    """
+    return int(time.time() * 1000)
+
+
+def get_versions(keys: Iterable[str]) -> Dict[str, Tuple[int, float]]:
+    """
+    Текущие версии и время их изменения {ключ: (версия, timestamp)} одним
+    запросом. Отсутствующие версии создаются; время их изменения - текущее,
+    то есть клиенты получат данные заново, а не устаревший 304.
+    """
+    keys = list(keys)
+    found = {
+        key: (value, modified)
+        for key, value, modified in CacheVersion.objects.filter(key__in=keys).values_list('key', 'value', 'modified')
+    }
+    for key in keys:
+        if key not in found:
+            row, _ = CacheVersion.objects.get_or_create(
+                key=key, defaults={'value': _initial_version(), 'modified': time.time()}
+            )
+            found[key] = (row.value, row.modified)
+    return found
+
+
+def get_version(key: str) -> int:
+    """Текущее значение счетчика версии (один запрос к базе данных)"""
+    return get_versions([key])[key][0]
+
+
+def bump_version(key: str) -> None:
+    """
+    Увеличивает счетчик версии после фиксации текущей транзакции: до нее
+    другие процессы еще видят прежние данные и не должны кэшировать их
+    под новой версией
+    """
+    transaction.on_commit(lambda: _bump_version(key))
+
+
+def _bump_version(key: str) -> None:
+    updated = CacheVersion.objects.filter(key=key).update(value=F('value') + 1, modified=time.time())
+    if not updated:
+        # Версия еще не создана - начальное значение больше всех выданных ранее
+        get_version(key)
+
+
+def get_model_version() -> int:
+    """Текущая версия модели"""
+    return get_version(MODEL_VERSION_KEY)
+
+
+def bump_model_version() -> None:
+    """Увеличивает версию модели, делая недействительными все закэшированные документы"""
+    bump_version(MODEL_VERSION_KEY)
+
+
+def get_table_versions(tables: Iterable[str]) -> Dict[str, Tuple[int, float]]:
+    """Текущие версии таблиц и время их изменения {таблица: (версия, timestamp)} одним запросом"""
+    keys = {TABLE_VERSION_KEY.format(table): table for table in tables}
+    return {keys[key]: state for key, state in get_versions(keys).items()}
+
+
+def bump_table_version(table: str) -> None:
+    """Увеличивает версию таблицы и запоминает время изменения"""
+    bump_version(TABLE_VERSION_KEY.format(table))
+
+
+class ExportCache:
+    """
+    Кэш отрендеренных drawio документов.
+
+    Ключ - (вид экспорта, параметры, версия модели). Версия увеличивается
+    сигналами при любом изменении моделей, влияющих на экспорт, поэтому
+    явная инвалидация документов не нужна: старые ключи просто перестают
+    запрашиваться и вытесняются бэкендом кэша (MAX_ENTRIES).
+    """
+
+    def __init__(self, alias: Optional[str] = None):
+        self.alias = alias or getattr(settings, 'EXPORT_CACHE_ALIAS', 'export')
+        self.timeout = getattr(settings, 'EXPORT_CACHE_TIMEOUT', 3600)
+        self.max_document_size = getattr(settings, 'EXPORT_CACHE_MAX_DOCUMENT_SIZE', 50 * 1024 * 1024)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, kind: str, params, version: Optional[int] = None) -> str:
+        """Строит ключ кэша для вида экспорта и его параметров"""
+        if version is None:
+            version = get_model_version()
+        params_hash = hashlib.sha1(
+            json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        return f'drawio_export:{kind}:{version}:{params_hash}'
+
+    def make_etag(self, kind: str, params, version: Optional[int] = None) -> str:
+        """
+        ETag документа: меняется вместе с ключом кэша, то есть при изменении
+        параметров или версии модели. Вычисляется без экспортера.
+        """
+        return hashlib.sha1(self.make_key(kind, params, version).encode('utf-8')).hexdigest()
+
+    def get(self, kind: str, params, version: Optional[int] = None) -> Optional[str]:
+        """Возвращает документ из кэша или None, обновляя счетчики попаданий/промахов"""
+        content = self.cache.get(self.make_key(kind, params, version))
+        self._incr(HITS_KEY if content is not None else MISSES_KEY)
+        return content
+
+    def set(self, kind: str, params, content: str, version: Optional[int] = None) -> bool:
+        """
+        Сохраняет документ в кэш. Документы больше EXPORT_CACHE_MAX_DOCUMENT_SIZE
+        не кэшируются. Версию нужно передавать ту, что была до рендеринга,
+        иначе документ, построенный во время записи в модель, попадет
+        под новую версию.
+        """
+        if len(content) > self.max_document_size:
+            return False
+        self.cache.set(self.make_key(kind, params, version), content, self.timeout)
+        return True
+
+    def get_or_render(self, kind: str, params, render: Callable[[], str], version: Optional[int] = None):
+        """
+        Возвращает (content, hit). При промахе вызывает render() и кэширует результат.
+        version - версия модели, прочитанная до рендеринга (по умолчанию - текущая).
+        """
+        if version is None:
+            version = get_model_version()
+        content = self.get(kind, params, version)
+        if content is not None:
+            return content, True
+
+        content = render()
+        self.set(kind, params, content, version)
+        return content, False
+
+    def cache_stream(self, kind: str, params, chunks: Iterable[str], version: Optional[int] = None) -> Iterator[str]:
+        """
+        Пропускает части потокового документа дальше и, если документ
+        уложился в EXPORT_CACHE_MAX_DOCUMENT_SIZE, кэширует его целиком после
+        отдачи последней части. Буфер сбрасывается, как только размер превышен,
+        поэтому большие документы не удерживаются в памяти. Если chunks
+        выбрасывает исключение или поток закрывается раньше (клиент отключился),
+        незавершенный документ не кэшируется.
+        """
+        if version is None:
+            version = get_model_version()
+        parts = []
+        size = 0
+        cacheable = True
+
+        for chunk in chunks:
+            if cacheable:
+                size += len(chunk)
+                if size > self.max_document_size:
+                    cacheable = False
+                    parts = []
+                else:
+                    parts.append(chunk)
+            yield chunk
+
+        if cacheable:
+            self.set(kind, params, ''.join(parts), version)
+
+    def stats(self) -> dict:
+        """Счетчики попаданий/промахов и текущая версия модели"""
+        state = _state_cache()
+        hits = state.get(HITS_KEY, 0)
+        misses = state.get(MISSES_KEY, 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else 0.0,
+            'model_version': get_model_version(),
+        }
+
+    def _incr(self, key: str) -> None:
+        state = _state_cache()
+        try:
+            state.incr(key)
+        except ValueError:
+            if not state.add(key, 1, timeout=None):
+                state.incr(key)
+
+
+export_cache = ExportCache()
@@ -0,0 +1,30 @@
+"""
+Сжатие содержимого диаграмм в формате draw.io
+
+Draw.io хранит сжатую диаграмму как текст элемента <diagram>:
+base64(raw deflate(encodeURIComponent(<mxGraphModel>...</mxGraphModel>)))
+"""
+
+import base64
+import zlib
+from urllib.parse import quote, unquote
+
+
+# Символы, которые encodeURIComponent в JavaScript не экранирует
+_URI_COMPONENT_SAFE = "-_.!~*'()"
+
+
+def compress_diagram(xml: str) -> str:
+    """Сжимает XML модели графа в формат draw.io"""
+    encoded = quote(xml, safe=_URI_COMPONENT_SAFE).encode('ascii')
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(encoded) + compressor.flush()
+    return base64.b64encode(deflated).decode('ascii')
+
+
+def decompress_diagram(data: str) -> str:
+    """Распаковывает сжатую диаграмму draw.io обратно в XML модели графа"""
+    deflated = base64.b64decode(data.strip())
+    encoded = zlib.decompress(deflated, -zlib.MAX_WBITS)
+    return unquote(encoded.decode('ascii'))
+
@@ -2,72 +2,212 @@
 Модуль для экспорта данных дерева DdGroup в формат drawio (XML)
 """
 
+import hashlib
+import multiprocessing
 import xml.etree.ElementTree as ET
-from typing import List, Dict, Tuple
-from ..models import DdGroup, DdComponent
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import Dict, List, NamedTuple
+
+from django.conf import settings
+
+from .compression import compress_diagram
+from .fragment_cache import FragmentCache
+from .layout import COMPONENT, GROUP, GridPlacement, LayoutNode, PackedPlacement, SizeNode
+from .layout_cache import LayoutCache, child_key
+from .packing import DEFAULT_PACKING_STRATEGY, PACKERS, PACKING_GRID, PACKING_STRATEGIES
 from .palette import DrawioPalette
+from .serializers import get_cell_serializer
+from .styles import get_component_style_resolver
+from .tree_loader import DdTreeIndex, HierarchyCycleError
+from .worker import calculate_root_layout, init_worker_process
+
+
+# Размер части документа при потоковом экспорте (в символах)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Базовая ячейка-слой, родитель ячеек верхнего уровня
+ROOT_CELL_ID = '1'
+
+# Многостраничный экспорт: страница содержания и отступ ее пунктов на уровень вложенности
+TOC_PAGE_ID = 'toc'
+TOC_PAGE_NAME = 'Содержание'
+TOC_INDENT = 30
+
+
+class DrawioPage(NamedTuple):
+    """
+    Страница многостраничного документа: группа и ее поддерево
+    (или только компоненты группы, если подгруппы вынесены на свои страницы)
+    """
+    diagram_id: str
+    name: str
+    depth: int
+    group: object
+    components_only: bool
 
 
 class DrawioExporter:
     """Класс для экспорта дерева DdGroup в формат drawio"""
     
-    def __init__(self):
-        self.cell_id_counter = 2  # Начинаем с 2, так как 0 и 1 зарезервированы
-        self.current_id = 2  # Для нового алгоритма
+    # Индекс дерева, типы элементов API и стили палитры (см. C2DrawioExporter)
+    tree_class = DdTreeIndex
+    group_element_type = 'ddgroup'
+    component_element_type = 'ddcomponent'
+    group_style_name = 'dd_group'
+    collapsed_group_style_name = 'dd_group_collapsed'
+    link_style_name = 'dd_link'
+    # Тип элементов, которые соединяют связи
+    link_endpoint_type = GROUP
+    # Префиксы ID ячеек: ID ячейки - префикс и первичный ключ элемента, например ddg-42
+    group_cell_prefix = 'ddg'
+    component_cell_prefix = 'ddc'
+    link_cell_prefix = 'ddl'
+    
+    def __init__(self, compressed=False, use_layout_cache=None, layout_processes=None,
+                 packing=DEFAULT_PACKING_STRATEGY, max_row_width=None, include_links=True,
+                 component_styles=None, serializer=None, max_depth=None, collapse_threshold=None,
+                 use_fragment_cache=None, progress=None):
+        """
+        Args:
+            compressed: сохранять содержимое диаграмм в сжатом виде
+                        (deflate + base64, как это делает draw.io)
+            use_layout_cache: использовать персистентный кэш layout групп.
+                              По умолчанию - настройка EXPORT_LAYOUT_CACHE_ENABLED.
+            layout_processes: число процессов для параллельного расчета layout
+                              корневых групп (1 - последовательно).
+                              По умолчанию - настройка EXPORT_LAYOUT_PROCESSES.
+            packing: стратегия размещения детей групп - grid, shelf или skyline
+            max_row_width: максимальная ширина строки маленьких элементов
+                           при упаковке (по умолчанию - из палитры)
+            include_links: добавлять на диаграмму связи DD между экспортируемыми группами
+            component_styles: таблица стилей компонентов (ComponentStyleResolver).
+                              По умолчанию - таблица процесса, загружается при первом обращении.
+            serializer: сериализатор ячеек - elementtree или template.
+                        По умолчанию - настройка EXPORT_CELL_SERIALIZER.
+            max_depth: глубина, ниже которой группы не загружаются (экспортируемые
+                       группы - глубина 0). Группы на этой глубине с содержимым
+                       заменяются ячейкой со сводкой по поддереву.
+            collapse_threshold: заменять ячейкой со сводкой вложенные группы, в поддереве
+                                которых больше указанного числа групп и компонентов
+            use_fragment_cache: брать XML неизмененных поддеревьев групп из кэша фрагментов.
+                                По умолчанию - настройка EXPORT_FRAGMENT_CACHE_ENABLED.
+            progress: функция progress(done, total), вызываемая после вывода каждой
+                      корневой группы, страницы или элемента (прогресс заданий экспорта)
+        """
+        if packing not in PACKING_STRATEGIES:
+            raise ValueError(
+                f"Неподдерживаемая стратегия размещения: {packing}. Используйте: {', '.join(PACKING_STRATEGIES)}"
+            )
+        if max_depth is not None and max_depth < 0:
+            raise ValueError("max_depth не может быть отрицательным")
+        if collapse_threshold is not None and collapse_threshold < 0:
+            raise ValueError("collapse_threshold не может быть отрицательным")
+        self.max_depth = max_depth
+        self.collapse_threshold = collapse_threshold
+        self.compressed = compressed
+        self.packing = packing
+        self.include_links = include_links
+        self.progress = progress
+        self._component_styles = component_styles
+        self.serializer = get_cell_serializer(serializer)
+        if layout_processes is None:
+            layout_processes = getattr(settings, 'EXPORT_LAYOUT_PROCESSES', 1)
+        self.layout_processes = layout_processes
         
         # Получаем настройки из палитры
-        self.dd_group_style = DrawioPalette.get_style('dd_group')
+        self.group_style = DrawioPalette.get_style(self.group_style_name)
+        self.collapsed_group_style = DrawioPalette.get_style(self.collapsed_group_style_name)
+        self.link_style = DrawioPalette.get_style(self.link_style_name)
         self.spacing = DrawioPalette.get_default_spacing()
         
         # Устанавливаем размеры и отступы из палитры
-        self.base_width = self.dd_group_style.width
-        self.base_height = self.dd_group_style.height
-        self.padding = self.dd_group_style.padding
-        self.min_child_spacing = self.dd_group_style.min_spacing
-        self.header_height = self.dd_group_style.header_height
+        self.base_width = self.group_style.width
+        self.base_height = self.group_style.height
+        self.padding = self.group_style.padding
+        self.min_child_spacing = self.group_style.min_spacing
+        self.header_height = self.group_style.header_height
         self.group_spacing = self.spacing['group_spacing']
+        self.max_row_width = max_row_width or self.spacing['max_row_width']
+        
+        # Индекс дерева в памяти, загружается один раз на экспорт
+        self.tree = None
+        # ID ячеек концов связей на диаграмме {ID группы (у C2 - компонента): cell_id}
+        self._endpoint_cells = {}
+        
+        # Кэш layout групп: записи загружаются вместе с деревом,
+        # новые записи сохраняются после расчета каждой корневой группы
+        if use_layout_cache is None:
+            use_layout_cache = getattr(settings, 'EXPORT_LAYOUT_CACHE_ENABLED', False)
+        if max_depth is not None or collapse_threshold is not None:
+            # Размер свернутой группы не совпадает с полным - такие записи кэшу не нужны
+            use_layout_cache = False
+        self.layout_cache = LayoutCache(config=self._layout_config()) if use_layout_cache else None
+        self._layout_entries = {}
+        self._new_layout_entries = {}
+        self.layout_stats = {'computed': 0, 'reused': 0}
+        
+        # Кэш XML поддеревьев групп по хэшу содержимого
+        if use_fragment_cache is None:
+            use_fragment_cache = getattr(settings, 'EXPORT_FRAGMENT_CACHE_ENABLED', False)
+        self.fragment_cache = FragmentCache(self.serializer.name) if use_fragment_cache else None
+        self.fragment_stats = {'reused': 0, 'serialized': 0}
+        self._style_digests = {}
+    
+    def _layout_config(self):
+        """Параметры, от которых зависят размеры и размещение элементов"""
+        return {
+            'base_width': self.base_width,
+            'base_height': self.base_height,
+            'padding': self.padding,
+            'min_child_spacing': self.min_child_spacing,
+            'header_height': self.header_height,
+            'packing': self.packing,
+            'max_row_width': self.max_row_width,
+        }
+    
+    def _layout_options(self):
+        """Параметры конструктора для расчета layout в другом процессе"""
+        return {
+            'use_layout_cache': self.layout_cache is not None,
+            'packing': self.packing,
+            'max_row_width': self.max_row_width,
+            'component_styles': self.component_styles,
+        }
+    
+    @property
+    def component_styles(self):
+        """Таблица стилей компонентов ComponentType.id -> ElementStyle"""
+        if self._component_styles is None:
+            self._component_styles = get_component_style_resolver()
+        return self._component_styles
+    
+    def _load_tree(self, root_ids=None):
+        """
+        Загружает дерево групп и компонентов фиксированным числом запросов
+        """
+        self.tree = self.tree_class.load(root_ids, self.max_depth, self.collapse_threshold)
+        if self.layout_cache is not None:
+            self._layout_entries = self.layout_cache.get_many(self.tree.groups)
+        return self.tree
     
     def _get_group_children(self, group):
         """
         Получает всех детей группы: подгруппы и компоненты
         Возвращает список объектов с указанием типа
         """
-        children = []
-        
-        # Добавляем подгруппы
-        subgroups = list(DdGroup.objects.filter(parent=group))
-        for subgroup in subgroups:
-            children.append({
-                'type': 'group',
-                'object': subgroup
-            })
-        
-        # Добавляем компоненты
-        components = list(DdComponent.objects.filter(group=group))
-        for component in components:
-            children.append({
-                'type': 'component', 
-                'object': component
-            })
-        
-        return children
+        if self.tree is None:
+            self._load_tree([group.id])
+        return self.tree.get_children(group)
     
     def _get_path_to_root(self, group):
         """
         Получает полный путь от корня до указанной группы
         Возвращает список групп от корня до указанной группы (включительно)
         """
-        path = []
-        current = group
-        
-        # Идем вверх по дереву до корня
-        while current is not None:
-            path.append(current)
-            current = current.parent
-        
-        # Переворачиваем, чтобы путь был от корня к группе
-        path.reverse()
-        return path
+        if self.tree is None:
+            self._load_tree([group.id])
+        return self.tree.get_path_to_root(group)
     
     def _build_tree_with_parents(self, target_group):
         """
@@ -112,50 +252,416 @@ class DrawioExporter:
         """
         Экспортирует архитектуру в формат Draw.io
         """
+        root_groups = self._resolve_root_groups(root_group_id)
+        return self._build_document(root_groups)
+    
+    def _build_document(self, root_groups):
+        """
+        Строит документ drawio целиком в памяти
+        """
+        return self._render_document(self._iter_document_cells(root_groups))
+    
+    def stream_dd_groups_to_drawio(self, root_group_id=None, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Потоковый экспорт в формат Draw.io.
+        
+        Дерево загружается и корневые группы определяются сразу (ошибки вроде
+        DdGroup.DoesNotExist выбрасываются до начала отдачи ответа), а XML
+        формируется по мере обхода layout и возвращается итератором строк.
+        Результат побайтно совпадает с export_dd_groups_to_drawio.
+        
+        Сжатую диаграмму можно построить только целиком, поэтому в режиме
+        compressed документ возвращается одной частью.
+        """
+        root_groups = self._resolve_root_groups(root_group_id)
+        if self.compressed:
+            return iter([self._build_document(root_groups)])
+        return self._iter_drawio_chunks(root_groups, chunk_size)
+    
+    def _resolve_root_groups(self, root_group_id=None):
+        """
+        Загружает дерево и определяет корневые группы для экспорта
+        """
         # Определяем какие группы экспортировать
         if root_group_id is None:
             # Экспортируем все корневые группы
-            root_groups = list(DdGroup.objects.filter(parent=None))
+            tree = self._load_tree()
+            return tree.get_roots()
+        
+        # Получаем целевую группу из загруженного дерева
+        if not isinstance(root_group_id, int):
+            root_group_id = root_group_id.id
+        tree = self._load_tree([root_group_id])
+        target_group = tree.get_group(root_group_id)
+        
+        # Если это уже корневая группа - экспортируем как есть
+        if target_group.parent_id is None:
+            return [target_group]
+        
+        # Строим дерево с полным путем от корня
+        filtered_root = self._build_tree_with_parents(target_group)
+        return [filtered_root]
+    
+    def export_pages_to_drawio(self, root_group_id=None, page_depth=0):
+        """
+        Экспортирует архитектуру в многостраничный документ Draw.io
+        (см. stream_pages_to_drawio)
+        """
+        return ''.join(self.stream_pages_to_drawio(root_group_id, page_depth))
+    
+    def stream_pages_to_drawio(self, root_group_id=None, page_depth=0, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Потоковый многостраничный экспорт в формат Draw.io.
+        
+        Каждая группа на глубине page_depth (0 - корневые группы или группа
+        root_group_id) выносится на отдельную страницу вместе со своим поддеревом.
+        Группы выше page_depth, у которых есть собственные компоненты, получают
+        страницу только с этими компонентами. Первая страница - содержание
+        со ссылками на остальные страницы.
+        
+        Дерево загружается и список страниц строится сразу, а layout каждой
+        страницы рассчитывается только когда до нее доходит отдача ответа.
+        На странице показываются связи, оба конца которых находятся на ней.
+        В режиме compressed каждая страница сжимается отдельно.
+        """
+        if page_depth < 0:
+            raise ValueError("Глубина страниц не может быть отрицательной")
+        pages = self._plan_pages(root_group_id, page_depth)
+        return self._join_chunks(self._iter_page_fragments(pages), chunk_size)
+    
+    def _plan_pages(self, root_group_id, page_depth) -> List[DrawioPage]:
+        """
+        Загружает дерево и определяет страницы документа в порядке обхода в глубину
+        """
+        if root_group_id is None:
+            tree = self._load_tree()
+            top_groups = tree.get_roots()
+            path = []
         else:
-            # Получаем целевую группу
-            if isinstance(root_group_id, int):
-                target_group = DdGroup.objects.get(id=root_group_id)
-            else:
-                target_group = root_group_id
+            if not isinstance(root_group_id, int):
+                root_group_id = root_group_id.id
+            tree = self._load_tree([root_group_id])
+            target_group = tree.get_group(root_group_id)
+            # Имя страницы - путь от корня, в том числе для вложенной целевой группы
+            path = [group.name for group in tree.get_path_to_root(target_group)[:-1]]
+            top_groups = [target_group]
+        
+        pages = []
+        stack = [(group, 0, path) for group in reversed(top_groups)]
+        while stack:
+            group, depth, path = stack.pop()
+            group_path = path + [group.name]
+            subgroups = tree.subgroups.get(group.id, [])
             
-            # Если это уже корневая группа - экспортируем как есть
-            if target_group.parent is None:
-                root_groups = [target_group]
-            else:
-                # Строим дерево с полным путем от корня
-                filtered_root = self._build_tree_with_parents(target_group)
-                root_groups = [filtered_root]
+            if depth == page_depth or not subgroups:
+                pages.append(DrawioPage(f'page-{group.id}', ' / '.join(group_path), depth, group, False))
+                continue
+            
+            if tree.components.get(group.id):
+                pages.append(DrawioPage(f'page-{group.id}', ' / '.join(group_path), depth, group, True))
+            stack.extend((subgroup, depth + 1, group_path) for subgroup in reversed(subgroups))
         
-        # Создаем корневую структуру XML
-        root = self._create_xml_structure()
+        return pages
+    
+    def _iter_page_fragments(self, pages):
+        """
+        Фрагменты многостраничного документа: заголовок, содержание,
+        страницы по мере расчета их layout, закрывающий тег
+        """
+        mxfile = ET.tostring(self._create_mxfile(), encoding='unicode', short_empty_elements=False)
+        split_at = mxfile.rindex('</mxfile>')
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n' + mxfile[:split_at]
         
-        # Получаем корневой элемент для добавления групп
-        mxgraph_model = root.find('.//mxGraphModel')
-        mxgraph_root = mxgraph_model.find('root')
+        yield from self._iter_diagram(TOC_PAGE_ID, TOC_PAGE_NAME, self._iter_toc_cells(pages))
+        
+        links_by_page = self._links_by_page(pages)
+        for index, page in enumerate(pages):
+            yield from self._iter_diagram(page.diagram_id, page.name, self._iter_page_cells(page, links_by_page[index]))
+            self._report_progress(index + 1, len(pages))
+        
+        yield mxfile[split_at:]
+    
+    def _iter_diagram(self, diagram_id, name, cells):
+        """
+        Страница документа: в несжатом виде ячейки отдаются по мере
+        формирования, в режиме compressed страница сжимается целиком
+        """
+        diagram = self._create_diagram(None, name, diagram_id)
+        graph_model = diagram.find('mxGraphModel')
+        model = ET.tostring(graph_model, encoding='unicode')
+        model_split_at = model.rindex('</root>')
+        diagram.remove(graph_model)
+        tags = ET.tostring(diagram, encoding='unicode', short_empty_elements=False)
+        tags_split_at = tags.rindex('</diagram>')
+        
+        if self.compressed:
+            body = ''.join(cells)
+            yield (
+                tags[:tags_split_at]
+                + compress_diagram(model[:model_split_at] + body + model[model_split_at:])
+                + tags[tags_split_at:]
+            )
+            return
+        
+        yield tags[:tags_split_at] + model[:model_split_at]
+        yield from cells
+        yield model[model_split_at:] + tags[tags_split_at:]
+    
+    def _iter_toc_cells(self, pages):
+        """Ячейки страницы содержания: заголовок и ссылки на страницы с отступом по глубине"""
+        title_style = DrawioPalette.get_style('toc_title')
+        entry_style = DrawioPalette.get_style('toc_entry')
+        
+        yield self.serializer.text_cell(title_style, f'{TOC_PAGE_ID}-title', 0, 0,
+                                        title_style.width, title_style.height, TOC_PAGE_NAME)
+        
+        y = title_style.height + entry_style.min_spacing
+        for page in pages:
+            yield self.serializer.text_cell(
+                entry_style, f'{TOC_PAGE_ID}-{page.diagram_id}', page.depth * TOC_INDENT, y,
+                entry_style.width, entry_style.height,
+                page.group.name, f'data:page/id,{page.diagram_id}',
+            )
+            y += entry_style.height
+    
+    def _links_by_page(self, pages) -> List[list]:
+        """
+        Распределяет связи DD по страницам: на страницу попадают связи,
+        оба конца которых находятся на ней
+        """
+        links_by_page = [[] for _ in pages]
+        if not self.include_links or not pages:
+            return links_by_page
+        
+        page_of_group = {}
+        for index, page in enumerate(pages):
+            if page.components_only:
+                page_of_group[page.group.id] = index
+            else:
+                page_of_group.update(dict.fromkeys(self.tree.get_subtree_ids([page.group.id]), index))
+        
+        for link in self.tree.load_links():
+            source_group_id, target_group_id = self._link_groups(link)
+            index = page_of_group.get(source_group_id)
+            if index is not None and index == page_of_group.get(target_group_id):
+                links_by_page[index].append(link)
+        return links_by_page
+    
+    def _iter_page_cells(self, page: DrawioPage, links):
+        """Ячейки страницы: layout группы (рассчитывается при обращении), затем связи"""
+        # Связи страницы соединяют только элементы этой страницы
+        self._endpoint_cells = {}
+        
+        if page.components_only:
+            page.group._filtered_children = [
+                {'type': 'component', 'object': component}
+                for component in self.tree.components.get(page.group.id, [])
+            ]
+        
+        yield from self._iter_layout_cells(self._calculate_group_layout(page.group))
+        yield from self._iter_link_cells(links)
+    
+    def _iter_root_layouts(self, root_groups):
+        """
+        Рассчитывает layout корневых групп по очереди, размещая их горизонтально
+        """
+        if self._use_parallel_layout(root_groups):
+            yield from self._iter_parallel_root_layouts(root_groups)
+            return
         
-        # Обрабатываем каждую целевую группу
         start_x = 0  # Корневой элемент в (0,0)
-        for i, group in enumerate(root_groups):
+        for index, group in enumerate(root_groups):
             # Рассчитываем layout для группы
             group_layout = self._calculate_group_layout(group, start_x, 0)
-            
-            # Рекурсивно добавляем все элементы в XML
-            self._add_layout_to_xml(mxgraph_root, group_layout)
+            yield group_layout
+            self._report_progress(index + 1, len(root_groups))
             
             # Сдвигаем позицию для следующей группы
-            start_x += group_layout['width'] + self.group_spacing
+            start_x += group_layout.width + self.group_spacing
+    
+    def _report_progress(self, done, total):
+        if self.progress is not None:
+            self.progress(done, total)
+    
+    def _use_parallel_layout(self, root_groups):
+        """
+        Параллельный расчет возможен для нескольких полных корневых групп:
+        их поддеревья независимы до горизонтального сдвига. Запуск процессов
+        обходится дороже расчета небольшого дерева, поэтому пул используется
+        только для деревьев от EXPORT_LAYOUT_PARALLEL_MIN_GROUPS групп.
+        """
+        return (
+            self.layout_processes > 1
+            and len(root_groups) > 1
+            and self.tree is not None
+            and len(self.tree.groups) >= getattr(settings, 'EXPORT_LAYOUT_PARALLEL_MIN_GROUPS', 0)
+            and not any(hasattr(group, '_filtered_children') for group in root_groups)
+        )
+    
+    def _iter_parallel_root_layouts(self, root_groups):
+        """
+        Рассчитывает layout корневых групп в пуле процессов.
+        
+        Каждый процесс получает снимок поддерева своей корневой группы и считает
+        layout от (0, 0). Результаты собираются в исходном порядке: корневая группа
+        сдвигается на group_spacing, как при последовательном расчете, а ID ячеек
+        перенумеровываются, поэтому документ совпадает с последовательным.
+        """
+        layout_options = self._layout_options()
+        tasks = []
+        for group in root_groups:
+            subtree = self.tree.subset(group.id)
+            layout_entries = {
+                group_id: self._layout_entries[group_id]
+                for group_id in subtree.groups
+                if group_id in self._layout_entries
+            }
+            tasks.append((subtree, group.id, layout_entries, layout_options))
+        
+        components = {
+            component.id: component
+            for group_components in self.tree.components.values()
+            for component in group_components
+        }
+        
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(
+            max_workers=min(self.layout_processes, len(tasks)),
+            mp_context=context,
+            initializer=init_worker_process,
+        ) as pool:
+            # Результаты собираются до выхода из пула: если потребитель остановится
+            # раньше (клиент отключился), процессы не останутся ждать сборки мусора
+            results = list(pool.map(calculate_root_layout, *zip(*tasks)))
+        
+        start_x = 0
+        for index, (detached_layout, new_entries, stats) in enumerate(results):
+            self._new_layout_entries.update(new_entries)
+            self._save_layout_cache()
+            for key, value in stats.items():
+                self.layout_stats[key] += value
+            
+            group_layout = self._attach_layout(detached_layout, ROOT_CELL_ID, components)
+            group_layout.x = start_x
+            yield group_layout
+            self._report_progress(index + 1, len(tasks))
+            
+            start_x += group_layout.width + self.group_spacing
+    
+    def _detach_layout(self, layout):
+        """
+        Преобразует layout в плоский список элементов в прямом порядке обхода:
+        (тип, ID объекта модели, x, y, ширина, высота, индекс родителя).
+        Такой список передается между процессами без рекурсии при сериализации.
+        """
+        detached = []
+        stack = [(layout, None)]
+        while stack:
+            node, parent_index = stack.pop()
+            index = len(detached)
+            detached.append((
+                node.element_type, node.element.id, node.x, node.y, node.width, node.height, parent_index
+            ))
+            stack.extend((child, index) for child in reversed(node.children))
+        return detached
+    
+    def _attach_layout(self, detached, parent_id, components):
+        """
+        Восстанавливает layout из плоского списка: объекты моделей берутся
+        из индекса дерева, ID ячеек - по их первичным ключам, как при
+        последовательном расчете
+        """
+        nodes = []
+        for element_type, element_id, x, y, width, height, parent_index in detached:
+            if element_type == COMPONENT:
+                element = components[element_id]
+            else:
+                element = self.tree.groups[element_id]
+            cell_id = self._cell_id(element_type, element)
+            if element_type == self.link_endpoint_type:
+                self._endpoint_cells[element_id] = cell_id
+            
+            parent_node = None if parent_index is None else nodes[parent_index]
+            node = LayoutNode(
+                cell_id, element_type, element, x, y, width, height,
+                parent_id if parent_node is None else parent_node.id,
+            )
+            
+            if parent_node is not None:
+                parent_node.children.append(node)
+            nodes.append(node)
+        return nodes[0]
+    
+    def _iter_drawio_chunks(self, root_groups, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Генерирует документ drawio частями: заголовок, ячейки каждой корневой
+        группы по мере расчета ее layout, закрывающие теги
+        """
+        header, footer = self._xml_document_envelope()
+        fragments = chain([header], self._iter_document_cells(root_groups), [footer])
+        return self._join_chunks(fragments, chunk_size)
+    
+    @staticmethod
+    def _join_chunks(fragments, chunk_size):
+        """Объединяет фрагменты документа в части размером не меньше chunk_size"""
+        buffer = []
+        buffered = 0
+        for fragment in fragments:
+            buffer.append(fragment)
+            buffered += len(fragment)
+            if buffered >= chunk_size:
+                yield ''.join(buffer)
+                buffer = []
+                buffered = 0
+        
+        if buffer:
+            yield ''.join(buffer)
+    
+    def _iter_document_cells(self, root_groups):
+        """
+        Ячейки документа: элементы корневых групп, затем связи
+        (связи добавляются после групп: нужны ID ячеек обоих концов)
+        """
+        for group_layout in self._iter_root_layouts(root_groups):
+            yield from self._iter_layout_cells(group_layout)
+        yield from self._iter_link_cells()
+    
+    def _render_document(self, cells):
+        """
+        Собирает документ из сериализованных ячеек. В режиме compressed
+        сжимается модель графа целиком, как это делает draw.io.
+        """
+        body = ''.join(cells)
+        if not self.compressed:
+            header, footer = self._xml_document_envelope()
+            return header + body + footer
         
+        root = self._create_xml_structure()
+        diagram = root.find('diagram')
+        graph_model = diagram.find('mxGraphModel')
+        model = ET.tostring(graph_model, encoding='unicode')
+        split_at = model.rindex('</root>')
+        diagram.text = compress_diagram(model[:split_at] + body + model[split_at:])
+        diagram.remove(graph_model)
         return self._xml_to_string(root)
     
+    def _xml_document_envelope(self):
+        """
+        Возвращает начало несжатого документа (до закрывающего </root>) и его окончание
+        """
+        document = self._xml_to_string(self._create_xml_structure())
+        split_at = document.rindex('</root>')
+        return document[:split_at], document[split_at:]
+    
     def _create_xml_structure(self):
         """Создает базовую XML структуру для drawio"""
-        # Создаем корневой элемент
-        mxfile = ET.Element('mxfile', {
+        mxfile = self._create_mxfile()
+        self._create_diagram(mxfile, 'Page-1', 'architecture_diagram')
+        return mxfile
+    
+    def _create_mxfile(self):
+        """Создает корневой элемент документа drawio без страниц"""
+        return ET.Element('mxfile', {
             'host': 'Electron',
             'modified': '2025-06-20T14:19:00.651Z',
             'agent': '5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) draw.io/20.8.16 Chrome/106.0.5249.199 Electron/21.4.0 Safari/537.36',
@@ -163,12 +669,20 @@ class DrawioExporter:
             'etag': 'generated',
             'type': 'device'
         })
-        
-        # Создаем диаграмму
-        diagram = ET.SubElement(mxfile, 'diagram', {
-            'name': 'Page-1',
-            'id': 'architecture_diagram'
-        })
+    
+    def _create_diagram(self, mxfile, name, diagram_id):
+        """
+        Создает страницу (diagram) с моделью графа и базовыми ячейками.
+        Если mxfile не указан - отдельный элемент страницы.
+        """
+        attributes = {
+            'name': name,
+            'id': diagram_id
+        }
+        if mxfile is None:
+            diagram = ET.Element('diagram', attributes)
+        else:
+            diagram = ET.SubElement(mxfile, 'diagram', attributes)
         
         # Создаем модель графа
         mxgraph_model = ET.SubElement(diagram, 'mxGraphModel', {
@@ -196,31 +710,9 @@ class DrawioExporter:
         ET.SubElement(root, 'mxCell', {'id': '0'})
         ET.SubElement(root, 'mxCell', {'id': '1', 'parent': '0'})
         
-        return mxfile
-    
-    def _calculate_layout(self, root_groups: List[DdGroup]) -> List[Dict]:
-        """
-        Рассчитывает размеры и позиции для всех групп в дереве
-        
-        Returns:
-            Список словарей с информацией о группах и их позиционировании
-        """
-        layout_info = []
-        
-        # Начальная позиция для корневых элементов
-        current_x = 50
-        current_y = 50
-        
-        for root_group in root_groups:
-            group_layout = self._calculate_group_layout(root_group, current_x, current_y, None)
-            layout_info.extend(group_layout)
-            
-            # Сдвигаем позицию для следующей корневой группы
-            current_x += group_layout[0]['width'] + 50
-        
-        return layout_info
+        return diagram
     
-    def _calculate_group_layout(self, group, x=0, y=0, parent_id=None):
+    def _calculate_group_layout(self, group, x=0, y=0, parent_id=ROOT_CELL_ID) -> LayoutNode:
         """
         Рассчитывает размеры и позиции элементов в два прохода:
         1) Снизу вверх - только размеры
@@ -228,90 +720,26 @@ class DrawioExporter:
         """
         # ПРОХОД 1: Рассчитываем размеры снизу вверх
         size_info = self._calculate_sizes_bottom_up(group)
+        self._save_layout_cache()
         
         # ПРОХОД 2: Рассчитываем координаты сверху вниз
         layout = self._calculate_positions_top_down(group, size_info, x, y, parent_id)
         
         return layout
     
-    def _calculate_optimal_layout(self, children_sizes):
+    def _save_layout_cache(self):
+        """Сохраняет в кэш layout группы, рассчитанные заново"""
+        if self.layout_cache is not None and self._new_layout_entries:
+            self.layout_cache.set_many(self._new_layout_entries)
+            self._layout_entries.update(self._new_layout_entries)
+            self._new_layout_entries = {}
+    
+    def _calculate_optimal_layout(self, children_sizes: List[SizeNode]) -> PackedPlacement:
         """
-        Умный алгоритм размещения элементов в строки с анализом размеров
-        Большие элементы размещаются в отдельных строках, маленькие группируются
+        Размещает детей разного размера выбранным алгоритмом упаковки (см. packing.py)
         """
-        if not children_sizes:
-            return [], 0, 0
-        
-        # Сортируем элементы по убыванию площади
-        sorted_children = sorted(children_sizes, key=lambda x: x['width'] * x['height'], reverse=True)
-        
-        # Определяем пороговую ширину - если элемент шире, он идет в отдельную строку
-        max_width = max(child['width'] for child in sorted_children)
-        width_threshold = max_width * 0.6  # 60% от самого широкого элемента
-        
-        # Группируем элементы по строкам
-        rows = []
-        
-        for child in sorted_children:
-            child_width = child['width']
-            child_height = child['height']
-            
-            # Если элемент широкий - размещаем в отдельной строке
-            if child_width >= width_threshold:
-                rows.append({
-                    'elements': [child],
-                    'width': child_width,
-                    'height': child_height,
-                    'is_single': True
-                })
-            else:
-                # Ищем строку, куда поместится маленький элемент
-                placed = False
-                max_row_width = 1200  # Максимальная ширина строки для маленьких элементов
-                
-                for row in rows:
-                    if not row['is_single']:  # Только в строки с несколькими элементами
-                        if row['width'] + self.min_child_spacing + child_width <= max_row_width:
-                            row['elements'].append(child)
-                            row['width'] += self.min_child_spacing + child_width
-                            row['height'] = max(row['height'], child_height)
-                            placed = True
-                            break
-                
-                # Если не поместился - создаем новую строку для маленьких элементов
-                if not placed:
-                    rows.append({
-                        'elements': [child],
-                        'width': child_width,
-                        'height': child_height,
-                        'is_single': False
-                    })
-        
-        # Преобразуем строки в позиции элементов
-        positions = []
-        current_y = 0
-        total_width = 0
-        
-        for row in rows:
-            current_x = 0
-            
-            for element in row['elements']:
-                positions.append({
-                    'element': element,
-                    'x': current_x,
-                    'y': current_y,
-                    'width': element['width'],
-                    'height': element['height']
-                })
-                current_x += element['width'] + self.min_child_spacing
-            
-            total_width = max(total_width, row['width'])
-            current_y += row['height'] + self.min_child_spacing
-        
-        # Убираем лишний отступ снизу
-        total_height = current_y - self.min_child_spacing if current_y > 0 else 0
-        
-        return positions, total_width, total_height
+        sizes = [(child.width, child.height) for child in children_sizes]
+        return PackedPlacement(*PACKERS[self.packing](sizes, self.min_child_spacing, self.max_row_width))
     
     def _calculate_grid_layout(self, num_children):
         """
@@ -335,15 +763,15 @@ class DrawioExporter:
     def _should_use_bin_packing(self, children_sizes):
         """
         Определяет, нужно ли использовать bin packing или простую сетку
-        Bin packing используется если:
+        Bin packing используется если стратегия размещения не grid и:
         1. Элементы имеют разные размеры
         2. Есть элементы, которые значительно больше других
         """
-        if not children_sizes:
+        if not children_sizes or self.packing == PACKING_GRID:
             return False
         
         # Получаем размеры всех элементов
-        sizes = [(child['width'], child['height']) for child in children_sizes]
+        sizes = [(child.width, child.height) for child in children_sizes]
         areas = [size[0] * size[1] for size in sizes]
         
         # Если все элементы одинакового размера - используем простую сетку
@@ -365,69 +793,99 @@ class DrawioExporter:
     def _calculate_sizes_bottom_up(self, group):
         """
         ПРОХОД 1: Рассчитывает размеры всех элементов снизу вверх
-        Возвращает словарь {group_id: {'width': w, 'height': h, 'children': [...]}}
+        Возвращает SizeNode группы с размерами и размещением всех потомков
+        
+        Обход выполняется с явным стеком (глубина дерева не ограничена
+        лимитом рекурсии). Если группа встречается в собственной цепочке
+        предков, выбрасывается HierarchyCycleError.
         """
+        # Кадр стека: группа, данные ее детей и уже рассчитанные размеры детей
+        stack = [(group, self._get_children_data(group), [])]
+        in_progress = {group.id}
+        
+        while True:
+            current, children_data, children_sizes = stack[-1]
+            
+            if len(children_sizes) < len(children_data):
+                child_data = children_data[len(children_sizes)]
+                if child_data['type'] == 'group':
+                    # Спускаемся в подгруппу
+                    subgroup = child_data['object']
+                    if subgroup.id in in_progress:
+                        cycle_start = next(
+                            index for index, frame in enumerate(stack) if frame[0].id == subgroup.id
+                        )
+                        raise HierarchyCycleError([frame[0].id for frame in stack[cycle_start:]])
+                    in_progress.add(subgroup.id)
+                    stack.append((subgroup, self._get_children_data(subgroup), []))
+                else:
+                    # Компонент имеет фиксированный размер
+                    children_sizes.append(self._component_size(child_data['object']))
+                continue
+            
+            # Все дети рассчитаны - рассчитываем саму группу
+            stack.pop()
+            in_progress.discard(current.id)
+            size_info = self._group_size(current, children_sizes)
+            
+            if not stack:
+                return size_info
+            stack[-1][2].append(size_info)
+    
+    def _get_children_data(self, group):
+        """Дети группы с учетом отфильтрованных детей при экспорте поддерева"""
         # Используем отфильтрованные дети, если они есть, иначе получаем всех детей
         if hasattr(group, '_filtered_children'):
-            children_data = group._filtered_children
-        else:
-            children_data = self._get_group_children(group)
-        
+            return group._filtered_children
+        return self._get_group_children(group)
+    
+    def _component_size(self, component) -> SizeNode:
+        """Размер компонента - фиксированный, из стиля палитры"""
+        component_style = self._component_style(component)
+        return SizeNode(COMPONENT, component, component_style.width, component_style.height)
+    
+    def _group_size(self, group, children_sizes) -> SizeNode:
+        """
+        Рассчитывает размер группы по уже рассчитанным размерам ее детей
+        """
         # Если это листовой элемент - базовый размер
-        if not children_data:
-            return {
-                'element_type': 'group',
-                'group': group,
-                'width': self.base_width,  # 240
-                'height': self.base_height,  # 120
-                'children': []
-            }
-        
-        # Рекурсивно получаем размеры всех детей
-        children_sizes = []
-        for child_data in children_data:
-            if child_data['type'] == 'group':
-                # Рекурсивно обрабатываем подгруппу
-                child_size = self._calculate_sizes_bottom_up(child_data['object'])
-                children_sizes.append(child_size)
-            elif child_data['type'] == 'component':
-                # Компонент имеет фиксированный размер
-                component_style = DrawioPalette.get_component_style(child_data['object'])
-                child_size = {
-                    'element_type': 'component',
-                    'component': child_data['object'],
-                    'width': component_style.width,
-                    'height': component_style.height,
-                    'children': []  # У компонентов нет детей
-                }
-                children_sizes.append(child_size)
-        
+        if not children_sizes:
+            return SizeNode(GROUP, group, self.base_width, self.base_height)
+        
+        # Размещение детей берем из кэша layout, если дети не изменились
+        use_cache = self.layout_cache is not None and not hasattr(group, '_filtered_children')
+        if use_cache:
+            entry = self._layout_entries.get(group.id)
+            if entry is not None and [tuple(key) for key in entry['children']] == [child_key(child) for child in children_sizes]:
+                self.layout_stats['reused'] += 1
+                return LayoutCache.restore_size_info(group, children_sizes, entry)
+        
+        size_info = self._layout_children(group, children_sizes)
+        self.layout_stats['computed'] += 1
+        
+        if use_cache:
+            self._new_layout_entries[group.id] = LayoutCache.make_entry(size_info)
+        return size_info
+    
+    def _layout_children(self, group, children_sizes) -> SizeNode:
+        """
+        Рассчитывает размер группы и размещение ее детей по их размерам
+        """
         # Выбираем алгоритм размещения
         if self._should_use_bin_packing(children_sizes):
             # Используем bin packing для элементов разного размера
-            positions, content_width, content_height = self._calculate_optimal_layout(children_sizes)
-            
-            parent_width = max(self.base_width, content_width + 2 * self.padding)
-            parent_height = max(self.base_height, content_height + self.header_height + 2 * self.padding)
+            placement = self._calculate_optimal_layout(children_sizes)
             
-            return {
-                'element_type': 'group',
-                'group': group,
-                'width': parent_width,
-                'height': parent_height,
-                'children': children_sizes,
-                'positions': positions,  # Сохраняем рассчитанные позиции
-                'content_width': content_width,
-                'content_height': content_height,
-                'layout_type': 'bin_packing'
-            }
+            parent_width = max(self.base_width, placement.content_width + 2 * self.padding)
+            parent_height = max(self.base_height, placement.content_height + self.header_height + 2 * self.padding)
         else:
             # Используем простую сетку для элементов одинакового размера
             cols, rows = self._calculate_grid_layout(len(children_sizes))
             
             # Находим максимальные размеры среди детей (они все одинаковые)
-            max_child_width = max(child['width'] for child in children_sizes)
-            max_child_height = max(child['height'] for child in children_sizes)
+            max_child_width = max(child.width for child in children_sizes)
+            max_child_height = max(child.height for child in children_sizes)
+            placement = GridPlacement(cols, rows, max_child_width, max_child_height)
             
             # Рассчитываем размер родителя на основе сетки
             total_width = cols * max_child_width + (cols - 1) * self.min_child_spacing
@@ -435,131 +893,95 @@ class DrawioExporter:
             
             parent_width = max(self.base_width, total_width + 2 * self.padding)
             parent_height = max(self.base_height, total_height + self.header_height + 2 * self.padding)
-            
-            return {
-                'element_type': 'group',
-                'group': group,
-                'width': parent_width,
-                'height': parent_height,
-                'children': children_sizes,
-                'grid_cols': cols,
-                'grid_rows': rows,
-                'max_child_width': max_child_width,
-                'max_child_height': max_child_height,
-                'layout_type': 'grid'
-            }
+        
+        return SizeNode(GROUP, group, parent_width, parent_height, children_sizes, placement)
     
-    def _calculate_positions_top_down(self, group, size_info, x, y, parent_id):
+    def _calculate_positions_top_down(self, group, size_info, x, y, parent_id) -> LayoutNode:
         """
         ПРОХОД 2: Рассчитывает абсолютные координаты сверху вниз
-        """
-        # Проверяем тип элемента
-        if size_info.get('element_type') == 'component':
-            # Для компонента просто возвращаем его информацию
-            component_id = self.current_id
-            self.current_id += 1
-            
-            return {
-                'id': component_id,
-                'element_type': 'component',
-                'component': size_info['component'],
-                'name': size_info['component'].name,
-                'x': x,
-                'y': y,
-                'width': size_info['width'],
-                'height': size_info['height'],
-                'parent': parent_id,
-                'children': []
-            }
         
-        # Для группы
-        group_id = self.current_id
-        self.current_id += 1
-        
-        layout = {
-            'id': group_id,
-            'element_type': 'group',
-            'group': group,
-            'name': group.name,
-            'x': x,
-            'y': y,
-            'width': size_info['width'],
-            'height': size_info['height'],
-            'parent': parent_id,
-            'children': []
-        }
+        Обход выполняется с явным стеком: дети кладутся в обратном порядке,
+        чтобы сохранить порядок рекурсивного обхода.
+        """
+        root_layout = None
+        # Элемент стека: размеры элемента, координаты и layout родителя
+        stack = [(size_info, x, y, parent_id, None)]
         
-        # Выбираем способ размещения детей в зависимости от типа layout
-        if size_info['children']:
-            layout_type = size_info.get('layout_type', 'grid')
+        while stack:
+            element_size, element_x, element_y, element_parent_id, parent_layout = stack.pop()
+            layout = self._element_layout(element_size, element_x, element_y, element_parent_id)
             
-            if layout_type == 'bin_packing':
-                # Используем предрассчитанные позиции из bin packing
-                for pos_info in size_info['positions']:
-                    child_size = pos_info['element']
-                    
-                    # Рассчитываем абсолютные координаты (относительно родителя + отступ)
-                    child_x = 30 + pos_info['x']
-                    child_y = 30 + pos_info['y']
-                    
-                    # Рекурсивно рассчитываем координаты ребенка
-                    if child_size.get('element_type') == 'component':
-                        child_layout = self._calculate_positions_top_down(
-                            None,  # Для компонента group не нужен
-                            child_size, 
-                            child_x, 
-                            child_y, 
-                            group_id
-                        )
-                    else:
-                        child_layout = self._calculate_positions_top_down(
-                            child_size['group'], 
-                            child_size, 
-                            child_x, 
-                            child_y, 
-                            group_id
-                        )
-                    layout['children'].append(child_layout)
+            if parent_layout is None:
+                root_layout = layout
             else:
-                # Используем простую сетку
-                cols = size_info.get('grid_cols', 1)
-                max_child_width = size_info.get('max_child_width', self.base_width)
-                max_child_height = size_info.get('max_child_height', self.base_height)
-                
-                for i, child_size in enumerate(size_info['children']):
-                    # Определяем позицию в сетке
-                    col = i % cols
-                    row = i // cols
-                    
-                    # Рассчитываем координаты ребенка в сетке
-                    child_x = 30 + col * (max_child_width + self.min_child_spacing)
-                    child_y = 30 + row * (max_child_height + self.min_child_spacing)
-                    
-                    # Рекурсивно рассчитываем координаты ребенка
-                    if child_size.get('element_type') == 'component':
-                        child_layout = self._calculate_positions_top_down(
-                            None,  # Для компонента group не нужен
-                            child_size, 
-                            child_x, 
-                            child_y, 
-                            group_id
-                        )
-                    else:
-                        child_layout = self._calculate_positions_top_down(
-                            child_size['group'], 
-                            child_size, 
-                            child_x, 
-                            child_y, 
-                            group_id
-                        )
-                    layout['children'].append(child_layout)
+                parent_layout.children.append(layout)
+            
+            if element_size.children:
+                child_positions = list(self._iter_child_positions(element_size))
+                for child_size, child_x, child_y in reversed(child_positions):
+                    stack.append((child_size, child_x, child_y, layout.id, layout))
         
-        return layout
+        return root_layout
+    
+    def _element_layout(self, size_info: SizeNode, x, y, parent_id) -> LayoutNode:
+        """
+        Создает layout элемента (без детей) и назначает ему ID ячейки
+        """
+        cell_id = self._cell_id(size_info.element_type, size_info.element)
+        if size_info.element_type == self.link_endpoint_type:
+            self._endpoint_cells[size_info.element.id] = cell_id
+        return LayoutNode(
+            cell_id, size_info.element_type, size_info.element,
+            x, y, size_info.width, size_info.height, parent_id,
+        )
+    
+    def _cell_id(self, element_type, element) -> str:
+        """
+        ID ячейки элемента по его первичному ключу: повторный экспорт
+        той же модели дает те же ID, а документы можно сравнивать
+        """
+        prefix = self.component_cell_prefix if element_type == COMPONENT else self.group_cell_prefix
+        return f'{prefix}-{element.id}'
+    
+    def _iter_child_positions(self, size_info: SizeNode):
+        """
+        Возвращает детей группы с их координатами относительно группы:
+        (размеры ребенка, x, y)
+        """
+        children = size_info.children
+        placement = size_info.placement
+        
+        if isinstance(placement, PackedPlacement):
+            # Используем предрассчитанные позиции из bin packing
+            for index, x, y in placement.positions:
+                # Рассчитываем абсолютные координаты (относительно родителя + отступ)
+                yield children[index], 30 + x, 30 + y
+        else:
+            # Используем простую сетку
+            cols = placement.cols
+            column_step = placement.max_child_width + self.min_child_spacing
+            row_step = placement.max_child_height + self.min_child_spacing
+            
+            for i, child_size in enumerate(children):
+                # Определяем позицию в сетке
+                col = i % cols
+                row = i // cols
+                
+                # Рассчитываем координаты ребенка в сетке
+                yield child_size, 30 + col * column_step, 30 + row * row_step
+    
+    def _component_style(self, component):
+        """Стиль компонента из таблицы стилей по его типу"""
+        return self.component_styles.get_component_style(component)
+    
+    def _create_component_cell(self, component_info: LayoutNode) -> str:
+        """Создает XML ячейку компонента"""
+        return self.serializer.component_cell(*self._component_cell_args(component_info))
     
-    def _create_component_cell(self, component_info: Dict) -> ET.Element:
-        """Создает XML элемент для компонента"""
-        component = component_info['component']
-        component_style = DrawioPalette.get_component_style(component)
+    def _component_cell_args(self, component_info: LayoutNode) -> tuple:
+        """Аргументы сериализатора для ячейки компонента"""
+        component = component_info.element
+        component_style = self._component_style(component)
         
         # Определяем значения для отображения
         c4_name = component.name
@@ -567,49 +989,33 @@ class DrawioExporter:
         c4_technology = component.technology or 'Technology'
         c4_description = component.description or 'Description'
         
-        # Создаем object элемент
-        object_elem = ET.Element('object', {
-            'placeholders': '1',
-            'c4Name': c4_name,
-            'c4Type': c4_type,
-            'c4Technology': c4_technology,
-            'c4Description': c4_description,
-            'label': component_style.label_template,
-            'id': str(component_info['id'])
-        })
-        
-        # Создаем mxCell элемент с стилем из палитры
-        mx_cell = ET.SubElement(object_elem, 'mxCell', {
-            'style': component_style.style,
-            'vertex': '1',
-            'parent': str(component_info.get('parent', '1'))
-        })
-        
-        # Создаем mxGeometry элемент
-        ET.SubElement(mx_cell, 'mxGeometry', {
-            'x': str(component_info['x']),
-            'y': str(component_info['y']),
-            'width': str(component_info['width']),
-            'height': str(component_info['height']),
-            'as': 'geometry'
-        })
-        
-        return object_elem
+        return (
+            component_style,
+            component_info.id,
+            component_info.parent,
+            component_info.x,
+            component_info.y,
+            component_info.width,
+            component_info.height,
+            c4_name,
+            c4_type,
+            c4_technology,
+            c4_description,
+        )
     
-    def _create_group_cell(self, group_info: Dict) -> ET.Element:
-        """Создает XML элемент для группы"""
-        # Получаем объект группы из layout info
-        if 'group' in group_info:
-            group = group_info['group']
-        else:
-            # Fallback - пытаемся найти группу по имени (не должно происходить)
-            group = None
+    def _create_group_cell(self, group_info: LayoutNode) -> str:
+        """Создает XML ячейку группы"""
+        return self.serializer.group_cell(*self._group_cell_args(group_info))
+    
+    def _group_cell_args(self, group_info: LayoutNode) -> tuple:
+        """Аргументы сериализатора для ячейки группы"""
+        group = group_info.element
         
         # Определяем значения для отображения
-        c4_name = group_info['name'] if group_info.get('name') else 'Unknown'
+        c4_name = group.name or 'Unknown'
         
         # Логика для экземпляров: если None или пусто -> "1", если 0 -> "n", иначе -> значение
-        if group and hasattr(group, 'instances'):
+        if hasattr(group, 'instances'):
             if group.instances is None or group.instances == '':
                 c4_instances = '1'
             elif group.instances == 0:
@@ -620,44 +1026,68 @@ class DrawioExporter:
             c4_instances = '1'  # По умолчанию
         
         # Формируем спецификации
-        if group:
-            type_name = group.type.name if group.type else 'Unknown Type'
-            specification = group.specification if group.specification else ''
+        type_name = group.type.name if group.type else 'Unknown Type'
+        specification = group.specification if group.specification else ''
+        
+        if specification.strip():  # Если спецификация не пустая
+            c4_specifications = f"{type_name}\n{specification}"
+        else:  # Если спецификация пустая - только тип в квадратных скобках
+            c4_specifications = f"{type_name}"
+        
+        style, c4_specifications = self._group_style(group, c4_specifications)
+        return (
+            style,
+            group_info.id,
+            group_info.parent,
+            group_info.x,
+            group_info.y,
+            group_info.width,
+            group_info.height,
+            c4_name,
+            c4_instances,
+            c4_specifications,
+        )
+    
+    def _group_style(self, group, specifications):
+        """
+        Стиль и спецификации ячейки группы: свернутая группа выделяется
+        отдельным стилем того же размера, к спецификациям добавляется сводка
+        """
+        summary = self.tree.collapsed.get(group.id) if self.tree is not None else None
+        if summary is None:
+            return self.group_style, specifications
+        return self.collapsed_group_style, f"{specifications}\n{summary.label()}"
+    
+    def _iter_link_cells(self, links=None):
+        """
+        Возвращает ячейки связей DD, оба конца которых есть на диаграмме.
+        Связи, протоколы и порты загружаются фиксированным числом запросов.
+        """
+        if not self.include_links or self.tree is None or not self._endpoint_cells:
+            return
+        
+        if links is None:
+            links = self.tree.load_links()
+        for link in links:
+            source, target = self._link_ends(link)
+            source_id = self._endpoint_cells.get(source)
+            target_id = self._endpoint_cells.get(target)
+            if source_id is None or target_id is None:
+                continue
             
-            if specification.strip():  # Если спецификация не пустая
-                c4_specifications = f"{type_name}\n{specification}"
-            else:  # Если спецификация пустая - только тип в квадратных скобках
-                c4_specifications = f"{type_name}"
-        else:
-            c4_specifications = 'Unknown Type'
-        
-        # Создаем object элемент
-        object_elem = ET.Element('object', {
-            'placeholders': '1',
-            'c4Name': c4_name,
-            'label': self.dd_group_style.label_template,
-            'c4Instances': c4_instances,
-            'c4Specifications': c4_specifications,
-            'id': str(group_info['id'])
-        })
-        
-        # Создаем mxCell элемент с стилем из палитры
-        mx_cell = ET.SubElement(object_elem, 'mxCell', {
-            'style': self.dd_group_style.style,
-            'vertex': '1',
-            'parent': str(group_info.get('parent', '1'))
-        })
-        
-        # Создаем mxGeometry элемент
-        ET.SubElement(mx_cell, 'mxGeometry', {
-            'x': str(group_info['x']),
-            'y': str(group_info['y']),
-            'width': str(group_info['width']),
-            'height': str(group_info['height']),
-            'as': 'geometry'
-        })
-        
-        return object_elem
+            yield self._create_link_cell(link, f'{self.link_cell_prefix}-{link.id}', source_id, target_id)
+    
+    def _link_ends(self, link):
+        """ID элементов - концов связи"""
+        return link.group_from_id, link.group_to_id
+    
+    def _link_groups(self, link):
+        """ID групп, в которых находятся концы связи"""
+        return link.group_from_id, link.group_to_id
+    
+    def _create_link_cell(self, link, link_id, source_id, target_id) -> str:
+        """Создает XML ячейку связи DD"""
+        return self.serializer.link_cell(self.link_style, link_id, source_id, target_id, get_link_label(link))
     
     def _xml_to_string(self, root: ET.Element) -> str:
         """Преобразует XML элемент в строку с правильным форматированием"""
@@ -666,21 +1096,119 @@ class DrawioExporter:
         xml_str += ET.tostring(root, encoding='unicode')
         return xml_str 
 
-    def _add_layout_to_xml(self, xml_root, layout):
+    def _iter_layout_cells(self, layout):
         """
-        Рекурсивно добавляет layout в XML структуру
+        Обходит layout в прямом порядке и возвращает XML ячейки элементов
         """
-        # Добавляем текущий элемент в зависимости от типа
-        if layout.get('element_type') == 'component':
-            element_cell = self._create_component_cell(layout)
-        else:
-            element_cell = self._create_group_cell(layout)
+        if self.fragment_cache is not None:
+            yield from self._iter_fragment_cells(layout)
+            return
+        
+        stack = [layout]
+        while stack:
+            element_layout = stack.pop()
+            
+            # Добавляем текущий элемент в зависимости от типа
+            if element_layout.element_type == COMPONENT:
+                yield self._create_component_cell(element_layout)
+            else:
+                yield self._create_group_cell(element_layout)
+            
+            # Дети в обратном порядке - первый ребенок будет обработан первым
+            stack.extend(reversed(element_layout.children))
+    
+    def _iter_fragment_cells(self, layout):
+        """
+        Ячейки layout с использованием кэша фрагментов.
+        
+        Геометрия ячейки задается относительно родителя, а ID ячеек - по
+        первичным ключам, поэтому XML потомков группы не зависит от ее
+        положения. Ключ фрагмента - хэш аргументов сериализации потомков,
+        считается снизу вверх. Фрагментами кэшируются наибольшие поддеревья
+        не длиннее FragmentCache.max_cells ячеек, поэтому каждая ячейка
+        хранится не более чем в одном фрагменте.
+        """
+        # Элементы в прямом порядке: поддерево элемента i - order[i:i + cells[i]]
+        order = []
+        stack = [layout]
+        while stack:
+            element_layout = stack.pop()
+            order.append(element_layout)
+            stack.extend(reversed(element_layout.children))
+        
+        position = {id(element_layout): index for index, element_layout in enumerate(order)}
+        cell_args = [
+            self._component_cell_args(element_layout) if element_layout.element_type == COMPONENT
+            else self._group_cell_args(element_layout)
+            for element_layout in order
+        ]
+        cells = [1] * len(order)
+        keys = [None] * len(order)
+        for index in range(len(order) - 1, -1, -1):
+            children = order[index].children
+            if not children:
+                continue
+            digest = hashlib.blake2b(digest_size=16)
+            for child in children:
+                child_index = position[id(child)]
+                digest.update(self._cell_signature(order[child_index].element_type, cell_args[child_index]))
+                if keys[child_index] is not None:
+                    digest.update(keys[child_index])
+                cells[index] += cells[child_index]
+            keys[index] = digest.digest()
+        
+        cache = self.fragment_cache
+        fragment_roots = {}
+        parent_cells = {id(layout): None}
+        for index, element_layout in enumerate(order):
+            for child in element_layout.children:
+                parent_cells[id(child)] = cells[index]
+            descendants = cells[index] - 1
+            parent = parent_cells[id(element_layout)]
+            if cache.min_cells <= descendants <= cache.max_cells and (parent is None or parent - 1 > cache.max_cells):
+                fragment_roots[index] = keys[index].hex()
+        cached = cache.get_many(fragment_roots.values())
+        
+        new_fragments = {}
+        index = 0
+        while index < len(order):
+            yield self._serialize_cell(order[index].element_type, cell_args[index])
+            key = fragment_roots.get(index)
+            if key is None:
+                self.fragment_stats['serialized'] += 1
+                index += 1
+                continue
             
-        xml_root.append(element_cell)
+            fragment = cached.get(key)
+            if fragment is None:
+                fragment = ''.join(
+                    self._serialize_cell(order[descendant].element_type, cell_args[descendant])
+                    for descendant in range(index + 1, index + cells[index])
+                )
+                new_fragments[key] = fragment
+                self.fragment_stats['serialized'] += cells[index]
+            else:
+                self.fragment_stats['serialized'] += 1
+                self.fragment_stats['reused'] += cells[index] - 1
+            yield fragment
+            index += cells[index]
         
-        # Рекурсивно добавляем всех детей
-        for child_layout in layout.get('children', []):
-            self._add_layout_to_xml(xml_root, child_layout)
+        cache.set_many(new_fragments)
+    
+    def _serialize_cell(self, element_type, args) -> str:
+        if element_type == COMPONENT:
+            return self.serializer.component_cell(*args)
+        return self.serializer.group_cell(*args)
+    
+    def _cell_signature(self, element_type, args) -> bytes:
+        """Аргументы сериализации ячейки для хэша фрагмента (стиль - по хэшу его содержимого)"""
+        style = args[0]
+        style_digest = self._style_digests.get(style)
+        if style_digest is None:
+            style_digest = self._style_digests[style] = hashlib.blake2b(
+                f'{style.style}\x00{style.label_template}'.encode('utf-8'), digest_size=8
+            ).hexdigest()
+        return repr((element_type, style_digest) + tuple(args[1:])).encode('utf-8')
 
     def export_element_to_drawio(self, element_id: int, element_type: str):
         """
@@ -688,17 +1216,18 @@ class DrawioExporter:
         
         Args:
             element_id: ID элемента
-            element_type: тип элемента ('ddgroup' или 'ddcomponent')
+            element_type: тип элемента ('ddgroup' или 'ddcomponent', у C2DrawioExporter -
+                          'c2group' или 'c2component')
         """
-        if element_type == 'ddgroup':
+        if element_type == self.group_element_type:
             # Экспортируем группу - используем существующий метод
             return self.export_dd_groups_to_drawio(element_id)
-        elif element_type == 'ddcomponent':
+        elif element_type == self.component_element_type:
             # Экспортируем компонент - нужно найти его родительскую группу
-            component = DdComponent.objects.get(id=element_id)
-            if component.group:
+            component = self.tree_class.component_model.objects.select_related('type').get(id=element_id)
+            if component.group_id:
                 # Экспортируем группу, содержащую этот компонент
-                return self.export_dd_groups_to_drawio(component.group.id)
+                return self.export_dd_groups_to_drawio(component.group_id)
             else:
                 # Компонент без группы - создаем минимальную диаграмму только с компонентом
                 return self._export_standalone_component(component)
@@ -709,81 +1238,133 @@ class DrawioExporter:
         """
         Экспортирует отдельный компонент без группы
         """
-        # Создаем корневую структуру XML
-        root = self._create_xml_structure()
-        
-        # Получаем корневой элемент для добавления компонента
-        mxgraph_model = root.find('.//mxGraphModel')
-        mxgraph_root = mxgraph_model.find('root')
-        
         # Создаем layout для компонента
-        component_style = DrawioPalette.get_component_style(component)
-        component_layout = {
-            'id': self.current_id,
-            'element_type': 'component',
-            'component': component,
-            'name': component.name,
-            'x': 0,
-            'y': 0,
-            'width': component_style.width,
-            'height': component_style.height,
-            'parent': '1',
-            'children': []
-        }
-        self.current_id += 1
-        
-        # Добавляем компонент в XML
-        self._add_layout_to_xml(mxgraph_root, component_layout)
+        component_style = self._component_style(component)
+        component_layout = LayoutNode(
+            self._cell_id(COMPONENT, component), COMPONENT, component,
+            0, 0, component_style.width, component_style.height, ROOT_CELL_ID,
+        )
         
-        return self._xml_to_string(root)
+        return self._render_document(self._iter_layout_cells(component_layout))
 
     def export_multiple_elements_to_drawio(self, elements: List[dict]):
         """
         Экспортирует несколько элементов в формат Draw.io
         
+        Все элементы загружаются заранее фиксированным числом запросов.
+        Если часть элементов не найдена, выбрасывается ElementsNotFound со
+        списком всех отсутствующих. Вложенные и повторяющиеся элементы
+        (группа внутри выбранной группы, компонент выбранной группы)
+        размещаются один раз - в составе поддерева.
+        
         Args:
             elements: список элементов в формате [{"id": 1, "type": "ddgroup"}, {"id": 2, "type": "ddcomponent"}]
         """
-        # Создаем корневую структуру XML
-        root = self._create_xml_structure()
+        group_type, component_type = self.group_element_type, self.component_element_type
+        group_ids = [element_info['id'] for element_info in elements if element_info['type'] == group_type]
+        component_ids = [element_info['id'] for element_info in elements if element_info['type'] == component_type]
+        
+        # Загружаем поддеревья всех запрошенных групп и все компоненты одним набором запросов
+        self._load_tree(group_ids)
+        component_model = self.tree_class.component_model
+        components = component_model.objects.select_related('type').in_bulk(component_ids) if component_ids else {}
         
-        # Получаем корневой элемент для добавления элементов
-        mxgraph_model = root.find('.//mxGraphModel')
-        mxgraph_root = mxgraph_model.find('root')
+        missing = []
+        for element_info in elements:
+            if element_info['type'] == group_type:
+                found = element_info['id'] in self.tree.groups
+            elif element_info['type'] == component_type:
+                found = element_info['id'] in components
+            else:
+                continue
+            if not found and element_info not in missing:
+                missing.append(element_info)
+        if missing:
+            raise ElementsNotFound(missing)
         
         # Обрабатываем каждый элемент
+        cells = []
         start_x = 0
-        for element_info in elements:
-            element_id = element_info['id']
-            element_type = element_info['type']
-            
-            if element_type == 'ddgroup':
+        distinct_elements = list(self._select_distinct_elements(elements, components))
+        for index, (element_type, element) in enumerate(distinct_elements):
+            if element_type == group_type:
                 # Экспортируем группу
-                group = DdGroup.objects.get(id=element_id)
-                group_layout = self._calculate_group_layout(group, start_x, 0)
-                self._add_layout_to_xml(mxgraph_root, group_layout)
-                start_x += group_layout['width'] + self.group_spacing
+                group_layout = self._calculate_group_layout(element, start_x, 0)
+                cells.extend(self._iter_layout_cells(group_layout))
+                start_x += group_layout.width + self.group_spacing
                 
-            elif element_type == 'ddcomponent':
+            elif element_type == component_type:
                 # Экспортируем компонент
-                component = DdComponent.objects.get(id=element_id)
-                component_style = DrawioPalette.get_component_style(component)
+                component_style = self._component_style(element)
                 
-                component_layout = {
-                    'id': self.current_id,
-                    'element_type': 'component',
-                    'component': component,
-                    'name': component.name,
-                    'x': start_x,
-                    'y': 0,
-                    'width': component_style.width,
-                    'height': component_style.height,
-                    'parent': '1',
-                    'children': []
-                }
-                self.current_id += 1
+                component_layout = LayoutNode(
+                    self._cell_id(COMPONENT, element), COMPONENT, element,
+                    start_x, 0, component_style.width, component_style.height, ROOT_CELL_ID,
+                )
+                if self.link_endpoint_type == COMPONENT:
+                    self._endpoint_cells[element.id] = component_layout.id
                 
-                self._add_layout_to_xml(mxgraph_root, component_layout)
+                cells.extend(self._iter_layout_cells(component_layout))
                 start_x += component_style.width + self.group_spacing
+            self._report_progress(index + 1, len(distinct_elements))
         
-        return self._xml_to_string(root) 
\ No newline at end of file
+        cells.extend(self._iter_link_cells())
+        
+        return self._render_document(cells)
+    
+    def _select_distinct_elements(self, elements: List[dict], components: Dict[int, object]):
+        """
+        Отбирает элементы, которые нужно разместить отдельно, в порядке запроса:
+        без повторов, групп внутри других выбранных групп и компонентов,
+        входящих в поддеревья выбранных групп.
+        
+        Returns:
+            Список [('ddgroup' | 'ddcomponent', объект)] (у C2DrawioExporter - типы C2)
+        """
+        group_type, component_type = self.group_element_type, self.component_element_type
+        requested_groups = {
+            element_info['id'] for element_info in elements if element_info['type'] == group_type
+        }
+        # Группа, у которой выбран кто-то из предков, уже входит в его поддерево
+        top_groups = {
+            group_id for group_id in requested_groups
+            if not any(
+                ancestor.id in requested_groups
+                for ancestor in self.tree.get_path_to_root(self.tree.groups[group_id])[:-1]
+            )
+        }
+        covered_groups = self.tree.get_subtree_ids(top_groups)
+        
+        selected = []
+        seen = set()
+        for element_info in elements:
+            key = (element_info['type'], element_info['id'])
+            if key in seen:
+                continue
+            seen.add(key)
+            
+            if element_info['type'] == group_type and element_info['id'] in top_groups:
+                selected.append((group_type, self.tree.groups[element_info['id']]))
+            elif element_info['type'] == component_type:
+                component = components[element_info['id']]
+                if component.group_id not in covered_groups:
+                    selected.append((component_type, component))
+        return selected
+
+
+class ElementsNotFound(LookupError):
+    """Часть элементов для экспорта не найдена"""
+    
+    def __init__(self, missing: List[dict]):
+        self.missing = missing
+        super().__init__(
+            "Элементы не найдены: "
+            + ', '.join(f"{element_info['type']} {element_info['id']}" for element_info in missing)
+        )
+
+
+def get_link_label(link) -> str:
+    """Подпись связи: протокол и порты, например 'HTTPS :443, :8443'"""
+    if not link.ports:
+        return link.protocol
+    return f"{link.protocol} " + ', '.join(f':{port}' for port in link.ports)
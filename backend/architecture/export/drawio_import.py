@@ -0,0 +1,370 @@
+"""
+Импорт документов drawio в группы и компоненты DD
+
+Документ читается потоково (iterparse): ячейки обрабатываются по мере
+разбора и сразу удаляются из дерева ElementTree, сжатые страницы
+распаковываются и разбираются по одной. В памяти остаются только компактные
+записи вершин (ID, родитель и атрибуты C4), а строки пишутся в базу пакетами
+bulk_create в одной транзакции: группы - по уровням вложенности, чтобы ID
+родителей были известны, затем компоненты.
+"""
+
+import io
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from django.db import transaction
+
+from ..bulk import _bulk_create, _check_fields
+from ..models import ComponentType, DdComponent, DdGroup, DdGroupType
+from .cache import bump_model_version, bump_table_version
+from .compression import decompress_diagram
+from .layout_cache import LayoutCache, bump_layout_generation
+from .styles import bump_component_styles_version
+from .tree_loader import SUMMARY_PREFIX
+
+
+IMPORT_BATCH_SIZE = 1000
+# Сколько некорректных ячеек перечисляется в тексте DrawioImportError
+MAX_REPORTED_ERRORS = 10
+
+# Атрибуты C4, которые переносятся в модель
+C4_ATTRIBUTES = ('c4Name', 'c4Type', 'c4Technology', 'c4Description', 'c4Instances', 'c4Specifications')
+# Значения, которые экспорт подставляет вместо пустых полей
+DEFAULT_GROUP_TYPE = 'Unknown Type'
+DEFAULT_COMPONENT_TYPE = 'Component'
+TECHNOLOGY_PLACEHOLDER = 'Technology'
+DESCRIPTION_PLACEHOLDER = 'Description'
+
+OBJECT_TAGS = ('object', 'UserObject')
+
+
+class DrawioImportError(ValueError):
+    """Документ drawio не удалось разобрать"""
+
+
+class DrawioCell(NamedTuple):
+    """Вершина диаграммы: номер страницы, ID ячейки, ID родителя и атрибуты C4"""
+    page: int
+    id: str
+    parent: Optional[str]
+    attributes: Dict[str, str]
+
+
+class ImportResult(NamedTuple):
+    """Число созданных строк и компонентов, пропущенных без группы"""
+    groups: int
+    components: int
+    group_types: int
+    component_types: int
+    skipped_components: int
+
+
+def iter_drawio_cells(source) -> Iterator[DrawioCell]:
+    """
+    Потоково читает вершины документа drawio (путь или файловый объект
+    в двоичном режиме), включая сжатые страницы. Связи пропускаются.
+    """
+    try:
+        yield from _iter_cells(ET.iterparse(source, events=('start', 'end')))
+    except ET.ParseError as e:
+        raise DrawioImportError(f"Некорректный XML: {e}")
+
+
+def _iter_cells(events, page: Optional[int] = None) -> Iterator[DrawioCell]:
+    """
+    Вершины из событий iterparse. page=None - документ mxfile (страницы
+    считаются по <diagram>), иначе - распакованная модель страницы page.
+    """
+    current_page = page or 0
+    graph_root = None
+    object_attributes = None
+    object_cell = None
+
+    for event, element in events:
+        tag = element.tag
+        if event == 'start':
+            if tag == 'root':
+                graph_root = element
+            elif tag in OBJECT_TAGS:
+                # Атрибуты копируются: clear() очищает их у элемента
+                object_attributes = dict(element.attrib)
+            continue
+
+        if tag == 'mxCell':
+            if object_attributes is not None:
+                object_cell = dict(element.attrib)
+                continue
+            cell = _make_cell(current_page, element.attrib, element.attrib)
+            _release(graph_root, element)
+        elif tag in OBJECT_TAGS:
+            cell = _make_cell(current_page, object_attributes, object_cell or {})
+            object_attributes = object_cell = None
+            _release(graph_root, element)
+        elif tag == 'diagram' and page is None:
+            text = (element.text or '').strip()
+            if text:
+                try:
+                    model = decompress_diagram(text)
+                except (ValueError, UnicodeDecodeError) as e:
+                    raise DrawioImportError(f"Не удалось распаковать страницу {current_page + 1}: {e}")
+                yield from _iter_cells(ET.iterparse(io.StringIO(model), events=('start', 'end')), current_page)
+            element.clear()
+            current_page += 1
+            continue
+        else:
+            if tag == 'root':
+                graph_root = None
+            continue
+
+        if cell is not None:
+            yield cell
+
+
+def _make_cell(page: int, attributes, cell_attributes) -> Optional[DrawioCell]:
+    """Запись вершины или None для связей и служебных ячеек (слоев)"""
+    if cell_attributes.get('vertex') != '1' or 'id' not in attributes:
+        return None
+    return DrawioCell(
+        page,
+        attributes['id'],
+        cell_attributes.get('parent'),
+        {name: attributes[name] for name in C4_ATTRIBUTES if name in attributes},
+    )
+
+
+def _release(graph_root, element) -> None:
+    """Удаляет обработанную ячейку из дерева, чтобы разбор шел в ограниченной памяти"""
+    element.clear()
+    if graph_root is not None:
+        try:
+            graph_root.remove(element)
+        except ValueError:
+            pass
+
+
+def parse_instances(value: Optional[str]) -> int:
+    """Число экземпляров из c4Instances: 'n' - 0 (как при экспорте), пусто или не число - 1"""
+    value = (value or '').strip()
+    if value == 'n':
+        return 0
+    try:
+        return int(value)
+    except ValueError:
+        return 1
+
+
+def parse_specifications(value: Optional[str]):
+    """
+    Тип и спецификация группы из c4Specifications: при экспорте первая строка -
+    тип, остальные - спецификация (сводка свернутой группы отбрасывается)
+    """
+    lines = (value or '').split('\n')
+    type_name = lines[0].strip() or DEFAULT_GROUP_TYPE
+    specification = [line for line in lines[1:] if not line.startswith(SUMMARY_PREFIX)]
+    return type_name, '\n'.join(specification).strip()
+
+
+class DrawioImporter:
+    """
+    Импорт вершин C4 из документа drawio в DdGroup и DdComponent.
+
+    Вершина с c4Instances или c4Specifications - группа, с c4Type или
+    c4Technology (кроме связей) - компонент. Родитель - ближайшая группа
+    среди ячеек-предков; группы без такого родителя становятся корневыми
+    (или детьми root_group_id), компоненты без группы пропускаются.
+    Типы групп и компонентов ищутся по названию, недостающие создаются.
+    """
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+
+    def import_file(self, source, root_group_id: Optional[int] = None) -> ImportResult:
+        """
+        Импортирует документ (путь или файловый объект в двоичном режиме).
+        Выбрасывает DrawioImportError для некорректного документа (в том числе
+        для ячеек, значения которых не помещаются в поля модели - до записи) и
+        DdGroup.DoesNotExist, если root_group_id не найдена.
+        """
+        if root_group_id is not None and not DdGroup.objects.filter(pk=root_group_id).exists():
+            raise DdGroup.DoesNotExist(f"Группа DD с ID {root_group_id} не найдена")
+
+        # Родитель каждой вершины {(страница, ID): ID родителя} - для поиска ближайшей группы
+        parents = {}
+        groups = {}
+        components = []
+        for cell in iter_drawio_cells(source):
+            key = (cell.page, cell.id)
+            parents[key] = cell.parent
+            attributes = cell.attributes
+            if 'c4Instances' in attributes or 'c4Specifications' in attributes:
+                type_name, specification = parse_specifications(attributes.get('c4Specifications'))
+                groups[key] = (
+                    attributes.get('c4Name', ''), type_name,
+                    parse_instances(attributes.get('c4Instances')), specification,
+                )
+            elif ('c4Type' in attributes or 'c4Technology' in attributes) and attributes.get('c4Type') != 'Relationship':
+                technology = attributes.get('c4Technology', '')
+                description = attributes.get('c4Description', '')
+                components.append((
+                    key, attributes.get('c4Name', ''), attributes.get('c4Type') or DEFAULT_COMPONENT_TYPE,
+                    '' if technology == TECHNOLOGY_PLACEHOLDER else technology,
+                    '' if description == DESCRIPTION_PLACEHOLDER else description,
+                ))
+
+        self._check_cells(
+            DdGroup,
+            ((key, {'name': name, 'instances': instances, 'specification': specification})
+             for key, (name, _, instances, specification) in groups.items()),
+        )
+        self._check_cells(
+            DdComponent,
+            ((key, {'name': name, 'technology': technology, 'description': description})
+             for key, name, _, technology, description in components),
+        )
+        self._check_cells(
+            DdGroupType, (((None, name), {'name': name}) for name in {group[1] for group in groups.values()})
+        )
+        self._check_cells(
+            ComponentType, (((None, name), {'name': name}) for name in {component[2] for component in components})
+        )
+
+        group_parents = {key: self._parent_group(key, parents, groups) for key in groups}
+        component_groups = [self._parent_group(component[0], parents, groups) for component in components]
+        parents = None
+
+        with transaction.atomic():
+            group_types, created_group_types = self._get_or_create_types(
+                DdGroupType, (group[1] for group in groups.values())
+            )
+            component_types, created_component_types = self._get_or_create_types(
+                ComponentType, (component[2] for component in components)
+            )
+            group_ids = self._create_groups(groups, group_parents, group_types, root_group_id)
+
+            skipped = 0
+            created_components = 0
+            batch = []
+            for (key, name, type_name, technology, description), group_key in zip(components, component_groups):
+                # Группы в цикле вложенности не создаются - их компоненты тоже пропускаются
+                group_id = group_ids.get(group_key) if group_key is not None else root_group_id
+                if group_id is None:
+                    skipped += 1
+                    continue
+                batch.append(DdComponent(
+                    name=name, type_id=component_types[type_name], technology=technology,
+                    description=description, group_id=group_id,
+                ))
+                if len(batch) >= self.batch_size:
+                    created_components += len(DdComponent.objects.bulk_create(batch))
+                    batch = []
+            if batch:
+                created_components += len(DdComponent.objects.bulk_create(batch))
+
+            self._invalidate_caches(root_group_id, bool(created_component_types))
+
+        return ImportResult(len(group_ids), created_components, created_group_types, created_component_types, skipped)
+
+    def _check_cells(self, model, cells: Iterable[Tuple[tuple, dict]]) -> None:
+        """
+        Проверяет поля будущих строк model до записи, как пакетные операции API
+        (длина, пустые значения). cells - пары (ключ ячейки (страница, ID), поля);
+        у типов вместо страницы None, а вместо ID ячейки - название типа.
+        Выбрасывает DrawioImportError с перечнем некорректных ячеек.
+        """
+        errors = []
+        batch = []
+
+        def check():
+            for error in _check_fields(model, [model(**fields) for _, fields in batch]):
+                page, cell_id = batch[error['index']][0]
+                if page is None:
+                    place = f"{model._meta.verbose_name} «{cell_id[:50]}»"
+                else:
+                    place = f"страница {page + 1}, ячейка {cell_id}"
+                errors.append(f"{place}, поле {error['field']}: {error['detail']}")
+
+        for cell in cells:
+            batch.append(cell)
+            if len(batch) >= self.batch_size:
+                check()
+                batch = []
+        if batch:
+            check()
+        if errors:
+            raise DrawioImportError(
+                f"Некорректные ячейки ({len(errors)}): " + "; ".join(errors[:MAX_REPORTED_ERRORS])
+            )
+
+    @staticmethod
+    def _parent_group(key, parents, groups):
+        """Ближайшая группа среди предков ячейки (ячейки-контейнеры без C4 пропускаются)"""
+        page = key[0]
+        visited = {key}
+        parent_id = parents.get(key)
+        while parent_id is not None:
+            parent_key = (page, parent_id)
+            if parent_key in groups:
+                return parent_key
+            if parent_key in visited:
+                return None
+            visited.add(parent_key)
+            parent_id = parents.get(parent_key)
+        return None
+
+    def _get_or_create_types(self, model, names: Iterable[str]):
+        """Типы по названию {название: id} и число созданных типов"""
+        names = set(names)
+        types = {}
+        for type_id, name in model.objects.filter(name__in=names).order_by('-id').values_list('id', 'name'):
+            types[name] = type_id
+        missing = sorted(names - set(types))
+        for start in range(0, len(missing), self.batch_size):
+            for item in _bulk_create(model, [model(name=name) for name in missing[start:start + self.batch_size]]):
+                types[item.name] = item.pk
+        return types, len(missing)
+
+    def _create_groups(self, groups, group_parents, group_types, root_group_id) -> Dict[tuple, int]:
+        """
+        Создает группы по уровням вложенности пакетами bulk_create:
+        к началу уровня ID всех родителей уже известны
+        """
+        children = {}
+        for key, parent_key in group_parents.items():
+            children.setdefault(parent_key, []).append(key)
+
+        group_ids = {}
+        level = children.get(None, [])
+        while level:
+            next_level = []
+            for start in range(0, len(level), self.batch_size):
+                keys = level[start:start + self.batch_size]
+                batch = []
+                for key in keys:
+                    name, type_name, instances, specification = groups[key]
+                    parent_key = group_parents[key]
+                    batch.append(DdGroup(
+                        name=name, type_id=group_types[type_name], instances=instances,
+                        specification=specification,
+                        parent_id=root_group_id if parent_key is None else group_ids[parent_key],
+                    ))
+                for key, group in zip(keys, _bulk_create(DdGroup, batch)):
+                    group_ids[key] = group.pk
+                    next_level.extend(children.get(key, []))
+            level = next_level
+        return group_ids
+
+    @staticmethod
+    def _invalidate_caches(root_group_id, component_types_created: bool) -> None:
+        """
+        bulk_create не вызывает сигналы: версии кэша экспорта, таблиц (ETag
+        списков) и layout обновляются так же, как это сделали бы сигналы
+        """
+        bump_model_version()
+        for model in (DdGroupType, ComponentType, DdGroup, DdComponent):
+            bump_table_version(model._meta.db_table)
+        if root_group_id is not None:
+            LayoutCache().invalidate([root_group_id])
+        if component_types_created:
+            bump_component_styles_version()
+            bump_layout_generation()
@@ -0,0 +1,63 @@
+"""
+Кэш сериализованного XML поддеревьев групп
+"""
+
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+# Версия формата ячеек: увеличивается при изменении сериализации,
+# чтобы не использовать фрагменты, сохраненные в прежнем формате
+FRAGMENT_FORMAT_VERSION = 1
+
+
+class FragmentCache:
+    """
+    Персистентный кэш XML потомков группы (ячейки всего поддерева без самой группы).
+
+    Ключ фрагмента - сериализатор и хэш содержимого поддерева (аргументы
+    сериализации всех ячеек потомков), поэтому инвалидация не нужна:
+    измененное поддерево получает новый ключ, а неиспользуемые записи
+    вытесняет бэкенд кэша.
+    """
+
+    def __init__(self, serializer: str, alias: Optional[str] = None):
+        """
+        Args:
+            serializer: имя сериализатора ячеек - фрагменты разных сериализаторов
+                        хранятся под разными ключами
+            alias: алиас кэша Django (по умолчанию EXPORT_FRAGMENT_CACHE_ALIAS)
+        """
+        self.serializer = serializer
+        self.alias = alias or getattr(settings, 'EXPORT_FRAGMENT_CACHE_ALIAS', 'fragments')
+        self.timeout = getattr(settings, 'EXPORT_FRAGMENT_CACHE_TIMEOUT', None)
+        # Поддеревья меньше min_cells ячеек сериализуются быстрее, чем читаются
+        # из кэша; больше max_cells - кэшируются по частям (своими поддеревьями)
+        self.min_cells = getattr(settings, 'EXPORT_FRAGMENT_CACHE_MIN_CELLS', 10)
+        self.max_cells = getattr(settings, 'EXPORT_FRAGMENT_CACHE_MAX_CELLS', 5000)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _make_key(self, key: str) -> str:
+        return f'drawio_fragment:{FRAGMENT_FORMAT_VERSION}:{self.serializer}:{key}'
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Возвращает найденные фрагменты {key: xml}"""
+        cache_keys = {self._make_key(key): key for key in keys}
+        if not cache_keys:
+            return {}
+        found = self.cache.get_many(list(cache_keys))
+        return {cache_keys[cache_key]: fragment for cache_key, fragment in found.items()}
+
+    def set_many(self, fragments: Dict[str, str]) -> None:
+        """Сохраняет фрагменты {key: xml}"""
+        if not fragments:
+            return
+        self.cache.set_many(
+            {self._make_key(key): fragment for key, fragment in fragments.items()},
+            self.timeout,
+        )
@@ -0,0 +1,277 @@
+"""
+Асинхронные задания экспорта в drawio
+
+Задание создается запросом к API и выполняется отдельным процессом
+(management-команда export_worker), без внешнего брокера: очередью
+служит таблица ExportJob.
+
+Воркер держит аренду задания, обновляя heartbeat_at. Задание running,
+аренда которого истекла (процесс воркера завершился аварийно), переводится
+в failed при следующей постановке или выборке заданий. Завершенные задания
+вместе с файлами удаляются через EXPORT_JOB_RETENTION.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from ..models import ExportJob
+from .c2_export import EXPORTER_CLASSES, get_exporter_class
+from .drawio_export import DrawioExporter
+from .packing import DEFAULT_PACKING_STRATEGY
+
+
+# Прогресс задания, %: выбрано воркером, начат расчет, документ построен.
+# Между началом расчета и построением документа прогресс растет после
+# каждой корневой группы, страницы или элемента (progress экспортера)
+PROGRESS_CLAIMED = 5
+PROGRESS_RENDER_STARTED = 10
+PROGRESS_RENDERED = 90
+
+# Аренда задания (секунды) и срок хранения завершенных заданий, если они не заданы в настройках
+EXPORT_JOB_LEASE_TIMEOUT = 300
+EXPORT_JOB_RETENTION = 7 * 24 * 3600
+
+
+def _make_exporter(params, exporter_class=DrawioExporter, progress=None):
+    return exporter_class(
+        compressed=params.get('compressed', False),
+        packing=params.get('packing', DEFAULT_PACKING_STRATEGY),
+        max_depth=params.get('max_depth'),
+        collapse_threshold=params.get('collapse_threshold'),
+        progress=progress,
+    )
+
+
+def _render_element(params, progress=None):
+    exporter = _make_exporter(params, EXPORTER_CLASSES[params['element_type']], progress)
+    return exporter.export_element_to_drawio(params['element_id'], params['element_type'])
+
+
+def _render_multiple(params, progress=None):
+    exporter = _make_exporter(params, get_exporter_class(element['type'] for element in params['elements']), progress)
+    return exporter.export_multiple_elements_to_drawio(params['elements'])
+
+
+def _render_all(params, progress=None):
+    exporter = _make_exporter(params, progress=progress)
+    if params.get('pages'):
+        return exporter.export_pages_to_drawio(params.get('root_group_id'), params.get('page_depth', 0))
+    return exporter.export_dd_groups_to_drawio(params.get('root_group_id'))
+
+
+# Виды экспорта и функции, выполняющие их через DrawioExporter
+EXPORT_RENDERERS = {
+    'element': _render_element,
+    'multiple': _render_multiple,
+    'all': _render_all,
+}
+
+
+def get_jobs_dir() -> Path:
+    """Каталог для готовых файлов заданий (создается при необходимости)"""
+    jobs_dir = Path(getattr(settings, 'EXPORT_JOBS_DIR', Path(settings.BASE_DIR) / 'export_jobs'))
+    jobs_dir.mkdir(parents=True, exist_ok=True)
+    return jobs_dir
+
+
+def make_params_hash(kind: str, params: dict) -> str:
+    payload = json.dumps({'kind': kind, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def submit_export_job(kind: str, params: dict):
+    """
+    Ставит задание экспорта в очередь.
+
+    Если такое же задание (те же вид и параметры) уже ожидает или выполняется,
+    возвращается оно. Возвращает (job, created).
+    """
+    if kind not in EXPORT_RENDERERS:
+        raise ValueError(f"Неподдерживаемый вид экспорта: {kind}")
+
+    # Задание прерванного воркера не должно считаться активным
+    expire_stale_jobs()
+    params_hash = make_params_hash(kind, params)
+    active = ExportJob.objects.filter(params_hash=params_hash, status__in=ExportJob.ACTIVE_STATUSES)
+
+    existing = active.first()
+    if existing is not None:
+        return existing, False
+
+    try:
+        with transaction.atomic():
+            return ExportJob.objects.create(kind=kind, params=params, params_hash=params_hash), True
+    except IntegrityError:
+        # Параллельный запрос успел создать такое же задание
+        return active.get(), False
+
+
+def _lease_timeout() -> int:
+    return getattr(settings, 'EXPORT_JOB_LEASE_TIMEOUT', EXPORT_JOB_LEASE_TIMEOUT)
+
+
+def expire_stale_jobs() -> int:
+    """
+    Переводит в failed задания running, воркер которых не обновлял
+    heartbeat_at дольше EXPORT_JOB_LEASE_TIMEOUT. Возвращает их число.
+    """
+    now = timezone.now()
+    return ExportJob.objects.filter(
+        status=ExportJob.STATUS_RUNNING,
+        heartbeat_at__lt=now - timedelta(seconds=_lease_timeout()),
+    ).update(
+        status=ExportJob.STATUS_FAILED,
+        error="Воркер перестал отвечать, задание прервано",
+        finished_at=now,
+    )
+
+
+def claim_next_job() -> Optional[ExportJob]:
+    """
+    Забирает самое старое ожидающее задание. Смена статуса выполняется
+    условным UPDATE, поэтому одно задание не достанется двум воркерам.
+    Перед выборкой истекшие аренды переводятся в failed.
+    """
+    expire_stale_jobs()
+    while True:
+        job_id = (
+            ExportJob.objects.filter(status=ExportJob.STATUS_PENDING)
+            .order_by('id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+
+        now = timezone.now()
+        claimed = ExportJob.objects.filter(id=job_id, status=ExportJob.STATUS_PENDING).update(
+            status=ExportJob.STATUS_RUNNING,
+            progress=PROGRESS_CLAIMED,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            return ExportJob.objects.get(id=job_id)
+
+
+def _set_progress(job: ExportJob, progress: int) -> None:
+    """Сохраняет прогресс (только изменившийся) и продлевает аренду"""
+    if progress == job.progress:
+        return
+    job.progress = progress
+    ExportJob.objects.filter(id=job.id).update(progress=progress, heartbeat_at=timezone.now())
+
+
+class JobHeartbeat:
+    """
+    Продлевает аренду задания из фонового потока, пока выполняется блок
+    with: расчет одной большой корневой группы может занимать дольше
+    EXPORT_JOB_LEASE_TIMEOUT без обновлений прогресса
+    """
+
+    def __init__(self, job_id: int, interval: Optional[float] = None):
+        self.job_id = job_id
+        self.interval = _lease_timeout() / 3 if interval is None else interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'export-job-{job_id}-heartbeat', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                ExportJob.objects.filter(id=self.job_id, status=ExportJob.STATUS_RUNNING).update(
+                    heartbeat_at=timezone.now()
+                )
+        finally:
+            # Соединения потока с базой данных не переживают его
+            connections.close_all()
+
+
+def run_export_job(job_id: int) -> str:
+    """
+    Выполняет задание, уже переведенное в статус running, и сохраняет
+    результат в файл. Возвращает итоговый статус.
+    """
+    job = ExportJob.objects.get(id=job_id)
+
+    def progress(done, total):
+        _set_progress(
+            job, PROGRESS_RENDER_STARTED + (PROGRESS_RENDERED - PROGRESS_RENDER_STARTED) * done // total
+        )
+
+    try:
+        _set_progress(job, PROGRESS_RENDER_STARTED)
+        with JobHeartbeat(job.id):
+            xml_content = EXPORT_RENDERERS[job.kind](job.params, progress)
+
+        _set_progress(job, PROGRESS_RENDERED)
+        result_path = get_jobs_dir() / f'export_job_{job.id}.drawio'
+        tmp_path = result_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(xml_content)
+        os.replace(tmp_path, result_path)
+
+        job.status = ExportJob.STATUS_DONE
+        job.progress = 100
+        job.result_path = str(result_path)
+    except Exception as e:
+        job.status = ExportJob.STATUS_FAILED
+        job.error = f"{type(e).__name__}: {e}"
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'progress', 'result_path', 'error', 'finished_at'])
+    return job.status
+
+
+def cleanup_finished_jobs() -> int:
+    """
+    Удаляет задания, завершенные раньше чем EXPORT_JOB_RETENTION назад,
+    вместе с файлами результатов, а также временные файлы прерванных
+    заданий того же возраста. Возвращает число удаленных заданий.
+    """
+    retention = getattr(settings, 'EXPORT_JOB_RETENTION', EXPORT_JOB_RETENTION)
+    deadline = timezone.now() - timedelta(seconds=retention)
+    expired = dict(
+        ExportJob.objects.filter(
+            status__in=(ExportJob.STATUS_DONE, ExportJob.STATUS_FAILED),
+            finished_at__lt=deadline,
+        ).values_list('id', 'result_path')
+    )
+    for result_path in expired.values():
+        if result_path:
+            Path(result_path).unlink(missing_ok=True)
+    ExportJob.objects.filter(id__in=expired).delete()
+
+    for tmp_path in get_jobs_dir().glob('export_job_*.tmp'):
+        if tmp_path.stat().st_mtime < time.time() - retention:
+            tmp_path.unlink(missing_ok=True)
+    return len(expired)
+
+
+def get_download_filename(job: ExportJob) -> str:
+    """Имя файла для скачивания - такое же, как у синхронного экспорта"""
+    params = job.params
+    if job.kind == 'element':
+        return f"{params['element_type']}_{params['element_id']}.drawio"
+    if job.kind == 'multiple':
+        return 'multiple_elements.drawio'
+    if params.get('root_group_id'):
+        return f"dd_groups_from_{params['root_group_id']}.drawio"
+    return 'all_dd_groups.drawio'
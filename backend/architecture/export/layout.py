@@ -0,0 +1,89 @@
+"""
+Узлы дерева layout экспорта
+
+Расчет layout создает по узлу на каждую группу и компонент, поэтому узлы
+хранят только необходимые поля в __slots__ (без словаря атрибутов),
+а у компонентов вместо списка детей - общий пустой кортеж.
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+
+GROUP = 'group'
+COMPONENT = 'component'
+
+NO_CHILDREN = ()
+
+
+class GridPlacement:
+    """Размещение детей одинакового размера сеткой"""
+
+    __slots__ = ('cols', 'rows', 'max_child_width', 'max_child_height')
+
+    layout_type = 'grid'
+
+    def __init__(self, cols: int, rows: int, max_child_width: int, max_child_height: int):
+        self.cols = cols
+        self.rows = rows
+        self.max_child_width = max_child_width
+        self.max_child_height = max_child_height
+
+
+class PackedPlacement:
+    """
+    Размещение детей разного размера алгоритмом упаковки:
+    positions - список (индекс ребенка, x, y) относительно области содержимого
+    """
+
+    __slots__ = ('positions', 'content_width', 'content_height')
+
+    layout_type = 'bin_packing'
+
+    def __init__(self, positions: List[Tuple[int, int, int]], content_width: int, content_height: int):
+        self.positions = positions
+        self.content_width = content_width
+        self.content_height = content_height
+
+
+class SizeNode:
+    """
+    Результат прохода снизу вверх: размер элемента (группы или компонента),
+    размеры его детей и их размещение (None у листьев)
+    """
+
+    __slots__ = ('element_type', 'element', 'width', 'height', 'children', 'placement')
+
+    def __init__(self, element_type: str, element, width: int, height: int,
+                 children: Sequence['SizeNode'] = NO_CHILDREN, placement=None):
+        self.element_type = element_type
+        self.element = element
+        self.width = width
+        self.height = height
+        self.children = children
+        self.placement = placement
+
+
+class LayoutNode:
+    """
+    Результат прохода сверху вниз: ячейка диаграммы с ID, координатами
+    относительно родителя и ID ячейки родителя
+    """
+
+    __slots__ = ('id', 'element_type', 'element', 'x', 'y', 'width', 'height', 'parent', 'children')
+
+    def __init__(self, cell_id: int, element_type: str, element, x: int, y: int, width: int, height: int,
+                 parent: Optional[object] = None):
+        self.id = cell_id
+        self.element_type = element_type
+        self.element = element
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.parent = parent
+        # Компоненты детей не имеют
+        self.children = [] if element_type == GROUP else NO_CHILDREN
+
+    @property
+    def name(self) -> str:
+        return self.element.name
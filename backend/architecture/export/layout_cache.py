@@ -0,0 +1,175 @@
+"""
+Кэш рассчитанных размеров и размещения детей групп DD
+"""
+
+import hashlib
+import json
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from ..models import DdGroup
+from .cache import bump_version, get_version
+from .layout import GROUP, GridPlacement, PackedPlacement, SizeNode
+
+
+# Поколение кэша layout. Увеличивается при изменениях, влияющих на размеры
+# всех групп сразу (например, изменение ComponentType меняет стили компонентов)
+LAYOUT_GENERATION_KEY = 'architecture:layout_generation'
+
+
+def layout_cache_enabled() -> bool:
+    """
+    Включен ли кэш layout (EXPORT_LAYOUT_CACHE_ENABLED). Выключенный кэш не
+    стоит запросов: сигналы и пакетные операции не сбрасывают его записи,
+    поэтому после включения кэш layout нужно очистить
+    """
+    return getattr(settings, 'EXPORT_LAYOUT_CACHE_ENABLED', False)
+
+
+def bump_layout_generation() -> None:
+    """Делает недействительным весь кэш layout"""
+    bump_version(LAYOUT_GENERATION_KEY)
+
+
+class LayoutCache:
+    """
+    Персистентный кэш layout групп DD.
+
+    Для каждой группы хранится результат расчета размещения ее детей:
+    ширина, высота, тип layout, параметры сетки или позиции bin packing и
+    список детей, для которых он был рассчитан. Размер группы зависит только
+    от ее поддерева, поэтому при изменении группы или компонента достаточно
+    сбросить записи самой группы и ее предков - заново упаковываются только
+    O(глубина) групп.
+
+    Попадание в кэш экономит только упаковку детей: обход дерева, размеры
+    компонентов, чтение записей всех групп (get_many) и проход сверху вниз
+    по-прежнему O(размер дерева). На деревьях из 5000 групп это не дает
+    выигрыша (benchmark_export --operations all relayout), поэтому кэш
+    по умолчанию выключен (EXPORT_LAYOUT_CACHE_ENABLED).
+    """
+
+    def __init__(self, alias: Optional[str] = None, config=None):
+        """
+        Args:
+            alias: алиас кэша Django (по умолчанию EXPORT_LAYOUT_CACHE_ALIAS)
+            config: параметры экспортера, влияющие на layout. Их хэш хранится
+                    в записи: записи другой конфигурации не используются.
+                    Для инвалидации конфигурация не нужна.
+        """
+        self.alias = alias or getattr(settings, 'EXPORT_LAYOUT_CACHE_ALIAS', 'layout')
+        self.timeout = getattr(settings, 'EXPORT_LAYOUT_CACHE_TIMEOUT', None)
+        self.config_hash = hashlib.sha1(
+            json.dumps(config or {}, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _make_key(self, generation: int, group_id: int) -> str:
+        return f'drawio_layout:{generation}:{group_id}'
+
+    def get_many(self, group_ids: Iterable[int]) -> Dict[int, dict]:
+        """Возвращает записи текущей конфигурации для указанных групп {group_id: entry}"""
+        generation = get_version(LAYOUT_GENERATION_KEY)
+        keys = {self._make_key(generation, group_id): group_id for group_id in group_ids}
+        found = self.cache.get_many(list(keys))
+        return {
+            keys[key]: entry for key, entry in found.items()
+            if entry.get('config') == self.config_hash
+        }
+
+    def set_many(self, entries: Dict[int, dict]) -> None:
+        """Сохраняет записи {group_id: entry}"""
+        if not entries:
+            return
+        generation = get_version(LAYOUT_GENERATION_KEY)
+        self.cache.set_many(
+            {
+                self._make_key(generation, group_id): dict(entry, config=self.config_hash)
+                for group_id, entry in entries.items()
+            },
+            self.timeout,
+        )
+
+    def invalidate(self, group_ids: Iterable[int]) -> None:
+        """
+        Сбрасывает записи групп и всех их предков (запрос предков и версии поколения).
+        При выключенном кэше ничего не делает
+        """
+        if not layout_cache_enabled():
+            return
+        group_ids = [group_id for group_id in group_ids if group_id is not None]
+        if not group_ids:
+            return
+        affected = set(group_ids)
+        affected.update(
+            DdGroup.objects.ancestors(group_ids).values_list('id', flat=True)
+        )
+        generation = get_version(LAYOUT_GENERATION_KEY)
+        self.cache.delete_many([self._make_key(generation, group_id) for group_id in affected])
+
+    @staticmethod
+    def make_entry(size_info: SizeNode) -> dict:
+        """
+        Преобразует результат расчета размеров группы в сериализуемую запись.
+        Дети сохраняются ключами ('group' | 'component', id), объекты моделей
+        в кэш не попадают.
+        """
+        entry = {
+            'children': [child_key(child) for child in size_info.children],
+            'width': size_info.width,
+            'height': size_info.height,
+        }
+
+        placement = size_info.placement
+        if isinstance(placement, PackedPlacement):
+            entry.update({
+                'layout_type': placement.layout_type,
+                'positions': placement.positions,
+                'content_width': placement.content_width,
+                'content_height': placement.content_height,
+            })
+        elif isinstance(placement, GridPlacement):
+            entry.update({
+                'layout_type': placement.layout_type,
+                'grid_cols': placement.cols,
+                'grid_rows': placement.rows,
+                'max_child_width': placement.max_child_width,
+                'max_child_height': placement.max_child_height,
+            })
+
+        return entry
+
+    @staticmethod
+    def restore_size_info(group, children_sizes, entry: dict) -> SizeNode:
+        """
+        Восстанавливает результат расчета размеров группы из записи кэша
+        и уже рассчитанных размеров детей
+        """
+        layout_type = entry.get('layout_type')
+        if layout_type == PackedPlacement.layout_type:
+            placement = PackedPlacement(
+                [tuple(position) for position in entry['positions']],
+                entry['content_width'],
+                entry['content_height'],
+            )
+        elif layout_type == GridPlacement.layout_type:
+            placement = GridPlacement(
+                entry['grid_cols'],
+                entry['grid_rows'],
+                entry['max_child_width'],
+                entry['max_child_height'],
+            )
+        else:
+            placement = None
+
+        return SizeNode(GROUP, group, entry['width'], entry['height'], children_sizes, placement)
+
+
+def child_key(size_info: SizeNode):
+    """Ключ ребенка в записи кэша: ('group' | 'component', id, ширина, высота)"""
+    return (size_info.element_type, size_info.element.id, size_info.width, size_info.height)
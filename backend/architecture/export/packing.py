@@ -0,0 +1,243 @@
+"""
+Алгоритмы размещения детей группы разного размера (bin packing)
+
+Каждый алгоритм получает список размеров детей [(width, height)],
+отступ между элементами и максимальную ширину строки и возвращает
+(positions, content_width, content_height), где positions - список
+(индекс ребенка, x, y) с координатами относительно области содержимого группы.
+"""
+
+import heapq
+from bisect import bisect_right
+from collections import defaultdict
+from typing import List, Sequence, Tuple
+
+
+# Стратегии размещения: grid - всегда сетка, shelf и skyline - упаковка
+# детей разного размера (дети одного размера размещаются сеткой)
+PACKING_GRID = 'grid'
+PACKING_SHELF = 'shelf'
+PACKING_SKYLINE = 'skyline'
+PACKING_STRATEGIES = (PACKING_GRID, PACKING_SHELF, PACKING_SKYLINE)
+DEFAULT_PACKING_STRATEGY = PACKING_SHELF
+
+# Элемент шире этой доли самого широкого элемента занимает отдельную строку (shelf)
+WIDE_ELEMENT_RATIO = 0.6
+
+Size = Tuple[int, int]
+PackingResult = Tuple[List[Tuple[int, int, int]], int, int]
+
+
+class _MaxSegmentTree:
+    """
+    Дерево отрезков по максимуму: поиск первой строки, в которой осталось
+    не меньше заданной ширины, за O(log n)
+    """
+
+    def __init__(self, size: int):
+        self.size = 1
+        while self.size < size:
+            self.size *= 2
+        self.tree = [float('-inf')] * (2 * self.size)
+
+    def update(self, index: int, value) -> None:
+        index += self.size
+        self.tree[index] = value
+        index //= 2
+        while index:
+            self.tree[index] = max(self.tree[2 * index], self.tree[2 * index + 1])
+            index //= 2
+
+    def find_first(self, value) -> int:
+        """Индекс первого элемента со значением >= value или -1"""
+        if self.tree[1] < value:
+            return -1
+        index = 1
+        while index < self.size:
+            index = 2 * index if self.tree[2 * index] >= value else 2 * index + 1
+        return index - self.size
+
+
+def pack_shelf(sizes: Sequence[Size], spacing: int, max_row_width: int) -> PackingResult:
+    """
+    Размещение по строкам (полкам), first fit decreasing.
+
+    Элементы обрабатываются по убыванию площади. Широкие элементы
+    (от WIDE_ELEMENT_RATIO самого широкого) занимают отдельную строку,
+    остальные попадают в первую строку, где хватает места до max_row_width.
+    Первая подходящая строка ищется деревом отрезков по оставшейся ширине,
+    поэтому расчет занимает O(n log n) вместо O(n * строки).
+    """
+    if not sizes:
+        return [], 0, 0
+
+    # Сортируем элементы по убыванию площади
+    order = sorted(range(len(sizes)), key=lambda index: sizes[index][0] * sizes[index][1], reverse=True)
+
+    # Определяем пороговую ширину - если элемент шире, он идет в отдельную строку
+    max_width = max(width for width, _ in sizes)
+    width_threshold = max_width * WIDE_ELEMENT_RATIO
+
+    rows = []
+    # Оставшаяся ширина строк для маленьких элементов (с учетом отступа перед элементом)
+    free_width = _MaxSegmentTree(len(sizes))
+
+    for index in order:
+        child_width, child_height = sizes[index]
+
+        row_index = -1 if child_width >= width_threshold else free_width.find_first(child_width)
+
+        if row_index >= 0:
+            row = rows[row_index]
+            row['elements'].append(index)
+            row['width'] += spacing + child_width
+            row['height'] = max(row['height'], child_height)
+            free_width.update(row_index, max_row_width - row['width'] - spacing)
+            continue
+
+        # Широкий элемент или не поместился - новая строка
+        is_single = child_width >= width_threshold
+        rows.append({
+            'elements': [index],
+            'width': child_width,
+            'height': child_height,
+        })
+        if not is_single:
+            free_width.update(len(rows) - 1, max_row_width - child_width - spacing)
+
+    # Преобразуем строки в позиции элементов
+    positions = []
+    current_y = 0
+    total_width = 0
+
+    for row in rows:
+        current_x = 0
+        for index in row['elements']:
+            positions.append((index, current_x, current_y))
+            current_x += sizes[index][0] + spacing
+
+        total_width = max(total_width, row['width'])
+        current_y += row['height'] + spacing
+
+    # Убираем лишний отступ снизу
+    total_height = current_y - spacing if current_y > 0 else 0
+
+    return positions, total_width, total_height
+
+
+# Поля отрезка линии горизонта
+_X, _Y, _WIDTH, _PREV, _NEXT, _ALIVE = range(6)
+
+
+def pack_skyline(sizes: Sequence[Size], spacing: int, max_row_width: int) -> PackingResult:
+    """
+    Размещение по линии горизонта (skyline, bottom-left).
+
+    Линия горизонта - набор горизонтальных отрезков, куча упорядочивает их
+    по высоте. На самый низкий отрезок ставится самый широкий из оставшихся
+    элементов, который на нем помещается (поиск по отсортированным ширинам,
+    при равной ширине - самый высокий). Если не помещается ни один, отрезок
+    поднимается до уровня соседа и сливается с ним. Каждый шаг размещает
+    элемент или уменьшает число отрезков, поэтому расчет занимает O(n log n).
+    В отличие от строк, пустоты над низкими элементами заполняются.
+    """
+    if not sizes:
+        return [], 0, 0
+
+    # Отступ учитывается как часть элемента: справа и снизу
+    container_width = max(max_row_width, max(width for width, _ in sizes)) + spacing
+
+    # Элементы по ширине; в корзине - по возрастанию высоты, чтобы pop() давал самый высокий
+    buckets = defaultdict(list)
+    for child_index in sorted(range(len(sizes)), key=lambda index: sizes[index][1]):
+        buckets[sizes[child_index][0] + spacing].append(child_index)
+    widths = sorted(buckets)
+    remaining = len(sizes)
+
+    segments = [[0, 0, container_width, None, None, True]]
+    heap = [(0, 0, 0)]
+    positions = []
+    content_width = 0
+    content_height = 0
+
+    def merge(index):
+        """Сливает отрезок с соседями той же высоты, возвращает итоговый отрезок"""
+        segment = segments[index]
+        prev_index = segment[_PREV]
+        if prev_index is not None and segments[prev_index][_Y] == segment[_Y]:
+            prev_segment = segments[prev_index]
+            prev_segment[_WIDTH] += segment[_WIDTH]
+            prev_segment[_NEXT] = segment[_NEXT]
+            if segment[_NEXT] is not None:
+                segments[segment[_NEXT]][_PREV] = prev_index
+            segment[_ALIVE] = False
+            index, segment = prev_index, prev_segment
+
+        next_index = segment[_NEXT]
+        if next_index is not None and segments[next_index][_Y] == segment[_Y]:
+            next_segment = segments[next_index]
+            segment[_WIDTH] += next_segment[_WIDTH]
+            segment[_NEXT] = next_segment[_NEXT]
+            if next_segment[_NEXT] is not None:
+                segments[next_segment[_NEXT]][_PREV] = index
+            next_segment[_ALIVE] = False
+        return index
+
+    while remaining:
+        y, x, index = heapq.heappop(heap)
+        segment = segments[index]
+        # Устаревшая запись кучи: отрезок слит, сдвинут или поднят
+        if not segment[_ALIVE] or segment[_X] != x or segment[_Y] != y:
+            continue
+
+        width_index = bisect_right(widths, segment[_WIDTH]) - 1
+        if width_index < 0:
+            # Ни один элемент не помещается - поднимаем отрезок до ближайшего соседа
+            segment[_Y] = min(
+                segments[neighbor][_Y]
+                for neighbor in (segment[_PREV], segment[_NEXT])
+                if neighbor is not None
+            )
+            index = merge(index)
+            heapq.heappush(heap, (segments[index][_Y], segments[index][_X], index))
+            continue
+
+        width = widths[width_index]
+        bucket = buckets[width]
+        child_index = bucket.pop()
+        if not bucket:
+            del widths[width_index]
+            del buckets[width]
+        remaining -= 1
+
+        child_width, child_height = sizes[child_index]
+        positions.append((child_index, x, y))
+        content_width = max(content_width, x + child_width)
+        content_height = max(content_height, y + child_height)
+
+        top = y + child_height + spacing
+        if width < segment[_WIDTH]:
+            # Элемент занимает левую часть отрезка
+            placed_index = len(segments)
+            segments.append([x, top, width, segment[_PREV], index, True])
+            if segment[_PREV] is not None:
+                segments[segment[_PREV]][_NEXT] = placed_index
+            segment[_PREV] = placed_index
+            segment[_X] += width
+            segment[_WIDTH] -= width
+            heapq.heappush(heap, (segment[_Y], segment[_X], index))
+        else:
+            placed_index = index
+            segment[_Y] = top
+
+        placed_index = merge(placed_index)
+        heapq.heappush(heap, (segments[placed_index][_Y], segments[placed_index][_X], placed_index))
+
+    return positions, content_width, content_height
+
+
+# Алгоритмы упаковки по стратегии
+PACKERS = {
+    PACKING_SHELF: pack_shelf,
+    PACKING_SKYLINE: pack_skyline,
+}
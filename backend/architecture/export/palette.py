@@ -40,6 +40,17 @@ class DrawioPalette:
             min_spacing=30
         ),
         
+        # Свернутая группа: поддерево заменено сводкой, размер - как у листовой группы
+        'dd_group_collapsed': ElementStyle(
+            width=240,
+            height=120,
+            style='rounded=1;fontSize=11;whiteSpace=wrap;html=1;arcSize=20;fillColor=#E6EEF5;strokeColor=#06315C;fontColor=#000;labelBackgroundColor=none;align=left;verticalAlign=bottom;labelBorderColor=none;spacingTop=0;spacing=10;metaEdit=1;rotatable=0;perimeter=rectanglePerimeter;noLabel=0;labelPadding=0;allowArrows=0;;connectable=1;expand=0;recursiveResize=0;editable=1;pointerEvents=0;absoluteArcSize=1;points=[[0.25,0,0],[0.5,0,0],[0.75,0,0],[1,0.25,0],[1,0.5,0],[1,0.75,0],[0.75,1,0],[0.5,1,0],[0.25,1,0],[0,0.75,0],[0,0.5,0],[0,0.25,0]];strokeWidth=2;container=0;imageAlign=right;imageVerticalAlign=bottom;direction=east;collapsible=0;',
+            label_template='<font style="font-size: 16px"><b><div style="text-align: left">%c4Name% x %c4Instances%</div></b></font><div style="text-align: left">[<span style="background-color: initial;">%c4Specifications%]</span></div>',
+            padding=30,
+            header_height=50,
+            min_spacing=30
+        ),
+        
         'dd_component': ElementStyle(
             width=240,
             height=120,
@@ -90,6 +101,78 @@ class DrawioPalette:
             min_spacing=0
         ),
         
+        'dd_link': ElementStyle(
+            width=0,  # Размеры связи определяются ее концами
+            height=0,
+            style='endArrow=blockThin;html=1;fontSize=10;fontColor=#404040;strokeWidth=1;endFill=1;strokeColor=#828282;elbow=vertical;metaEdit=1;endSize=14;startSize=14;jumpStyle=arc;jumpSize=16;rounded=0;edgeStyle=orthogonalEdgeStyle;labelBackgroundColor=#ffffff;',
+            label_template='%c4Technology%',
+            padding=0,
+            header_height=0,
+            min_spacing=0
+        ),
+        
+        # Диаграмма контейнеров C2: граница группы, внешний компонент и связь
+        'c2_group': ElementStyle(
+            width=240,
+            height=120,
+            style='rounded=0;fontSize=11;whiteSpace=wrap;html=1;dashed=1;fillColor=none;strokeColor=#666666;fontColor=#333333;labelBackgroundColor=none;align=left;verticalAlign=bottom;labelBorderColor=none;spacingTop=0;spacing=10;dashPattern=8 4;metaEdit=1;rotatable=0;perimeter=rectanglePerimeter;noLabel=0;labelPadding=0;allowArrows=0;connectable=0;expand=0;recursiveResize=0;editable=1;pointerEvents=0;points=[[0.25,0,0],[0.5,0,0],[0.75,0,0],[1,0.25,0],[1,0.5,0],[1,0.75,0],[0.75,1,0],[0.5,1,0],[0.25,1,0],[0,0.75,0],[0,0.5,0],[0,0.25,0]];strokeWidth=1;container=1;collapsible=0;',
+            label_template='<font style="font-size: 16px"><b><div style="text-align: left">%c4Name%</div></b></font><div style="text-align: left">[%c4Specifications%]</div>',
+            padding=30,
+            header_height=50,
+            min_spacing=30
+        ),
+        
+        'c2_group_collapsed': ElementStyle(
+            width=240,
+            height=120,
+            style='rounded=0;fontSize=11;whiteSpace=wrap;html=1;fillColor=#F0F0F0;strokeColor=#666666;fontColor=#333333;labelBackgroundColor=none;align=left;verticalAlign=bottom;labelBorderColor=none;spacingTop=0;spacing=10;metaEdit=1;rotatable=0;perimeter=rectanglePerimeter;noLabel=0;labelPadding=0;allowArrows=0;connectable=0;expand=0;recursiveResize=0;editable=1;pointerEvents=0;points=[[0.25,0,0],[0.5,0,0],[0.75,0,0],[1,0.25,0],[1,0.5,0],[1,0.75,0],[0.75,1,0],[0.5,1,0],[0.25,1,0],[0,0.75,0],[0,0.5,0],[0,0.25,0]];strokeWidth=1;container=0;collapsible=0;',
+            label_template='<font style="font-size: 16px"><b><div style="text-align: left">%c4Name%</div></b></font><div style="text-align: left">[%c4Specifications%]</div>',
+            padding=30,
+            header_height=50,
+            min_spacing=30
+        ),
+        
+        'c2_component_external': ElementStyle(
+            width=240,
+            height=120,
+            style='rounded=1;whiteSpace=wrap;html=1;labelBackgroundColor=none;fillColor=#8C8496;fontColor=#ffffff;align=center;arcSize=6;strokeColor=#736782;metaEdit=1;resizable=1;points=[[0.25,0,0],[0.5,0,0],[0.75,0,0],[1,0.25,0],[1,0.5,0],[1,0.75,0],[0.75,1,0],[0.5,1,0],[0.25,1,0],[0,0.75,0],[0,0.5,0],[0,0.25,0]];fontSize=14;strokeWidth=3;allowArrows=0;rotatable=0;',
+            label_template='<font style="font-size: 16px"><b>%c4Name%</b></font><div>[%c4Type%: %c4Technology%]</div><br><div><font style="font-size: 11px">%c4Description%</font></div>',
+            padding=0,
+            header_height=0,
+            min_spacing=0
+        ),
+        
+        'c2_link': ElementStyle(
+            width=0,
+            height=0,
+            style='endArrow=blockThin;html=1;fontSize=10;fontColor=#404040;strokeWidth=1;endFill=1;strokeColor=#828282;elbow=vertical;metaEdit=1;endSize=14;startSize=14;jumpStyle=arc;jumpSize=16;rounded=0;edgeStyle=orthogonalEdgeStyle;labelBackgroundColor=#ffffff;whiteSpace=wrap;',
+            label_template='%c4Technology%',
+            padding=0,
+            header_height=0,
+            min_spacing=0
+        ),
+        
+        # Страница содержания многостраничного экспорта: заголовок и ссылки на страницы
+        'toc_title': ElementStyle(
+            width=600,
+            height=40,
+            style='text;html=0;align=left;verticalAlign=middle;fontSize=20;fontStyle=1;fontColor=#06315C;spacingLeft=4;',
+            label_template='',
+            padding=0,
+            header_height=0,
+            min_spacing=0
+        ),
+        
+        'toc_entry': ElementStyle(
+            width=600,
+            height=30,
+            style='text;html=0;align=left;verticalAlign=middle;fontSize=14;fontColor=#0E7DAD;fontStyle=4;spacingLeft=4;',
+            label_template='',
+            padding=0,
+            header_height=0,
+            min_spacing=10
+        ),
+        
         # Заготовки для будущих типов элементов
         'component': ElementStyle(
             width=200,
@@ -114,32 +197,12 @@ class DrawioPalette:
     
     @classmethod
     def get_component_style(cls, component) -> ElementStyle:
-        """Получает стиль для компонента в зависимости от его типа"""
-        if component.type and component.type.name:
-            type_name = component.type.name.lower()
-            
-            # Типы базы данных
-            database_types = ['database', 'rdbms', 'in-memory db', 'column-oriented db']
-            if type_name in database_types:
-                return cls.STYLES.get('dd_component_database', cls.STYLES['dd_component'])
-            
-            # Типы файлового хранилища
-            file_storage_types = ['file storage']
-            if type_name in file_storage_types:
-                return cls.STYLES.get('dd_component_file_storage', cls.STYLES['dd_component'])
-            
-            # Типы брокеров сообщений
-            message_broker_types = ['message broker']
-            if type_name in message_broker_types:
-                return cls.STYLES.get('dd_component_message_broker', cls.STYLES['dd_component'])
-            
-            # Типы приложений
-            application_types = ['application']
-            if type_name in application_types:
-                return cls.STYLES.get('dd_component_application', cls.STYLES['dd_component'])
-        
-        # По умолчанию возвращаем обычный стиль компонента
-        return cls.STYLES['dd_component']
+        """
+        Получает стиль для компонента в зависимости от его типа.
+        Стиль выбирается правилами ComponentTypeStyleRule (см. styles.py)
+        """
+        from .styles import get_component_style_resolver
+        return get_component_style_resolver().get_component_style(component)
     
     @classmethod
     def get_style(cls, element_type: str) -> ElementStyle:
@@ -153,5 +216,6 @@ class DrawioPalette:
             'padding': 30,
             'header_height': 50,
             'min_child_spacing': 30,
-            'group_spacing': 100  # Расстояние между корневыми группами
+            'group_spacing': 100,  # Расстояние между корневыми группами
+            'max_row_width': 1200  # Максимальная ширина строки для маленьких элементов
         } 
\ No newline at end of file
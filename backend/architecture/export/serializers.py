@@ -0,0 +1,220 @@
+"""
+Сериализация ячеек диаграммы drawio в XML
+
+Ячейка - элемент <object> с вложенными <mxCell> и <mxGeometry>. Два
+сериализатора дают одинаковый XML:
+
+- elementtree - строит элементы ElementTree и сериализует их ET.tostring
+- template - подставляет экранированные значения в заранее собранные
+  шаблоны стилей палитры, не создавая промежуточных объектов
+"""
+
+import xml.etree.ElementTree as ET
+
+from django.conf import settings
+
+from .palette import ElementStyle
+
+
+SERIALIZER_ELEMENTTREE = 'elementtree'
+SERIALIZER_TEMPLATE = 'template'
+CELL_SERIALIZERS = (SERIALIZER_ELEMENTTREE, SERIALIZER_TEMPLATE)
+DEFAULT_CELL_SERIALIZER = SERIALIZER_TEMPLATE
+
+
+def escape_attribute(text: str) -> str:
+    """Экранирует значение атрибута так же, как ElementTree"""
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    if '"' in text:
+        text = text.replace('"', '&quot;')
+    if '\r' in text:
+        text = text.replace('\r', '&#13;')
+    if '\n' in text:
+        text = text.replace('\n', '&#10;')
+    if '\t' in text:
+        text = text.replace('\t', '&#09;')
+    return text
+
+
+class ElementTreeCellSerializer:
+    """Сериализация ячеек через ElementTree"""
+
+    name = SERIALIZER_ELEMENTTREE
+
+    def group_cell(self, style: ElementStyle, cell_id, parent_id, x, y, width, height,
+                   name: str, instances: str, specifications: str) -> str:
+        object_elem = ET.Element('object', {
+            'placeholders': '1',
+            'c4Name': name,
+            'label': style.label_template,
+            'c4Instances': instances,
+            'c4Specifications': specifications,
+            'id': str(cell_id)
+        })
+        self._add_vertex(object_elem, style, parent_id, x, y, width, height)
+        return ET.tostring(object_elem, encoding='unicode')
+
+    def component_cell(self, style: ElementStyle, cell_id, parent_id, x, y, width, height,
+                       name: str, type_name: str, technology: str, description: str) -> str:
+        object_elem = ET.Element('object', {
+            'placeholders': '1',
+            'c4Name': name,
+            'c4Type': type_name,
+            'c4Technology': technology,
+            'c4Description': description,
+            'label': style.label_template,
+            'id': str(cell_id)
+        })
+        self._add_vertex(object_elem, style, parent_id, x, y, width, height)
+        return ET.tostring(object_elem, encoding='unicode')
+
+    def link_cell(self, style: ElementStyle, cell_id, source_id, target_id, technology: str) -> str:
+        object_elem = ET.Element('object', {
+            'placeholders': '1',
+            'c4Type': 'Relationship',
+            'c4Technology': technology,
+            'label': style.label_template,
+            'id': str(cell_id)
+        })
+
+        # Связь лежит на базовом слое, концы - ячейки групп на любой глубине
+        mx_cell = ET.SubElement(object_elem, 'mxCell', {
+            'style': style.style,
+            'edge': '1',
+            'parent': '1',
+            'source': str(source_id),
+            'target': str(target_id)
+        })
+        ET.SubElement(mx_cell, 'mxGeometry', {
+            'relative': '1',
+            'as': 'geometry'
+        })
+        return ET.tostring(object_elem, encoding='unicode')
+
+    def text_cell(self, style: ElementStyle, cell_id, x, y, width, height,
+                  label: str, link: str = None) -> str:
+        attributes = {'label': label}
+        if link is not None:
+            attributes['link'] = link
+        attributes['id'] = str(cell_id)
+        object_elem = ET.Element('object', attributes)
+        self._add_vertex(object_elem, style, 1, x, y, width, height)
+        return ET.tostring(object_elem, encoding='unicode')
+
+    def _add_vertex(self, object_elem, style, parent_id, x, y, width, height):
+        mx_cell = ET.SubElement(object_elem, 'mxCell', {
+            'style': style.style,
+            'vertex': '1',
+            'parent': str(parent_id)
+        })
+        ET.SubElement(mx_cell, 'mxGeometry', {
+            'x': str(x),
+            'y': str(y),
+            'width': str(width),
+            'height': str(height),
+            'as': 'geometry'
+        })
+
+
+class TemplateCellSerializer:
+    """
+    Сериализация ячеек по строковым шаблонам.
+
+    Постоянная часть ячейки (подпись и стиль из палитры) экранируется один раз
+    при первом использовании стиля, для каждой ячейки экранируются только
+    значения из базы данных.
+    """
+
+    name = SERIALIZER_TEMPLATE
+
+    def __init__(self):
+        self._templates = {}
+
+    def group_cell(self, style: ElementStyle, cell_id, parent_id, x, y, width, height,
+                   name: str, instances: str, specifications: str) -> str:
+        return self._template('group', style).format(
+            escape_attribute(name), escape_attribute(instances), escape_attribute(specifications),
+            cell_id, parent_id, x, y, width, height,
+        )
+
+    def component_cell(self, style: ElementStyle, cell_id, parent_id, x, y, width, height,
+                       name: str, type_name: str, technology: str, description: str) -> str:
+        return self._template('component', style).format(
+            escape_attribute(name), escape_attribute(type_name),
+            escape_attribute(technology), escape_attribute(description),
+            cell_id, parent_id, x, y, width, height,
+        )
+
+    def link_cell(self, style: ElementStyle, cell_id, source_id, target_id, technology: str) -> str:
+        return self._template('link', style).format(
+            escape_attribute(technology), cell_id, source_id, target_id,
+        )
+
+    def text_cell(self, style: ElementStyle, cell_id, x, y, width, height,
+                  label: str, link: str = None) -> str:
+        if link is None:
+            return self._template('text', style).format(escape_attribute(label), cell_id, 1, x, y, width, height)
+        return self._template('text_link', style).format(
+            escape_attribute(label), escape_attribute(link), cell_id, 1, x, y, width, height,
+        )
+
+    def _template(self, kind: str, style: ElementStyle) -> str:
+        key = (kind, style)
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = self._compile(kind, style)
+        return template
+
+    @staticmethod
+    def _compile(kind: str, style: ElementStyle) -> str:
+        """Собирает шаблон str.format для ячейки указанного вида и стиля"""
+        label = escape_attribute(style.label_template).replace('{', '{{').replace('}', '}}')
+        style_value = escape_attribute(style.style).replace('{', '{{').replace('}', '}}')
+        vertex = (
+            f'<mxCell style="{style_value}" vertex="1" parent="{{}}">'
+            '<mxGeometry x="{}" y="{}" width="{}" height="{}" as="geometry" />'
+            '</mxCell></object>'
+        )
+
+        if kind == 'group':
+            return (
+                f'<object placeholders="1" c4Name="{{}}" label="{label}" '
+                'c4Instances="{}" c4Specifications="{}" id="{}">' + vertex
+            )
+        if kind == 'component':
+            return (
+                '<object placeholders="1" c4Name="{}" c4Type="{}" c4Technology="{}" '
+                f'c4Description="{{}}" label="{label}" id="{{}}">' + vertex
+            )
+        if kind == 'text':
+            return '<object label="{}" id="{}">' + vertex
+        if kind == 'text_link':
+            return '<object label="{}" link="{}" id="{}">' + vertex
+        return (
+            '<object placeholders="1" c4Type="Relationship" c4Technology="{}" '
+            f'label="{label}" id="{{}}">'
+            f'<mxCell style="{style_value}" edge="1" parent="1" source="{{}}" target="{{}}">'
+            '<mxGeometry relative="1" as="geometry" />'
+            '</mxCell></object>'
+        )
+
+
+def get_cell_serializer(name: str = None):
+    """
+    Возвращает сериализатор ячеек по имени.
+    По умолчанию - настройка EXPORT_CELL_SERIALIZER.
+    """
+    if name is None:
+        name = getattr(settings, 'EXPORT_CELL_SERIALIZER', DEFAULT_CELL_SERIALIZER)
+    if name == SERIALIZER_ELEMENTTREE:
+        return ElementTreeCellSerializer()
+    if name == SERIALIZER_TEMPLATE:
+        return TemplateCellSerializer()
+    raise ValueError(
+        f"Неподдерживаемый сериализатор ячеек: {name}. Используйте: {', '.join(CELL_SERIALIZERS)}"
+    )
@@ -0,0 +1,97 @@
+"""
+Выбор стилей компонентов по правилам ComponentTypeStyleRule
+"""
+
+import re
+from typing import Dict, Iterable, Optional, Tuple
+
+from ..models import ComponentType, ComponentTypeStyleRule
+from .cache import bump_version, get_version
+from .palette import DrawioPalette, ElementStyle
+
+
+# Версия правил и типов компонентов (таблица CacheVersion). Увеличивается
+# сигналами при изменении ComponentType и ComponentTypeStyleRule
+COMPONENT_STYLES_VERSION_KEY = 'architecture:component_styles_version'
+
+
+def bump_component_styles_version() -> None:
+    """
+    Делает недействительной таблицу стилей компонентов во всех процессах:
+    версия хранится в базе данных и увеличивается после фиксации транзакции
+    """
+    bump_version(COMPONENT_STYLES_VERSION_KEY)
+
+
+class ComponentStyleResolver:
+    """
+    Таблица стилей компонентов ComponentType.id -> ElementStyle.
+
+    Правила (регулярные выражения по названию типа) применяются один раз
+    к каждому типу при построении таблицы, после чего стиль компонента
+    определяется поиском по ID типа.
+    """
+
+    def __init__(self, rules: Iterable[Tuple[str, str]], type_names: Dict[int, str]):
+        """
+        Args:
+            rules: пары (шаблон, ключ стиля палитры) в порядке приоритета
+            type_names: названия типов компонентов {id: name}
+        """
+        self.default_style = DrawioPalette.STYLES['dd_component']
+        self.rules = []
+        for pattern, style in rules:
+            try:
+                self.rules.append((re.compile(pattern, re.IGNORECASE), style))
+            except re.error:
+                # Некорректное правило (сохранено в обход валидации) не применяется
+                continue
+        self.styles: Dict[int, ElementStyle] = {
+            type_id: self.resolve_type_name(name) for type_id, name in type_names.items()
+        }
+
+    @classmethod
+    def load(cls) -> 'ComponentStyleResolver':
+        """Строит таблицу по правилам и типам из базы данных (два запроса)"""
+        rules = ComponentTypeStyleRule.objects.order_by('priority', 'id').values_list('pattern', 'style')
+        type_names = dict(ComponentType.objects.values_list('id', 'name'))
+        return cls(rules, type_names)
+
+    def resolve_type_name(self, type_name: Optional[str]) -> ElementStyle:
+        """Стиль по названию типа: первое подходящее правило или стиль по умолчанию"""
+        if type_name:
+            for pattern, style in self.rules:
+                if pattern.search(type_name):
+                    return DrawioPalette.STYLES.get(style, self.default_style)
+        return self.default_style
+
+    def get_component_style(self, component) -> ElementStyle:
+        """Стиль компонента по его типу"""
+        type_id = component.type_id
+        if type_id is None:
+            return self.default_style
+
+        style = self.styles.get(type_id)
+        if style is None:
+            # Тип создан после построения таблицы
+            style = self.styles[type_id] = self.resolve_type_name(component.type.name)
+        return style
+
+
+# Таблица стилей процесса и версия, для которой она построена
+_resolver: Optional[ComponentStyleResolver] = None
+_resolver_version: Optional[int] = None
+
+
+def get_component_style_resolver() -> ComponentStyleResolver:
+    """
+    Возвращает таблицу стилей процесса, перестраивая ее, если типы
+    или правила изменились
+    """
+    global _resolver, _resolver_version
+
+    version = get_version(COMPONENT_STYLES_VERSION_KEY)
+    if _resolver is None or _resolver_version != version:
+        _resolver = ComponentStyleResolver.load()
+        _resolver_version = version
+    return _resolver
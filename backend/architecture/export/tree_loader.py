@@ -0,0 +1,378 @@
+"""
+Загрузка дерева DdGroup/DdComponent (и C2Group/C2Component) в память для экспорта
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from django.db.models import Q
+
+from ..managers import HierarchyCycleError
+from ..models import C2Component, C2Group, C2Link, C2LinksInfoObjects, DdGroup, DdComponent, DdLink, DdLinkPort
+
+
+class DdLinkInfo(NamedTuple):
+    """Связь DD между группами с именем протокола и отсортированными портами"""
+    id: int
+    group_from_id: int
+    group_to_id: int
+    protocol: str
+    ports: List[int]
+
+
+class C2LinkInfo(NamedTuple):
+    """Связь C2 между компонентами с информационными объектами [(объект, тип операции)]"""
+    id: int
+    component_from_id: int
+    component_to_id: int
+    name: str
+    technology: str
+    format: str
+    info_objects: List[Tuple[str, str]]
+
+
+# Начало строки сводки в спецификациях свернутой группы
+SUMMARY_PREFIX = 'Свернуто - '
+
+
+class SubtreeSummary(NamedTuple):
+    """Сводка по свернутому поддереву группы: потомки, компоненты и сумма экземпляров потомков"""
+    groups: int
+    components: int
+    instances: Optional[int]
+
+    def label(self) -> str:
+        parts = [f'групп: {self.groups}', f'компонентов: {self.components}']
+        if self.instances is not None:
+            parts.append(f'экземпляров: {self.instances}')
+        return SUMMARY_PREFIX + ', '.join(parts)
+
+
+class DdTreeIndex:
+    """
+    Индекс смежности дерева DD в памяти.
+
+    Группы, компоненты и их типы загружаются фиксированным числом запросов
+    (не зависящим от размера дерева), после чего обход дерева при расчете
+    layout выполняется без обращений к базе данных.
+    """
+
+    group_model = DdGroup
+    component_model = DdComponent
+    # Поле группы с числом экземпляров для сводки свернутых поддеревьев
+    instances_field = 'instances'
+
+    def __init__(self, groups: Iterable[DdGroup], components: Iterable[DdComponent] = ()):
+        self.groups: Dict[int, DdGroup] = {}
+        self.subgroups: Dict[Optional[int], List[DdGroup]] = defaultdict(list)
+        self.components: Dict[int, List[DdComponent]] = defaultdict(list)
+
+        for group in groups:
+            self.groups[group.id] = group
+            self.subgroups[group.parent_id].append(group)
+
+        for component in components:
+            self.components[component.group_id].append(component)
+
+        # Подзапрос ID загруженных групп (None - загружено все дерево)
+        self.scope = None
+        self.links: Optional[List[DdLinkInfo]] = None
+        # Свернутые группы: их потомки и компоненты не загружены {group_id: SubtreeSummary}
+        self.collapsed: Dict[int, SubtreeSummary] = {}
+
+    @classmethod
+    def load(cls, root_ids: Optional[Iterable[int]] = None, max_depth: Optional[int] = None,
+             collapse_threshold: Optional[int] = None) -> 'DdTreeIndex':
+        """
+        Загружает дерево групп и компонентов двумя запросами
+
+        Args:
+            root_ids: ID групп, поддеревья которых нужны для экспорта.
+                      Загружаются сами группы, их потомки и путь до корня
+                      (рекурсивными CTE). Если не указаны - загружается все дерево.
+            max_depth: глубина, ниже которой группы не загружаются (root_ids или
+                       корни - глубина 0). Группы на этой глубине с потомками
+                       или компонентами сворачиваются.
+            collapse_threshold: сворачивать группы, в поддереве которых больше
+                                указанного числа групп и компонентов (кроме
+                                самих root_ids или корней)
+        """
+        if max_depth is not None or collapse_threshold is not None:
+            return cls._load_collapsed(root_ids, max_depth, collapse_threshold)
+
+        group_manager = cls.group_model.objects
+        groups = group_manager.select_related('type').order_by('id')
+        components = cls.component_model.objects.select_related('type').order_by('id')
+
+        scope = None
+        if root_ids is not None:
+            root_ids = list(root_ids)
+            subtree = group_manager.descendants(root_ids, include_self=True)
+            scope_filter = Q(pk__in=subtree.values('pk')) | Q(pk__in=group_manager.ancestors(root_ids).values('pk'))
+            groups = groups.filter(scope_filter)
+            components = components.filter(group__in=subtree.values('pk'))
+            scope = group_manager.filter(scope_filter).values('pk')
+
+        index = cls(groups, components)
+        index.scope = scope
+        return index
+
+    @classmethod
+    def _load_collapsed(cls, root_ids, max_depth, collapse_threshold) -> 'DdTreeIndex':
+        """
+        Загрузка с ограничением глубины тремя запросами: уровни дерева до
+        max_depth со сводкой поддеревьев (без объектов моделей потомков:
+        агрегация в SQL или сумма снизу вверх по строкам ID, см.
+        subtree_levels), видимые группы и компоненты развернутых групп
+        """
+        group_manager = cls.group_model.objects
+        if root_ids is not None:
+            root_ids = list(root_ids)
+
+        rows = group_manager.subtree_levels(
+            root_ids,
+            max_depth,
+            cls.component_model,
+            instances_field=cls.instances_field,
+            # Без порога сводка нужна только группам на последнем уровне
+            summary_depth=max_depth if collapse_threshold is None else None,
+        )
+
+        depths = {}
+        summaries = {}
+        children = defaultdict(list)
+        anchors = []
+        for group_id, parent_id, depth, groups_count, components_count, instances_count in rows:
+            if group_id in depths:
+                # Группа внутри поддерева другого корня (или цикл) - оставляем меньшую глубину
+                continue
+            depths[group_id] = depth
+            if groups_count is not None:
+                summaries[group_id] = SubtreeSummary(groups_count, components_count, instances_count)
+            if depth == 0:
+                anchors.append(group_id)
+            else:
+                children[parent_id].append(group_id)
+
+        visible = []
+        expanded = []
+        collapsed = {}
+        stack = list(reversed(anchors))
+        while stack:
+            group_id = stack.pop()
+            visible.append(group_id)
+            summary = summaries.get(group_id)
+            has_content = summary is not None and (summary.groups or summary.components)
+            if has_content and (
+                depths[group_id] == max_depth
+                or (
+                    collapse_threshold is not None
+                    and depths[group_id] > 0
+                    and summary.groups + summary.components > collapse_threshold
+                )
+            ):
+                collapsed[group_id] = summary
+                continue
+            expanded.append(group_id)
+            if depths[group_id] != max_depth:
+                stack.extend(reversed(children.get(group_id, [])))
+
+        scope_filter = Q(pk__in=visible)
+        if root_ids is not None:
+            scope_filter |= Q(pk__in=group_manager.ancestors(root_ids).values('pk'))
+        groups = group_manager.select_related('type').filter(scope_filter).order_by('id')
+        components = cls.component_model.objects.select_related('type').filter(
+            group_id__in=expanded
+        ).order_by('id')
+
+        index = cls(groups, components)
+        index.scope = group_manager.filter(scope_filter).values('pk')
+        index.collapsed = collapsed
+        return index
+
+    def load_links(self) -> List[DdLinkInfo]:
+        """
+        Загружает связи DD между загруженными группами двумя запросами:
+        связи вместе с протоколом (join) и порты всех этих связей.
+        Строки выбираются кортежами, без создания объектов моделей, поэтому
+        загрузка остается быстрой и на сотнях тысяч связей.
+        """
+        if self.links is not None:
+            return self.links
+
+        links = DdLink.objects.order_by('id')
+        ports = DdLinkPort.objects.order_by('dd_link_id', 'port')
+        if self.scope is not None:
+            links = links.filter(group_from__in=self.scope, group_to__in=self.scope)
+            ports = ports.filter(dd_link__group_from__in=self.scope, dd_link__group_to__in=self.scope)
+
+        link_rows = list(links.values_list('id', 'group_from_id', 'group_to_id', 'protocol__name'))
+
+        ports_by_link = defaultdict(list)
+        for link_id, port in ports.values_list('dd_link_id', 'port'):
+            ports_by_link[link_id].append(port)
+
+        self.links = [
+            DdLinkInfo(link_id, group_from_id, group_to_id, protocol, ports_by_link.get(link_id, []))
+            for link_id, group_from_id, group_to_id, protocol in link_rows
+        ]
+        return self.links
+
+    def get_roots(self) -> List[DdGroup]:
+        """
+        Возвращает корневые группы (без родителя). Если загружено все дерево,
+        из корней должны быть достижимы все группы: группы, замкнутые parent
+        в цикл, корня не имеют и иначе молча пропали бы из экспорта -
+        для них выбрасывается HierarchyCycleError.
+        """
+        roots = list(self.subgroups.get(None, []))
+        if self.scope is None:
+            self._check_reachable(roots)
+        return roots
+
+    def _check_reachable(self, roots: List[DdGroup]) -> None:
+        """Обходит дерево от корней и сообщает цикл среди недостижимых групп"""
+        reached = set()
+        stack = [group.id for group in roots]
+        while stack:
+            group_id = stack.pop()
+            reached.add(group_id)
+            stack.extend(group.id for group in self.subgroups.get(group_id, ()))
+        if len(reached) == len(self.groups):
+            return
+
+        # Цепочка parent недостижимой группы не доходит до корня - она замыкается в цикл
+        chain = {}
+        group_id = min(self.groups.keys() - reached)
+        while group_id not in chain:
+            chain[group_id] = len(chain)
+            group_id = self.groups[group_id].parent_id
+        raise HierarchyCycleError(list(chain)[chain[group_id]:])
+
+    def get_group(self, group_id: int) -> DdGroup:
+        """Возвращает группу по ID или выбрасывает DdGroup.DoesNotExist"""
+        try:
+            return self.groups[group_id]
+        except KeyError:
+            raise self.group_model.DoesNotExist(
+                f"{self.group_model._meta.verbose_name} с ID {group_id} не найдена"
+            )
+
+    def get_children(self, group) -> List[Dict]:
+        """
+        Возвращает детей группы: сначала подгруппы, затем компоненты
+        в формате [{'type': 'group' | 'component', 'object': ...}]
+        """
+        children = [
+            {'type': 'group', 'object': subgroup}
+            for subgroup in self.subgroups.get(group.id, [])
+        ]
+        children.extend(
+            {'type': 'component', 'object': component}
+            for component in self.components.get(group.id, [])
+        )
+        return children
+
+    def get_path_to_root(self, group) -> List[DdGroup]:
+        """
+        Возвращает путь от корня до группы (включительно).
+        Если цепочка parent замкнута, выбрасывает HierarchyCycleError.
+        """
+        path = []
+        visited = {}
+        current = self.groups.get(group.id, group)
+
+        while current is not None:
+            if current.id in visited:
+                # Цикл - от первого повторившегося элемента до конца пути
+                raise HierarchyCycleError([item.id for item in path[visited[current.id]:]])
+            visited[current.id] = len(path)
+            path.append(current)
+            current = self.groups.get(current.parent_id) if current.parent_id else None
+
+        path.reverse()
+        return path
+
+    def subset(self, root_id: int) -> 'DdTreeIndex':
+        """
+        Возвращает индекс поддерева группы (например, для передачи в другой процесс)
+        """
+        group_ids = self.get_subtree_ids([root_id])
+        return type(self)(
+            (group for group in self.groups.values() if group.id in group_ids),
+            (
+                component
+                for group_id in group_ids
+                for component in self.components.get(group_id, [])
+            ),
+        )
+
+    def get_subtree_ids(self, root_ids: Iterable[int]) -> Set[int]:
+        """Возвращает ID всех групп поддеревьев указанных корней (включая сами корни)"""
+        result = set()
+        stack = [group_id for group_id in root_ids if group_id in self.groups]
+
+        while stack:
+            group_id = stack.pop()
+            if group_id in result:
+                continue
+            result.add(group_id)
+            stack.extend(subgroup.id for subgroup in self.subgroups.get(group_id, []))
+
+        return result
+
+
+class C2TreeIndex(DdTreeIndex):
+    """
+    Индекс дерева C2 (диаграмма контейнеров): группы и компоненты C2
+    загружаются так же, как DD, а связи C2 соединяют компоненты
+    """
+
+    group_model = C2Group
+    component_model = C2Component
+    instances_field = None
+    # Компоненты вне загруженных групп, связи которых тоже нужны (экспорт нескольких элементов)
+    extra_component_ids = ()
+
+    def load_links(self) -> List[C2LinkInfo]:
+        """
+        Загружает связи C2 между компонентами загруженных групп двумя запросами:
+        связи и их информационные объекты с типами операций (join)
+        """
+        if self.links is not None:
+            return self.links
+
+        links = C2Link.objects.order_by('id')
+        info_objects = C2LinksInfoObjects.objects.order_by('c2_link_id', 'infoobject__name', 'operation_type__name')
+        if self.scope is not None:
+            def endpoint(field):
+                condition = Q(**{f'{field}__group__in': self.scope})
+                if self.extra_component_ids:
+                    condition |= Q(**{f'{field}__in': self.extra_component_ids})
+                return condition
+
+            links = links.filter(endpoint('component_from'), endpoint('component_to'))
+            info_objects = info_objects.filter(endpoint('c2_link__component_from'), endpoint('c2_link__component_to'))
+
+        link_rows = list(links.values_list('id', 'component_from_id', 'component_to_id', 'name', 'technology', 'format'))
+
+        info_objects_by_link = defaultdict(list)
+        for link_id, info_object, operation_type in info_objects.values_list(
+            'c2_link_id', 'infoobject__name', 'operation_type__name'
+        ):
+            info_objects_by_link[link_id].append((info_object, operation_type))
+
+        self.links = [
+            C2LinkInfo(link_id, component_from_id, component_to_id, name, technology, link_format,
+                       info_objects_by_link.get(link_id, []))
+            for link_id, component_from_id, component_to_id, name, technology, link_format in link_rows
+        ]
+        return self.links
+
+    def get_component_groups(self) -> Dict[int, int]:
+        """Возвращает группы загруженных компонентов {component_id: group_id}"""
+        return {
+            component.id: group_id
+            for group_id, group_components in self.components.items()
+            for component in group_components
+        }
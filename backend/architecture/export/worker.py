@@ -0,0 +1,43 @@
+"""
+Точки входа для процессов пула воркеров экспорта
+
+Модуль не импортирует модели на уровне модуля: он загружается в новых
+процессах (spawn) до инициализации Django.
+"""
+
+
+def init_worker_process():
+    """Инициализирует Django в процессе пула"""
+    import django
+    django.setup()
+
+
+def run_job_in_worker(job_id: int) -> str:
+    """Выполняет задание экспорта в процессе пула"""
+    from django.db import connections
+    from .jobs import run_export_job
+
+    try:
+        return run_export_job(job_id)
+    finally:
+        connections.close_all()
+
+
+def calculate_root_layout(tree, root_id: int, layout_entries: dict, layout_options: dict):
+    """
+    Рассчитывает layout одной корневой группы по снимку ее поддерева.
+
+    Базу данных и кэш layout не использует: записи кэша передаются из
+    родительского процесса, а новые записи возвращаются ему для сохранения.
+    Возвращает (layout без объектов моделей, новые записи кэша, статистику).
+    """
+    from .drawio_export import DrawioExporter
+
+    exporter = DrawioExporter(**layout_options)
+    exporter.tree = tree
+    exporter._layout_entries = layout_entries
+
+    root = tree.get_group(root_id)
+    size_info = exporter._calculate_sizes_bottom_up(root)
+    layout = exporter._calculate_positions_top_down(root, size_info, 0, 0, None)
+    return exporter._detach_layout(layout), exporter._new_layout_entries, exporter.layout_stats
@@ -0,0 +1,86 @@
+"""
+Бенчмарк экспорта в drawio на синтетических деревьях DD
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from architecture.benchmarks.export import OPERATIONS, SHAPES, compare, run_suite
+
+
+class Command(BaseCommand):
+    help = (
+        "Измеряет время, число запросов, пиковую память и размер документа экспорта "
+        "в drawio на синтетических деревьях DD. Выполняется в отдельной тестовой базе данных."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shapes', nargs='+', choices=SHAPES, default=list(SHAPES),
+                            help='Формы деревьев')
+        parser.add_argument('--operations', nargs='+', choices=OPERATIONS, default=list(OPERATIONS),
+                            help='Операции экспорта')
+        parser.add_argument('--groups', type=int, default=2000, help='Число групп в дереве')
+        parser.add_argument('--components', type=int, default=3,
+                            help='Число компонентов в группе (в среднем для skewed)')
+        parser.add_argument('--links', type=float, default=0.5, help='Число связей на группу')
+        parser.add_argument('--repeat', type=int, default=3, help='Число замеров времени')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора')
+        parser.add_argument('--output', help='Файл для результатов в JSON (по умолчанию - stdout)')
+        parser.add_argument('--compare', help='JSON с предыдущими результатами для сравнения')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Не удалять тестовую базу данных после бенчмарка')
+
+    def handle(self, *args, **options):
+        if options['groups'] < 2 or options['repeat'] < 1:
+            raise CommandError("Нужно не меньше 2 групп и 1 замера")
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    baseline = json.load(f)['results']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Не удалось прочитать {options['compare']}: {e}")
+
+        # Синтетические деревья создаются в отдельной базе, чтобы существующие
+        # данные не попадали в экспорт и не влияли на замеры
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            report = run_suite(
+                shapes=options['shapes'],
+                operations=options['operations'],
+                groups=options['groups'],
+                components_per_group=options['components'],
+                links_per_group=options['links'],
+                repeat=options['repeat'],
+                seed=options['seed'],
+                log=self._log,
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        if baseline is not None:
+            report['comparison'] = compare(report['results'], baseline)
+            for row in report['comparison']:
+                self.stderr.write(
+                    f"{row['shape']:>9} {row['operation']:>9}  время x{row['time_ms']}  "
+                    f"запросы x{row['queries']}  память x{row['peak_memory_mb']}  "
+                    f"размер x{row['output_bytes']}"
+                )
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def _log(self, result):
+        self.stderr.write(
+            f"{result['shape']:>9} {result['operation']:>9}  {result['time_ms']:>10.1f} мс  "
+            f"{result['queries']:>3} запр.  {result['peak_memory_mb']:>8.1f} МБ  "
+            f"{result['output_bytes']:>10} байт"
+        )
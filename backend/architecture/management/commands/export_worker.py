@@ -0,0 +1,119 @@
+"""
+Воркер асинхронных заданий экспорта в drawio
+"""
+
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from architecture.export.jobs import cleanup_finished_jobs, claim_next_job, run_export_job
+from architecture.export.worker import init_worker_process, run_job_in_worker
+from architecture.models import ExportJob
+
+
+# Как часто воркер удаляет устаревшие задания и их файлы (секунды)
+CLEANUP_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет задания экспорта в drawio из очереди ExportJob в пуле процессов. "
+        "Задания прерванных воркеров переводятся в failed, завершенные задания старше "
+        "EXPORT_JOB_RETENTION удаляются вместе с файлами."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=getattr(settings, 'EXPORT_WORKER_PROCESSES', 2),
+            help='Размер пула процессов (0 - выполнять задания в текущем процессе)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Интервал опроса очереди в секундах',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить все ожидающие задания и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        poll_interval = options['poll_interval']
+        once = options['once']
+        self._next_cleanup = 0
+
+        if processes <= 0:
+            self._run_inline(poll_interval, once)
+            return
+
+        # Соединения родительского процесса не должны попасть в процессы пула
+        connections.close_all()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=context,
+            initializer=init_worker_process,
+        ) as pool:
+            in_flight = {}
+            while True:
+                self._cleanup()
+                while len(in_flight) < processes:
+                    job = claim_next_job()
+                    if job is None:
+                        break
+                    self.stdout.write(f"Задание {job.id} ({job.kind}) запущено")
+                    in_flight[pool.submit(run_job_in_worker, job.id)] = job.id
+
+                if not in_flight:
+                    if once:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._report(in_flight.pop(future), future)
+
+    def _run_inline(self, poll_interval, once):
+        while True:
+            self._cleanup()
+            job = claim_next_job()
+            if job is None:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+            status = run_export_job(job.id)
+            self.stdout.write(f"Задание {job.id} ({job.kind}): {status}")
+
+    def _cleanup(self):
+        """Удаляет устаревшие задания не чаще раза в CLEANUP_INTERVAL"""
+        if time.monotonic() < self._next_cleanup:
+            return
+        self._next_cleanup = time.monotonic() + CLEANUP_INTERVAL
+        deleted = cleanup_finished_jobs()
+        if deleted:
+            self.stdout.write(f"Удалено устаревших заданий: {deleted}")
+
+    def _report(self, job_id, future):
+        try:
+            status = future.result()
+        except Exception as e:
+            # Процесс пула завершился аварийно - задание не должно остаться в running
+            ExportJob.objects.filter(id=job_id, status=ExportJob.STATUS_RUNNING).update(
+                status=ExportJob.STATUS_FAILED,
+                error=f"{type(e).__name__}: {e}",
+                finished_at=timezone.now(),
+            )
+            status = ExportJob.STATUS_FAILED
+        self.stdout.write(f"Задание {job_id}: {status}")
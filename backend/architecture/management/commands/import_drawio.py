@@ -0,0 +1,41 @@
+"""
+Импорт документа drawio в группы и компоненты DD
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from architecture.export.drawio_import import IMPORT_BATCH_SIZE, DrawioImporter, DrawioImportError
+from architecture.models import DdGroup
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует вершины C4 документа drawio (в том числе сжатые страницы) в группы "
+        "и компоненты DD. Документ читается потоково, строки создаются пакетами в одной транзакции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .drawio')
+        parser.add_argument('--root-group', type=int,
+                            help='ID группы, в которую помещаются корневые группы документа')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help='Размер пакета bulk_create')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("Размер пакета должен быть положительным")
+
+        try:
+            with open(options['path'], 'rb') as f:
+                result = DrawioImporter(batch_size=options['batch_size']).import_file(f, options['root_group'])
+        except OSError as e:
+            raise CommandError(f"Не удалось прочитать {options['path']}: {e}")
+        except (DrawioImportError, DdGroup.DoesNotExist) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"Создано групп: {result.groups}, компонентов: {result.components}, "
+            f"типов групп: {result.group_types}, типов компонентов: {result.component_types}"
+        )
+        if result.skipped_components:
+            self.stderr.write(f"Пропущено компонентов вне групп: {result.skipped_components}")
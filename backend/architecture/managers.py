@@ -0,0 +1,362 @@
+"""
+Менеджеры для иерархических моделей (DdGroup, C2Group)
+"""
+
+from collections import defaultdict
+from typing import Iterable, List, Optional, Tuple, Union
+
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+
+
+# Бэкенды, поддерживающие WITH RECURSIVE в подзапросах
+RECURSIVE_CTE_VENDORS = ('postgresql', 'sqlite')
+
+# Наибольшая глубина поддерева в subtree_levels без max_depth: рекурсивный CTE
+# ограничен ею, чтобы завершиться и при цикле в parent
+MAX_TREE_DEPTH = 10000
+
+
+class HierarchyCycleError(ValueError):
+    """Цепочка parent групп DD замкнута в цикл"""
+
+    def __init__(self, group_ids: List[int]):
+        self.group_ids = list(group_ids)
+        super().__init__(
+            "Обнаружен цикл в иерархии групп DD: "
+            + " -> ".join(str(group_id) for group_id in self.group_ids + self.group_ids[:1])
+        )
+
+
+def _normalize_ids(nodes) -> List[int]:
+    """Приводит узел, ID или их набор к списку ID"""
+    if isinstance(nodes, (int, models.Model)):
+        nodes = [nodes]
+    return [node.pk if isinstance(node, models.Model) else int(node) for node in nodes]
+
+
+class HierarchyQuerySet(models.QuerySet):
+    """
+    QuerySet для моделей с self-ссылкой `parent`.
+
+    Предки и поддерево узла выбираются одним запросом через рекурсивный CTE
+    (PostgreSQL, SQLite). Для остальных бэкендов используется обход
+    по уровням - по одному запросу на уровень дерева.
+    """
+
+    def _supports_recursive_cte(self) -> bool:
+        return connections[self.db].vendor in RECURSIVE_CTE_VENDORS
+
+    def _hierarchy_sql(self, node_ids: List[int], direction: str):
+        """
+        Строит рекурсивный CTE, возвращающий ID узлов вместе с исходными.
+        UNION (а не UNION ALL) отбрасывает повторы, поэтому запрос
+        завершается даже при циклах в parent.
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        pk = qn(self.model._meta.pk.column)
+        parent = qn(self.model._meta.get_field('parent').column)
+
+        if direction == 'up':
+            join_condition = f"t.{pk} = h.parent_id"
+        else:
+            join_condition = f"t.{parent} = h.id"
+
+        placeholders = ', '.join(['%s'] * len(node_ids))
+        sql = (
+            f"WITH RECURSIVE hierarchy(id, parent_id) AS ("
+            f"SELECT {pk}, {parent} FROM {table} WHERE {pk} IN ({placeholders}) "
+            f"UNION "
+            f"SELECT t.{pk}, t.{parent} FROM {table} t "
+            f"INNER JOIN hierarchy h ON {join_condition}"
+            f") SELECT id FROM hierarchy"
+        )
+        return RawSQL(sql, node_ids)
+
+    def _collect_ids_by_levels(self, node_ids: List[int], direction: str) -> List[int]:
+        """Обход по уровням для бэкендов без рекурсивных CTE"""
+        manager = self.model._base_manager.using(self.db)
+        found = set(node_ids)
+        frontier = set(node_ids)
+
+        while frontier:
+            if direction == 'up':
+                next_ids = set(
+                    manager.filter(pk__in=frontier, parent__isnull=False)
+                    .values_list('parent_id', flat=True)
+                )
+            else:
+                next_ids = set(manager.filter(parent_id__in=frontier).values_list('pk', flat=True))
+            frontier = next_ids - found
+            found |= frontier
+
+        return list(found)
+
+    def _hierarchy(self, nodes, direction: str, include_self: bool):
+        node_ids = _normalize_ids(nodes)
+        if not node_ids:
+            return self.none()
+
+        if self._supports_recursive_cte():
+            queryset = self.filter(pk__in=self._hierarchy_sql(node_ids, direction))
+        else:
+            queryset = self.filter(pk__in=self._collect_ids_by_levels(node_ids, direction))
+
+        if not include_self:
+            queryset = queryset.exclude(pk__in=node_ids)
+        return queryset
+
+    def subtree_levels(self, nodes: Optional[Iterable], max_depth: Optional[int], component_model,
+                       instances_field: Optional[str] = None,
+                       summary_depth: Optional[int] = None) -> List[Tuple]:
+        """
+        Узлы до глубины max_depth от nodes (по умолчанию - от корней, глубина 0;
+        max_depth=None - без ограничения) со сводкой по их полным поддеревьям.
+
+        Возвращает строки (id, parent_id, depth, groups, components, instances):
+        groups - число потомков узла, components - число компонентов
+        component_model в узле и его потомках, instances - сумма экземпляров
+        потомков (None без instances_field). Сводка считается только для узлов
+        на глубине summary_depth (None - для всех), у остальных узлов она None.
+
+        Сводка одного уровня считается агрегацией в SQL. Сводка всех узлов
+        считается снизу вверх в Python по строкам всего поддерева (один запрос
+        с числом компонентов групп через GROUP BY). Выбрасывает
+        HierarchyCycleError, если nodes лежат на цикле parent, и ValueError,
+        если поддерево глубже MAX_TREE_DEPTH.
+        """
+        node_ids = None if nodes is None else _normalize_ids(nodes)
+        if node_ids == []:
+            return []
+        if not self._supports_recursive_cte():
+            rows = self._subtree_rows_by_levels(node_ids, component_model, instances_field)
+            return _rollup_subtree(rows, max_depth, summary_depth, instances_field)
+        if summary_depth is None:
+            rows = self._subtree_rows_sql(node_ids, component_model, instances_field)
+            return _rollup_subtree(rows, max_depth, summary_depth, instances_field)
+        return self._subtree_levels_sql(node_ids, max_depth, component_model, instances_field, summary_depth)
+
+    def _levels_cte(self, node_ids):
+        """Рекурсивный CTE levels(id, parent_id, depth) от node_ids или корней и его параметры"""
+        qn = connections[self.db].ops.quote_name
+        table = qn(self.model._meta.db_table)
+        pk = qn(self.model._meta.pk.column)
+        parent = qn(self.model._meta.get_field('parent').column)
+
+        params = []
+        if node_ids is None:
+            anchor = f"{parent} IS NULL"
+        else:
+            anchor = f"{pk} IN ({', '.join(['%s'] * len(node_ids))})"
+            params.extend(node_ids)
+        sql = (
+            f"WITH RECURSIVE levels(id, parent_id, depth) AS ("
+            f"SELECT {pk}, {parent}, 0 FROM {table} WHERE {anchor} "
+            f"UNION "
+            f"SELECT t.{pk}, t.{parent}, l.depth + 1 FROM {table} t "
+            f"INNER JOIN levels l ON t.{parent} = l.id WHERE l.depth < %s"
+            f")"
+        )
+        return sql, params
+
+    def _components_count_sql(self, component_model, scope: str) -> str:
+        """Число компонентов групп из CTE scope: один GROUP BY вместо подзапроса на группу"""
+        qn = connections[self.db].ops.quote_name
+        component_table = qn(component_model._meta.db_table)
+        component_group = qn(component_model._meta.get_field('group').column)
+        return (
+            f"SELECT {component_group} AS group_id, COUNT(*) AS components_count FROM {component_table} "
+            f"WHERE {component_group} IN (SELECT id FROM {scope}) GROUP BY {component_group}"
+        )
+
+    def _subtree_rows_sql(self, node_ids, component_model, instances_field) -> List[Tuple]:
+        """
+        Один запрос: все узлы поддеревьев (до MAX_TREE_DEPTH + 1, чтобы
+        превышение глубины было видно) с экземплярами и числом компонентов
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        pk = qn(self.model._meta.pk.column)
+        instances = f"g.{qn(self.model._meta.get_field(instances_field).column)}" if instances_field else "NULL"
+
+        levels, params = self._levels_cte(node_ids)
+        params.append(MAX_TREE_DEPTH + 1)
+        sql = (
+            f"{levels} SELECT l.id, l.parent_id, l.depth, {instances}, COALESCE(c.components_count, 0) "
+            f"FROM levels l INNER JOIN {table} g ON g.{pk} = l.id "
+            f"LEFT JOIN ({self._components_count_sql(component_model, 'levels')}) c ON c.group_id = l.id "
+            f"ORDER BY l.depth, l.id"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _subtree_levels_sql(self, node_ids, max_depth, component_model, instances_field, summary_depth):
+        """
+        Один запрос для сводки одного уровня: рекурсивный CTE уровней до
+        max_depth (ограничение глубины гарантирует завершение и при циклах),
+        CTE пар (узел уровня summary_depth, потомок) - каждый потомок входит
+        в поддерево одного узла уровня, UNION отбрасывает повторы - и агрегация
+        по узлу с числом компонентов групп из одного GROUP BY
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        pk = qn(self.model._meta.pk.column)
+        parent = qn(self.model._meta.get_field('parent').column)
+
+        levels, params = self._levels_cte(node_ids)
+        params.extend([MAX_TREE_DEPTH if max_depth is None else max_depth, summary_depth])
+
+        if instances_field:
+            instances = qn(self.model._meta.get_field(instances_field).column)
+            instances_sum = f"SUM(CASE WHEN s.id <> s.root_id THEN COALESCE(g.{instances}, 1) ELSE 0 END)"
+        else:
+            instances_sum = "NULL"
+
+        sql = (
+            f"{levels}, subtree(root_id, id) AS ("
+            f"SELECT id, id FROM levels WHERE depth = %s "
+            f"UNION "
+            f"SELECT s.root_id, t.{pk} FROM {table} t INNER JOIN subtree s ON t.{parent} = s.id"
+            f"), summary(root_id, groups_count, components_count, instances_count) AS ("
+            f"SELECT s.root_id, COUNT(*) - 1, SUM(COALESCE(c.components_count, 0)), {instances_sum} "
+            f"FROM subtree s INNER JOIN {table} g ON g.{pk} = s.id "
+            f"LEFT JOIN ({self._components_count_sql(component_model, 'subtree')}) c ON c.group_id = s.id "
+            f"GROUP BY s.root_id"
+            f") SELECT l.id, l.parent_id, l.depth, m.groups_count, m.components_count, m.instances_count "
+            f"FROM levels l LEFT JOIN summary m ON m.root_id = l.id ORDER BY l.depth, l.id"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        # SUM в PostgreSQL возвращает numeric
+        return [
+            (node_id, parent_id, depth, *(None if value is None else int(value) for value in summary))
+            for node_id, parent_id, depth, *summary in rows
+        ]
+
+    def _subtree_rows_by_levels(self, node_ids, component_model, instances_field) -> List[Tuple]:
+        """
+        Все узлы поддеревьев обходом по уровням для бэкендов без рекурсивных
+        CTE: два запроса на уровень (узлы и число их компонентов GROUP BY)
+        """
+        manager = self.model._base_manager.using(self.db)
+        fields = ['pk', 'parent_id', instances_field] if instances_field else ['pk', 'parent_id']
+        if node_ids is None:
+            level = list(manager.filter(parent__isnull=True).values_list(*fields))
+        else:
+            level = list(manager.filter(pk__in=node_ids).values_list(*fields))
+
+        rows = []
+        visited = set()
+        depth = 0
+        while level:
+            level = [row for row in level if row[0] not in visited]
+            level_ids = [row[0] for row in level]
+            visited.update(level_ids)
+            counts = dict(
+                component_model._base_manager.using(self.db).filter(group_id__in=level_ids)
+                .values('group_id').annotate(count=models.Count('pk')).values_list('group_id', 'count')
+            )
+            for node_id, parent_id, *instances in level:
+                rows.append((node_id, parent_id, depth, instances[0] if instances else None, counts.get(node_id, 0)))
+            if not level_ids:
+                break
+            level = list(manager.filter(parent_id__in=level_ids).values_list(*fields))
+            depth += 1
+        return rows
+
+    def ancestors(self, nodes: Union[int, models.Model, Iterable], include_self: bool = False):
+        """Все предки узла (или узлов) одним запросом"""
+        return self._hierarchy(nodes, 'up', include_self)
+
+    def descendants(self, nodes: Union[int, models.Model, Iterable], include_self: bool = False):
+        """Все потомки узла (или узлов) одним запросом"""
+        return self._hierarchy(nodes, 'down', include_self)
+
+    def path_to_root(self, node: Union[int, models.Model]) -> List[models.Model]:
+        """
+        Путь от корня до узла (включительно).
+        Возвращает пустой список, если узел не найден.
+        """
+        node_id = _normalize_ids(node)[0]
+        by_id = {item.pk: item for item in self.ancestors(node_id, include_self=True)}
+
+        path = []
+        visited = set()
+        current = by_id.get(node_id)
+        while current is not None and current.pk not in visited:
+            visited.add(current.pk)
+            path.append(current)
+            current = by_id.get(current.parent_id)
+
+        path.reverse()
+        return path
+
+
+HierarchyManager = models.Manager.from_queryset(HierarchyQuerySet)
+
+
+def _rollup_subtree(rows, max_depth: Optional[int], summary_depth: Optional[int],
+                    instances_field: Optional[str]) -> List[Tuple]:
+    """
+    Сводка поддеревьев снизу вверх по строкам (id, parent_id, depth,
+    экземпляры, компоненты группы), упорядоченным по глубине. Узел, повторно
+    встреченный глубже (внутри поддерева другого узла nodes), сохраняет
+    меньшую глубину. Возвращает строки subtree_levels до глубины max_depth.
+    """
+    nodes = {}
+    children = defaultdict(list)
+    deepest = 0
+    for node_id, parent_id, depth, instances, components in rows:
+        deepest = max(deepest, depth)
+        if node_id in nodes:
+            continue
+        nodes[node_id] = (parent_id, depth, instances, components)
+        children[parent_id].append(node_id)
+
+    # Обход в глубину от узлов, родитель которых не входит в выборку:
+    # дети получают сводку раньше родителей
+    summaries = {}
+    stack = [(node_id, False) for node_id, (parent_id, *_) in nodes.items() if parent_id not in nodes]
+    while stack:
+        node_id, ready = stack.pop()
+        if not ready:
+            stack.append((node_id, True))
+            stack.extend((child_id, False) for child_id in children[node_id])
+            continue
+        groups, components, instances = 0, nodes[node_id][3], 0
+        for child_id in children[node_id]:
+            child_groups, child_components, child_instances = summaries[child_id]
+            child_own = nodes[child_id][2]
+            groups += child_groups + 1
+            components += child_components
+            instances += child_instances + (1 if child_own is None else child_own)
+        summaries[node_id] = (groups, components, instances)
+
+    if len(summaries) < len(nodes):
+        # Узлы без пути к узлу вне выборки - их цепочка parent замкнута
+        chain = {}
+        node_id = next(node_id for node_id in nodes if node_id not in summaries)
+        while node_id not in chain:
+            chain[node_id] = len(chain)
+            node_id = nodes[node_id][0]
+        raise HierarchyCycleError(list(chain)[chain[node_id]:])
+    if deepest > MAX_TREE_DEPTH:
+        raise ValueError(f"Глубина иерархии больше {MAX_TREE_DEPTH}")
+
+    result = []
+    for node_id, (parent_id, depth, _, _) in nodes.items():
+        if max_depth is not None and depth > max_depth:
+            continue
+        summary = (None, None, None)
+        if summary_depth is None or depth == summary_depth:
+            groups, components, instances = summaries[node_id]
+            summary = (groups, components, instances if instances_field else None)
+        result.append((node_id, parent_id, depth, *summary))
+    result.sort(key=lambda row: (row[2], row[0]))
+    return result
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.16 on 2026-10-18 02:51
+
+from django.db import migrations, models
+
+
+# Правила, которые раньше были зашиты в DrawioPalette.get_component_style
+DEFAULT_RULES = [
+    (10, r'^(database|rdbms|in-memory db|column-oriented db)$', 'dd_component_database'),
+    (20, r'^file storage$', 'dd_component_file_storage'),
+    (30, r'^message broker$', 'dd_component_message_broker'),
+    (40, r'^application$', 'dd_component_application'),
+]
+
+
+def create_default_rules(apps, schema_editor):
+    ComponentTypeStyleRule = apps.get_model('architecture', 'ComponentTypeStyleRule')
+    ComponentTypeStyleRule.objects.bulk_create([
+        ComponentTypeStyleRule(priority=priority, pattern=pattern, style=style)
+        for priority, pattern, style in DEFAULT_RULES
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('architecture', '0006_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComponentTypeStyleRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pattern', models.CharField(help_text='Регулярное выражение, без учета регистра', max_length=255, verbose_name='Шаблон названия типа')),
+                ('style', models.CharField(choices=[('dd_component', 'Компонент'), ('dd_component_database', 'База данных'), ('dd_component_file_storage', 'Файловое хранилище'), ('dd_component_message_broker', 'Брокер сообщений'), ('dd_component_application', 'Приложение')], max_length=64, verbose_name='Стиль')),
+                ('priority', models.IntegerField(default=100, help_text='Правила проверяются по возрастанию приоритета, применяется первое подходящее', verbose_name='Приоритет')),
+            ],
+            options={
+                'verbose_name': 'Правило стиля компонента',
+                'verbose_name_plural': 'Правила стилей компонентов',
+                'ordering': ['priority', 'id'],
+            },
+        ),
+        migrations.RunPython(create_default_rules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.16 on 2026-10-18 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('architecture', '0007_componenttypestylerule'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='c2component',
+            index=models.Index(fields=['group', 'id'], name='c2comp_group_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='c2component',
+            index=models.Index(fields=['type', 'id'], name='c2comp_type_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='c2component',
+            index=models.Index(fields=['is_external', 'id'], name='c2comp_external_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='c2group',
+            index=models.Index(fields=['parent', 'id'], name='c2group_parent_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='c2group',
+            index=models.Index(fields=['type', 'id'], name='c2group_type_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='c2link',
+            index=models.Index(fields=['component_from', 'id'], name='c2link_from_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='c2link',
+            index=models.Index(fields=['component_to', 'id'], name='c2link_to_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='c2linksinfoobjects',
+            index=models.Index(fields=['c2_link', 'id'], name='c2linkinfo_c2_link_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ddcomponent',
+            index=models.Index(fields=['group', 'id'], name='ddcomp_group_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ddcomponent',
+            index=models.Index(fields=['type', 'id'], name='ddcomp_type_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ddcomponent',
+            index=models.Index(fields=['is_external', 'id'], name='ddcomp_external_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ddgroup',
+            index=models.Index(fields=['parent', 'id'], name='ddgroup_parent_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ddgroup',
+            index=models.Index(fields=['type', 'id'], name='ddgroup_type_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ddlink',
+            index=models.Index(fields=['group_from', 'id'], name='ddlink_group_from_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ddlink',
+            index=models.Index(fields=['group_to', 'id'], name='ddlink_group_to_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ddlinkport',
+            index=models.Index(fields=['dd_link', 'id'], name='ddlinkport_dd_link_id_idx'),
+        ),
+    ]
@@ -1,5 +1,10 @@
+import re
+
+from django.core.exceptions import ValidationError
 from django.db import models
 
+from .managers import HierarchyManager
+
 # Create your models here.
 
 class ComponentType(models.Model):
@@ -14,6 +19,43 @@ class ComponentType(models.Model):
         return self.name
 
 
+class ComponentTypeStyleRule(models.Model):
+    """Правило выбора стиля компонента на диаграмме по названию его типа"""
+    STYLE_CHOICES = [
+        ('dd_component', 'Компонент'),
+        ('dd_component_database', 'База данных'),
+        ('dd_component_file_storage', 'Файловое хранилище'),
+        ('dd_component_message_broker', 'Брокер сообщений'),
+        ('dd_component_application', 'Приложение'),
+    ]
+    
+    pattern = models.CharField(
+        max_length=255,
+        verbose_name="Шаблон названия типа",
+        help_text="Регулярное выражение, без учета регистра"
+    )
+    style = models.CharField(max_length=64, choices=STYLE_CHOICES, verbose_name="Стиль")
+    priority = models.IntegerField(
+        default=100,
+        verbose_name="Приоритет",
+        help_text="Правила проверяются по возрастанию приоритета, применяется первое подходящее"
+    )
+    
+    class Meta:
+        verbose_name = "Правило стиля компонента"
+        verbose_name_plural = "Правила стилей компонентов"
+        ordering = ['priority', 'id']
+    
+    def __str__(self):
+        return f"{self.pattern} -> {self.style}"
+    
+    def clean(self):
+        try:
+            re.compile(self.pattern)
+        except re.error as e:
+            raise ValidationError({'pattern': f"Некорректное регулярное выражение: {e}"})
+
+
 class OperationType(models.Model):
     """Тип операции"""
     name = models.CharField(max_length=255, verbose_name="Название")
@@ -73,9 +115,16 @@ class DdGroup(models.Model):
     )
     specification = models.TextField(blank=True, verbose_name="Спецификация")
     
+    objects = HierarchyManager()
+    
     class Meta:
         verbose_name = "Группа DD"
         verbose_name_plural = "Группы DD"
+        # Фильтры списков API с keyset-пагинацией: WHERE поле = ... AND id > ... ORDER BY id
+        indexes = [
+            models.Index(fields=['parent', 'id'], name='ddgroup_parent_id_idx'),
+            models.Index(fields=['type', 'id'], name='ddgroup_type_id_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -109,9 +158,15 @@ class C2Group(models.Model):
         verbose_name="Тип"
     )
     
+    objects = HierarchyManager()
+    
     class Meta:
         verbose_name = "Группа C2"
         verbose_name_plural = "Группы C2"
+        indexes = [
+            models.Index(fields=['parent', 'id'], name='c2group_parent_id_idx'),
+            models.Index(fields=['type', 'id'], name='c2group_type_id_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -137,6 +192,11 @@ class C2Component(models.Model):
     class Meta:
         verbose_name = "Компонент C2"
         verbose_name_plural = "Компоненты C2"
+        indexes = [
+            models.Index(fields=['group', 'id'], name='c2comp_group_id_idx'),
+            models.Index(fields=['type', 'id'], name='c2comp_type_id_idx'),
+            models.Index(fields=['is_external', 'id'], name='c2comp_external_id_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -169,6 +229,11 @@ class DdComponent(models.Model):
     class Meta:
         verbose_name = "Компонент DD"
         verbose_name_plural = "Компоненты DD"
+        indexes = [
+            models.Index(fields=['group', 'id'], name='ddcomp_group_id_idx'),
+            models.Index(fields=['type', 'id'], name='ddcomp_type_id_idx'),
+            models.Index(fields=['is_external', 'id'], name='ddcomp_external_id_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -209,6 +274,10 @@ class DdLink(models.Model):
     class Meta:
         verbose_name = "Связь DD"
         verbose_name_plural = "Связи DD"
+        indexes = [
+            models.Index(fields=['group_from', 'id'], name='ddlink_group_from_id_idx'),
+            models.Index(fields=['group_to', 'id'], name='ddlink_group_to_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.group_from} -> {self.group_to} ({self.protocol})"
@@ -228,6 +297,9 @@ class DdLinkPort(models.Model):
     class Meta:
         verbose_name = "Порт связи DD"
         verbose_name_plural = "Порты связей DD"
+        indexes = [
+            models.Index(fields=['dd_link', 'id'], name='ddlinkport_dd_link_id_idx'),
+        ]
         unique_together = ['dd_link', 'port']
     
     def __str__(self):
@@ -255,6 +327,10 @@ class C2Link(models.Model):
     class Meta:
         verbose_name = "Связь C2"
         verbose_name_plural = "Связи C2"
+        indexes = [
+            models.Index(fields=['component_from', 'id'], name='c2link_from_id_idx'),
+            models.Index(fields=['component_to', 'id'], name='c2link_to_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.component_from} -> {self.component_to}"
@@ -281,7 +357,76 @@ class C2LinksInfoObjects(models.Model):
     class Meta:
         verbose_name = "Связь C2 - Информационный объект"
         verbose_name_plural = "Связи C2 - Информационные объекты"
+        indexes = [
+            models.Index(fields=['c2_link', 'id'], name='c2linkinfo_c2_link_id_idx'),
+        ]
         unique_together = ['c2_link', 'infoobject', 'operation_type']
     
     def __str__(self):
         return f"{self.c2_link} - {self.infoobject} ({self.operation_type})"
+
+
+class ExportJob(models.Model):
+    """Асинхронное задание экспорта в drawio"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+    kind = models.CharField(max_length=32, verbose_name="Вид экспорта")
+    params = models.JSONField(default=dict, verbose_name="Параметры")
+    params_hash = models.CharField(max_length=40, db_index=True, verbose_name="Хэш параметров")
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True,
+        verbose_name="Статус"
+    )
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name="Прогресс, %")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    result_path = models.CharField(max_length=500, blank=True, verbose_name="Файл результата")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начато")
+    # Аренда задания: воркер обновляет время, пока выполняет задание
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Последний сигнал воркера")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершено")
+    
+    class Meta:
+        verbose_name = "Задание экспорта"
+        verbose_name_plural = "Задания экспорта"
+        constraints = [
+            # Одновременно может выполняться только одно задание с одинаковыми параметрами
+            models.UniqueConstraint(
+                fields=['params_hash'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='unique_active_export_job',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+
+class CacheVersion(models.Model):
+    """
+    Счетчик версии кэшей экспорта (версия модели, таблиц, стилей, layout).
+    Хранится в базе данных, чтобы все процессы видели одну и ту же версию.
+    """
+    key = models.CharField(max_length=100, primary_key=True, verbose_name="Ключ")
+    value = models.BigIntegerField(verbose_name="Версия")
+    modified = models.FloatField(verbose_name="Время изменения (timestamp)")
+
+    class Meta:
+        verbose_name = "Версия кэша"
+        verbose_name_plural = "Версии кэша"
+
+    def __str__(self):
+        return f"{self.key}={self.value}"
@@ -0,0 +1,61 @@
+"""
+Keyset-пагинация списков API
+
+Страница выбирается условием id > after с сортировкой по первичному ключу,
+поэтому любая страница читается по индексу так же быстро, как первая, а
+COUNT(*) не нужен: запрашивается limit + 1 строка, и наличие лишней строки
+означает, что есть следующая страница.
+"""
+
+import inspect
+from functools import wraps
+from typing import Optional
+
+from django.conf import settings
+from ninja import Query
+
+
+# Наибольший размер страницы, если он не задан в настройках
+API_PAGE_MAX_LIMIT = 1000
+
+
+def keyset_paginated(view):
+    """
+    Декоратор операции ninja, возвращающей QuerySet.
+
+    Добавляет параметры ?limit= и ?after=. Без limit операция возвращает
+    весь список, как раньше; с limit - {"items": [...], "next": id} с не
+    более чем limit объектами, у которых id больше after. next - курсор
+    следующей страницы (None на последней странице).
+    """
+    @wraps(view)
+    def wrapper(request, *args, limit: Optional[int] = None, after: Optional[int] = None, **kwargs):
+        queryset = view(request, *args, **kwargs)
+        if limit is None:
+            return queryset
+        return paginate(queryset, limit, after)
+
+    # ninja берет параметры запроса из сигнатуры: limit и after добавляются к параметрам операции
+    signature = inspect.signature(view)
+    wrapper.__signature__ = signature.replace(parameters=[
+        *signature.parameters.values(),
+        inspect.Parameter('limit', inspect.Parameter.KEYWORD_ONLY, default=Query(None, ge=1),
+                          annotation=Optional[int]),
+        inspect.Parameter('after', inspect.Parameter.KEYWORD_ONLY, default=Query(None),
+                          annotation=Optional[int]),
+    ])
+    return wrapper
+
+
+def paginate(queryset, limit: int, after: Optional[int] = None) -> dict:
+    """Страница QuerySet по первичному ключу (limit ограничивается API_PAGE_MAX_LIMIT)"""
+    limit = min(limit, getattr(settings, 'API_PAGE_MAX_LIMIT', API_PAGE_MAX_LIMIT))
+    queryset = queryset.order_by('pk')
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    items = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = items[-1].pk
+    return {"items": items, "next": next_cursor}
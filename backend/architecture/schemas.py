@@ -1,8 +1,52 @@
-from ninja import Schema
-from typing import Optional, List
+from ninja import FilterSchema, Schema
+from typing import Generic, Optional, List, TypeVar, Union
 from datetime import datetime
 
 
+T = TypeVar('T')
+
+
+# Pagination schemas
+class KeysetPageSchema(Schema, Generic[T]):
+    items: List[T]
+    next: Optional[int] = None
+
+
+def paginated(schema):
+    """Ответ списка с необязательной keyset-пагинацией: весь список или страница"""
+    return Union[List[schema], KeysetPageSchema[schema]]
+
+
+# Filter schemas: параметры запроса списков, пустые параметры не фильтруют
+class GroupFilterSchema(FilterSchema):
+    parent_id: Optional[int] = None
+    type_id: Optional[int] = None
+
+
+class ComponentFilterSchema(FilterSchema):
+    group_id: Optional[int] = None
+    type_id: Optional[int] = None
+    is_external: Optional[bool] = None
+
+
+class DdLinkFilterSchema(FilterSchema):
+    group_from_id: Optional[int] = None
+    group_to_id: Optional[int] = None
+
+
+class DdLinkPortFilterSchema(FilterSchema):
+    dd_link_id: Optional[int] = None
+
+
+class C2LinkFilterSchema(FilterSchema):
+    component_from_id: Optional[int] = None
+    component_to_id: Optional[int] = None
+
+
+class C2LinksInfoObjectsFilterSchema(FilterSchema):
+    c2_link_id: Optional[int] = None
+
+
 # Base schemas
 class ComponentTypeSchema(Schema):
     id: int
@@ -74,6 +118,10 @@ class DdGroupUpdateSchema(Schema):
     specification: Optional[str] = None
 
 
+class DdGroupBulkUpdateSchema(DdGroupUpdateSchema):
+    id: int
+
+
 # C2 Group schemas
 class C2GroupTypeSchema(Schema):
     id: int
@@ -171,6 +219,10 @@ class DdComponentUpdateSchema(Schema):
     is_external: Optional[bool] = None
 
 
+class DdComponentBulkUpdateSchema(DdComponentUpdateSchema):
+    id: int
+
+
 # Link schemas
 class DdLinkProtocolSchema(Schema):
     id: int
@@ -216,6 +268,10 @@ class DdLinkUpdateSchema(Schema):
     protocol_id: Optional[int] = None
 
 
+class DdLinkBulkUpdateSchema(DdLinkUpdateSchema):
+    id: int
+
+
 class DdLinkDetailSchema(Schema):
     id: int
     group_from_id: int
@@ -285,10 +341,34 @@ class ErrorSchema(Schema):
     detail: str
 
 
+# Bulk schemas
+class BulkItemErrorSchema(Schema):
+    index: int
+    field: Optional[str] = None
+    detail: str
+
+
+class BulkErrorSchema(Schema):
+    detail: str
+    errors: List[BulkItemErrorSchema]
+
+
+class BulkResultSchema(Schema):
+    ids: List[int]
+
+
+class BulkDeleteSchema(Schema):
+    ids: List[int]
+
+
 # Export schemas
 class ExportElementSchema(Schema):
     element_id: int
-    element_type: str
+    element_type: str  # ddgroup | ddcomponent | c2group | c2component
+    compressed: bool = False
+    packing: str = 'shelf'  # grid | shelf | skyline
+    max_depth: Optional[int] = None  # ниже этой глубины поддеревья заменяются сводкой
+    collapse_threshold: Optional[int] = None  # сводкой заменяются поддеревья больше N элементов
 
 
 class ExportElementMultipleItemSchema(Schema):
@@ -298,7 +378,44 @@ class ExportElementMultipleItemSchema(Schema):
 
 class ExportMultipleElementsSchema(Schema):
     elements: List[ExportElementMultipleItemSchema]
+    compressed: bool = False
+    packing: str = 'shelf'  # grid | shelf | skyline
+    max_depth: Optional[int] = None  # ниже этой глубины поддеревья заменяются сводкой
+    collapse_threshold: Optional[int] = None  # сводкой заменяются поддеревья больше N элементов
 
 
 class ExportAllGroupsSchema(Schema):
-    root_group_id: Optional[int] = None 
\ No newline at end of file
+    root_group_id: Optional[int] = None
+    compressed: bool = False
+    packing: str = 'shelf'  # grid | shelf | skyline
+    max_depth: Optional[int] = None  # ниже этой глубины поддеревья заменяются сводкой
+    collapse_threshold: Optional[int] = None  # сводкой заменяются поддеревья больше N элементов
+    pages: bool = False  # по странице на группу глубины page_depth и страница содержания
+    page_depth: int = 0
+
+
+# Export job schemas
+class ExportJobCreateSchema(Schema):
+    kind: str  # element | multiple | all
+    params: dict = {}
+
+
+class ExportJobSchema(Schema):
+    id: int
+    kind: str
+    status: str
+    progress: int
+    error: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+# Import schemas
+class DrawioImportResultSchema(Schema):
+    groups: int
+    components: int
+    group_types: int
+    component_types: int
+    skipped_components: int
@@ -0,0 +1,96 @@
+"""
+Сигналы моделей архитектуры
+"""
+
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .export.cache import bump_model_version, bump_table_version
+from .export.layout_cache import LayoutCache, bump_layout_generation, layout_cache_enabled
+from .export.styles import bump_component_styles_version
+from .models import (
+    C2Component, C2Group, C2GroupType, C2Link, C2LinksInfoObjects, CacheVersion, ComponentType, ComponentTypeStyleRule,
+    DdGroupType, DdGroup, DdComponent, DdLinkProtocol, DdLink, DdLinkPort, ExportJob, InfoObject, OperationType
+)
+
+
+# Модели, изменение которых влияет на результат экспорта в drawio
+EXPORT_DEPENDENT_MODELS = (
+    DdGroup, DdComponent, DdGroupType, ComponentType, ComponentTypeStyleRule,
+    DdLink, DdLinkPort, DdLinkProtocol,
+    C2Group, C2Component, C2GroupType, C2Link, C2LinksInfoObjects, InfoObject, OperationType,
+)
+
+
+def invalidate_export_cache(sender, **kwargs):
+    """
+    Увеличивает версию модели после фиксации транзакции - закэшированные
+    экспорты становятся недействительными
+    """
+    bump_model_version()
+
+
+def invalidate_table_version(sender, **kwargs):
+    """
+    Увеличивает версию таблицы (ETag и Last-Modified списков) после фиксации
+    транзакции: до нее другие запросы еще видят прежние данные
+    """
+    bump_table_version(sender._meta.db_table)
+
+
+def remember_previous_group(sender, instance, **kwargs):
+    """
+    Запоминает прежнюю родительскую группу перед сохранением: при переносе
+    группы или компонента layout нужно сбросить и у старой, и у новой ветки.
+    При выключенном кэше layout запрос не нужен
+    """
+    instance._previous_layout_group_id = None
+    if not layout_cache_enabled():
+        return
+    field = 'parent_id' if sender is DdGroup else 'group_id'
+    if instance.pk is not None:
+        instance._previous_layout_group_id = (
+            sender._base_manager.filter(pk=instance.pk).values_list(field, flat=True).first()
+        )
+
+
+def invalidate_group_layout(sender, instance, **kwargs):
+    """Сбрасывает кэш layout группы и всех ее предков"""
+    if sender is DdGroup:
+        group_ids = [instance.parent_id]
+        if kwargs.get('signal') is not post_delete:
+            group_ids.append(instance.pk)
+    else:
+        group_ids = [instance.group_id]
+    group_ids.append(getattr(instance, '_previous_layout_group_id', None))
+    LayoutCache().invalidate(group_ids)
+
+
+def invalidate_component_styles(sender, **kwargs):
+    """
+    Изменение типов компонентов или правил стилей может поменять стили
+    и размеры всех групп
+    """
+    bump_component_styles_version()
+    bump_layout_generation()
+
+
+def connect_signals():
+    for model in apps.get_app_config('architecture').get_models():
+        if model in (ExportJob, CacheVersion):
+            continue
+        post_save.connect(invalidate_table_version, sender=model, dispatch_uid=f'table_version_save_{model.__name__}')
+        post_delete.connect(invalidate_table_version, sender=model, dispatch_uid=f'table_version_delete_{model.__name__}')
+
+    for model in EXPORT_DEPENDENT_MODELS:
+        post_save.connect(invalidate_export_cache, sender=model, dispatch_uid=f'export_cache_save_{model.__name__}')
+        post_delete.connect(invalidate_export_cache, sender=model, dispatch_uid=f'export_cache_delete_{model.__name__}')
+
+    for model in (DdGroup, DdComponent):
+        pre_save.connect(remember_previous_group, sender=model, dispatch_uid=f'layout_cache_pre_save_{model.__name__}')
+        post_save.connect(invalidate_group_layout, sender=model, dispatch_uid=f'layout_cache_save_{model.__name__}')
+        post_delete.connect(invalidate_group_layout, sender=model, dispatch_uid=f'layout_cache_delete_{model.__name__}')
+
+    for model in (ComponentType, ComponentTypeStyleRule):
+        post_save.connect(invalidate_component_styles, sender=model, dispatch_uid=f'component_styles_save_{model.__name__}')
+        post_delete.connect(invalidate_component_styles, sender=model, dispatch_uid=f'component_styles_delete_{model.__name__}')
@@ -1,3 +1,1719 @@
-from django.test import TestCase
+import base64
+import multiprocessing
+import os
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+import zlib
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from ninja.testing import TestClient
+
+from .api import router
+from .benchmarks.export import SHAPES, compare, generate_tree, run_suite
+from .benchmarks.packing import legacy_first_fit, make_children
+from .export.cache import (
+    TABLE_VERSION_KEY, bump_model_version, bump_table_version, export_cache, get_model_version, get_table_versions,
+)
+from .export.drawio_export import DrawioExporter
+from .export.drawio_import import DrawioImporter, DrawioImportError
+from .export.layout import SizeNode
+from .export.packing import PACKERS
+from .export.c2_export import C2DrawioExporter, get_c2_link_label
+from .export import jobs
+from .export.compression import compress_diagram, decompress_diagram
+from .export.palette import DrawioPalette
+from .export.serializers import ElementTreeCellSerializer, TemplateCellSerializer, get_cell_serializer
+from .export.styles import get_component_style_resolver
+from .export.tree_loader import DdTreeIndex, HierarchyCycleError
+from .managers import HierarchyQuerySet
+from .models import (
+    C2Component, C2Group, C2GroupType, C2Link, C2LinksInfoObjects, CacheVersion, ComponentType, ComponentTypeStyleRule,
+    DdComponent, DdGroup, DdGroupType, DdLink, DdLinkPort, DdLinkProtocol, ExportJob, InfoObject, OperationType
+)
+
+
+def build_dd_tree(depth=4, fan_out=2, components_per_group=2):
+    """Создает корневые группы с поддеревьями заданной глубины и ширины"""
+    group_type = DdGroupType.objects.create(name='Cluster')
+    component_types = [
+        ComponentType.objects.create(name=name)
+        for name in ('Application', 'Database', 'Message Broker')
+    ]
+
+    def create_group(parent, level, index):
+        group = DdGroup.objects.create(
+            parent=parent,
+            name=f'group-{level}-{index}',
+            type=group_type,
+            instances=index,
+        )
+        for i in range(components_per_group + index % 2):
+            DdComponent.objects.create(
+                group=group,
+                name=f'component-{level}-{index}-{i}',
+                type=component_types[i % len(component_types)],
+            )
+        if level < depth:
+            for i in range(fan_out + level % 2):
+                create_group(group, level + 1, i)
+        return group
+
+    return [create_group(None, 1, index) for index in range(2)]
+
+
+class TreeLoaderTests(TestCase):
+    """Загрузка дерева DD в память фиксированным числом запросов"""
+
+    def link_all(self, groups, protocol):
+        for group_from, group_to in zip(groups, groups[1:]):
+            link = DdLink.objects.create(group_from=group_from, group_to=group_to, protocol=protocol)
+            DdLinkPort.objects.create(dd_link=link, port=443)
+
+    def load(self, root_ids=None):
+        # Группы, компоненты, связи с протоколами, порты
+        with self.assertNumQueries(4):
+            index = DdTreeIndex.load(root_ids)
+            links = index.load_links()
+            # Типы загружены вместе с группами и компонентами
+            for group in index.groups.values():
+                group.type.name
+                for component in index.components.get(group.id, []):
+                    component.type.name
+            for root in index.get_roots():
+                index.get_children(root)
+        return index, links
+
+    def test_query_count_does_not_depend_on_tree_size(self):
+        protocol = DdLinkProtocol.objects.create(name='HTTPS')
+        self.link_all(build_dd_tree(depth=2), protocol)
+        small, small_links = self.load()
+
+        roots = build_dd_tree(depth=5)
+        self.link_all(list(DdGroup.objects.filter(parent__isnull=False).order_by('id')), protocol)
+        large, large_links = self.load()
+        self.assertGreater(len(large.groups), 10 * len(small.groups))
+        self.assertGreater(len(large_links), len(small_links))
+        self.assertEqual(len(large.groups), DdGroup.objects.count())
+        self.assertEqual(sum(map(len, large.components.values())), DdComponent.objects.count())
+
+        scoped, _ = self.load([roots[0].id])
+        self.assertEqual(set(scoped.groups), scoped.get_subtree_ids([roots[0].id]))
+
+
+class HierarchyQueryTests(TestCase):
+    """Предки, потомки и путь до корня: рекурсивный CTE и обход по уровням"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=3)
+        cls.leaf = DdGroup.objects.filter(parent__parent=cls.roots[0]).order_by('id').first()
+
+    def recursive_cte(self, enabled):
+        return mock.patch.object(HierarchyQuerySet, '_supports_recursive_cte', return_value=enabled)
+
+    def expected_subtree(self, group):
+        result = {group.id}
+        for child in group.ddgroup_set.all():
+            result |= self.expected_subtree(child)
+        return result
+
+    def test_ancestors_descendants_and_path(self):
+        middle = self.leaf.parent
+        for recursive in (True, False):
+            with self.subTest(recursive_cte=recursive), self.recursive_cte(recursive):
+                self.assertEqual(set(DdGroup.objects.ancestors(self.leaf).values_list('id', flat=True)),
+                                 {middle.id, self.roots[0].id})
+                self.assertEqual(set(DdGroup.objects.descendants(self.roots[0], include_self=True)
+                                     .values_list('id', flat=True)), self.expected_subtree(self.roots[0]))
+                self.assertNotIn(self.roots[0].id,
+                                 DdGroup.objects.descendants(self.roots[0]).values_list('id', flat=True))
+                self.assertEqual([group.id for group in DdGroup.objects.path_to_root(self.leaf.id)],
+                                 [self.roots[0].id, middle.id, self.leaf.id])
+                self.assertEqual(DdGroup.objects.path_to_root(0), [])
+
+    def test_cycle_terminates(self):
+        middle = self.leaf.parent
+        DdGroup.objects.filter(id=self.roots[0].id).update(parent=self.leaf)
+        cycle = {self.roots[0].id, middle.id, self.leaf.id}
+        for recursive in (True, False):
+            with self.subTest(recursive_cte=recursive), self.recursive_cte(recursive):
+                self.assertEqual(set(DdGroup.objects.ancestors(self.leaf, include_self=True)
+                                     .values_list('id', flat=True)), cycle)
+                self.assertTrue(cycle <= set(DdGroup.objects.descendants(self.leaf, include_self=True)
+                                             .values_list('id', flat=True)))
+                self.assertEqual({group.id for group in DdGroup.objects.path_to_root(self.leaf.id)}, cycle)
+
+    def test_path_and_subtree_endpoints(self):
+        client = TestClient(router)
+        response = client.get(f'/dd-groups/{self.leaf.id}/path')
+        self.assertEqual([group['id'] for group in response.json()],
+                         [self.roots[0].id, self.leaf.parent_id, self.leaf.id])
+        response = client.get(f'/dd-groups/{self.roots[1].id}/subtree')
+        self.assertEqual({group['id'] for group in response.json()}, self.expected_subtree(self.roots[1]))
+        self.assertEqual(client.get('/dd-groups/0/path').status_code, 404)
+        self.assertEqual(client.get('/dd-groups/0/subtree').status_code, 404)
+        self.assertEqual(client.get('/c2-groups/0/path').status_code, 404)
+
+
+@override_settings(EXPORT_LAYOUT_CACHE_ENABLED=True)
+class LayoutCacheTests(TestCase):
+    """Инкрементальный пересчет layout совпадает с полным пересчетом"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree()
+        cls.component_type = ComponentType.objects.get(name='Application')
+
+    def setUp(self):
+        caches['layout'].clear()
+        caches['default'].clear()
+
+    def export(self, use_layout_cache=True, root_group_id=None):
+        exporter = DrawioExporter(use_layout_cache=use_layout_cache)
+        return exporter, exporter.export_dd_groups_to_drawio(root_group_id)
+
+    def deepest_group(self):
+        group = self.roots[0]
+        while DdGroup.objects.filter(parent=group).exists():
+            group = DdGroup.objects.filter(parent=group).order_by('id').first()
+        return group
+
+    def test_cold_and_warm_cache_match_full_recalculation(self):
+        _, expected = self.export(use_layout_cache=False)
+
+        cold, cold_xml = self.export()
+        warm, warm_xml = self.export()
+
+        self.assertEqual(cold_xml, expected)
+        self.assertEqual(warm_xml, expected)
+        self.assertEqual(cold.layout_stats['reused'], 0)
+        self.assertEqual(warm.layout_stats['computed'], 0)
+        self.assertEqual(warm.layout_stats['reused'], cold.layout_stats['computed'])
+
+    def test_component_change_recomputes_only_path_to_root(self):
+        self.export()
+        group = self.deepest_group()
+        path = DdGroup.objects.path_to_root(group)
+
+        DdComponent.objects.create(group=group, name='new', type=self.component_type)
+
+        exporter, xml = self.export()
+        _, expected = self.export(use_layout_cache=False)
+
+        self.assertEqual(xml, expected)
+        self.assertEqual(exporter.layout_stats['computed'], len(path))
+
+    def test_moving_group_recomputes_both_branches(self):
+        self.export()
+        group = self.deepest_group()
+        old_path = DdGroup.objects.path_to_root(group)
+        new_parent = self.roots[1]
+
+        group.parent = new_parent
+        group.save()
+
+        exporter, xml = self.export()
+        _, expected = self.export(use_layout_cache=False)
+
+        self.assertEqual(xml, expected)
+        # Старая ветка вместе с самой группой и новый родитель
+        self.assertEqual(exporter.layout_stats['computed'], len(old_path) + 1)
+
+    def test_deleted_component_is_not_served_from_cache(self):
+        self.export()
+        group = self.deepest_group()
+        DdComponent.objects.filter(group=group).first().delete()
+
+        _, xml = self.export()
+        _, expected = self.export(use_layout_cache=False)
+
+        self.assertEqual(xml, expected)
+
+    def test_stale_entry_is_detected_without_signals(self):
+        self.export()
+        group = self.deepest_group()
+        # bulk_create не отправляет сигналы - запись должна отбраковаться
+        # по списку детей
+        DdComponent.objects.bulk_create([
+            DdComponent(group=group, name=f'bulk-{i}', type=self.component_type)
+            for i in range(5)
+        ])
+
+        _, xml = self.export()
+        _, expected = self.export(use_layout_cache=False)
+
+        self.assertEqual(xml, expected)
+
+    def test_subtree_export_uses_cache(self):
+        self.export()
+        group = DdGroup.objects.filter(parent=self.roots[0]).order_by('id').first()
+
+        exporter, xml = self.export(root_group_id=group.id)
+        _, expected = self.export(use_layout_cache=False, root_group_id=group.id)
+
+        self.assertEqual(xml, expected)
+        # Пересчитываются только группы пути с отфильтрованными детьми:
+        # корень и сама экспортируемая группа
+        self.assertEqual(exporter.layout_stats['computed'], 2)
+
+    def test_disabled_cache_costs_no_queries_on_save(self):
+        group = self.deepest_group()
+        with self.captureOnCommitCallbacks(execute=True):
+            # Первое сохранение создает строки версий
+            group.save()
+        group.parent = self.roots[1]
+        # UPDATE группы и после фиксации - версии таблицы и модели
+        with override_settings(EXPORT_LAYOUT_CACHE_ENABLED=False):
+            with self.assertNumQueries(3), self.captureOnCommitCallbacks(execute=True):
+                group.save()
+        # Включенный кэш читает прежнего родителя, предков групп и поколение кэша
+        group.parent = self.roots[0]
+        with self.assertNumQueries(6), self.captureOnCommitCallbacks(execute=True):
+            group.save()
+
+
+@override_settings(EXPORT_LAYOUT_PARALLEL_MIN_GROUPS=0, EXPORT_LAYOUT_CACHE_ENABLED=True)
+class ParallelLayoutTests(TestCase):
+    """Параллельный расчет layout корневых групп"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=3)
+
+    def setUp(self):
+        caches['layout'].clear()
+
+    def test_parallel_layout_matches_sequential(self):
+        expected = DrawioExporter(use_layout_cache=False).export_dd_groups_to_drawio()
+
+        exporter = DrawioExporter(use_layout_cache=True, layout_processes=2)
+        self.assertEqual(exporter.export_dd_groups_to_drawio(), expected)
+        self.assertEqual(''.join(DrawioExporter(layout_processes=2).stream_dd_groups_to_drawio()), expected)
+
+        # Записи кэша, рассчитанные в процессах пула, сохраняются в родительском
+        warm = DrawioExporter(use_layout_cache=True, layout_processes=2)
+        self.assertEqual(warm.export_dd_groups_to_drawio(), expected)
+        self.assertEqual(warm.layout_stats['computed'], 0)
+        self.assertEqual(warm.layout_stats['reused'], exporter.layout_stats['computed'])
+
+    def test_pool_is_closed_before_layouts_are_consumed(self):
+        exporter = DrawioExporter(use_layout_cache=False, layout_processes=2)
+        layouts = exporter._iter_root_layouts(exporter._resolve_root_groups())
+        next(layouts)
+        # Потребитель остановился на первой корневой группе - процессов пула уже нет
+        self.assertEqual(multiprocessing.active_children(), [])
+        layouts.close()
+
+
+class DeepHierarchyTests(TestCase):
+    """Экспорт глубоких и зацикленных иерархий"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group_type = DdGroupType.objects.create(name='Node')
+        cls.component_type = ComponentType.objects.create(name='Application')
+
+    def create_chain(self, depth):
+        # Одним запросом: сигналы сохранения для каждой группы здесь не нужны
+        first_id = (DdGroup.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        groups = DdGroup.objects.bulk_create([
+            DdGroup(
+                id=first_id + level,
+                parent_id=first_id + level - 1 if level else None,
+                name=f'level-{level}',
+                type=self.group_type,
+            )
+            for level in range(depth)
+        ])
+        DdComponent.objects.create(group=groups[-1], name='leaf', type=self.component_type)
+        return groups
+
+    def test_chain_deeper_than_recursion_limit(self):
+        depth = sys.getrecursionlimit() + 200
+        chain = self.create_chain(depth)
+
+        xml = DrawioExporter(use_layout_cache=False).export_dd_groups_to_drawio()
+        self.assertEqual(xml.count('c4Name="level-'), depth)
+
+        # Экспорт самой глубокой группы строит путь от корня
+        xml = DrawioExporter(use_layout_cache=False).export_dd_groups_to_drawio(chain[-1].id)
+        self.assertEqual(xml.count('c4Name="level-'), depth)
+
+    def test_cycle_is_reported_with_group_ids(self):
+        chain = self.create_chain(4)
+        # Замыкаем цепочку: корень становится потомком последней группы
+        DdGroup.objects.filter(id=chain[1].id).update(parent=chain[3])
+
+        with self.assertRaises(HierarchyCycleError) as context:
+            DrawioExporter(use_layout_cache=False).export_dd_groups_to_drawio(chain[2].id)
+        self.assertEqual(sorted(context.exception.group_ids), [group.id for group in chain[1:]])
+        for group in chain[1:]:
+            self.assertIn(str(group.id), str(context.exception))
+
+        with self.assertRaises(HierarchyCycleError):
+            DrawioExporter(use_layout_cache=False).export_multiple_elements_to_drawio(
+                [{'id': chain[1].id, 'type': 'ddgroup'}]
+            )
+
+    def test_full_export_reports_groups_unreachable_from_roots(self):
+        root = self.create_chain(2)[0]
+        group_a = DdGroup.objects.create(name='cycle-a', type=self.group_type)
+        group_b = DdGroup.objects.create(name='cycle-b', type=self.group_type, parent=group_a)
+        DdGroup.objects.filter(id=group_a.id).update(parent=group_b)
+
+        for export in (
+            lambda exporter: exporter.export_dd_groups_to_drawio(),
+            lambda exporter: ''.join(exporter.stream_dd_groups_to_drawio()),
+            lambda exporter: exporter.export_pages_to_drawio(),
+        ):
+            with self.assertRaises(HierarchyCycleError) as context:
+                export(DrawioExporter(use_layout_cache=False))
+            self.assertEqual(sorted(context.exception.group_ids), [group_a.id, group_b.id])
+
+        # Поддерево корня экспортируется как прежде
+        xml = DrawioExporter(use_layout_cache=False).export_dd_groups_to_drawio(root.id)
+        self.assertEqual(xml.count('c4Name="level-'), 2)
+
+
+class PackingTests(SimpleTestCase):
+    """Алгоритмы размещения детей группы"""
+
+    spacing = 30
+    max_row_width = 1200
+
+    def test_children_are_placed_once_without_overlaps(self):
+        children = make_children(300, seed=1)
+        for strategy, packer in PACKERS.items():
+            with self.subTest(strategy=strategy):
+                positions, width, height = packer(children, self.spacing, self.max_row_width)
+
+                self.assertCountEqual([index for index, _, _ in positions], range(len(children)))
+                for index, x, y in positions:
+                    self.assertLessEqual(x + children[index][0], width)
+                    self.assertLessEqual(y + children[index][1], height)
+
+                # Прямоугольники с учетом отступа не пересекаются
+                rects = sorted(
+                    (x, y, x + children[index][0] + self.spacing, y + children[index][1] + self.spacing)
+                    for index, x, y in positions
+                )
+                for i, (x1, y1, x2, y2) in enumerate(rects):
+                    for other_x1, other_y1, other_x2, other_y2 in rects[i + 1:]:
+                        if other_x1 >= x2:
+                            break
+                        self.assertTrue(other_y1 >= y2 or other_y2 <= y1)
+
+    def test_shelf_matches_previous_row_algorithm(self):
+        for count in (1, 10, 500):
+            children = make_children(count, seed=count)
+            _, width, height = PACKERS['shelf'](children, self.spacing, self.max_row_width)
+            _, expected_width, expected_height = legacy_first_fit(children, self.spacing, self.max_row_width)
+            self.assertEqual((width, height), (expected_width, expected_height))
+
+    def test_skyline_fills_area_better_than_shelf(self):
+        children = make_children(1000)
+        _, shelf_width, shelf_height = PACKERS['shelf'](children, self.spacing, self.max_row_width)
+        _, skyline_width, skyline_height = PACKERS['skyline'](children, self.spacing, self.max_row_width)
+        self.assertLess(skyline_width * skyline_height, shelf_width * shelf_height)
+
+    def test_grid_strategy_and_validation(self):
+        children = [SizeNode('component', None, width, height) for width, height in make_children(20, seed=2)]
+        size_info = DrawioExporter(use_layout_cache=False, packing='grid')._layout_children(None, children)
+        self.assertEqual(size_info.placement.layout_type, 'grid')
+
+        with self.assertRaises(ValueError):
+            DrawioExporter(packing='unknown')
+
+
+class CellSerializerTests(TestCase):
+    """Сериализация ячеек по шаблонам совпадает с ElementTree"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=3)
+        group = DdGroup.objects.filter(parent=cls.roots[0]).order_by('id').first()
+        group.name = 'Кластер "A" & <B> {0} %c4Name%'
+        group.specification = 'line 1\r\nline\t2'
+        group.save()
+        DdComponent.objects.filter(group=group).update(
+            technology='Java & "Spring"', description='<script>\n{}</script>'
+        )
+        protocol = DdLinkProtocol.objects.create(name='gRPC <internal>')
+        DdLink.objects.create(group_from=group, group_to=cls.roots[1], protocol=protocol)
+
+    def structure(self, xml):
+        return [(element.tag, element.attrib, element.text) for element in ET.fromstring(xml).iter()]
+
+    def export(self, serializer, **kwargs):
+        return DrawioExporter(use_layout_cache=False, serializer=serializer, **kwargs)
+
+    def test_documents_are_structurally_equal(self):
+        elements = [{'id': self.roots[0].id, 'type': 'ddgroup'}, {'id': DdComponent.objects.last().id, 'type': 'ddcomponent'}]
+        for name, export in (
+            ('all', lambda exporter: exporter.export_dd_groups_to_drawio()),
+            ('subtree', lambda exporter: exporter.export_dd_groups_to_drawio(self.roots[0].id)),
+            ('stream', lambda exporter: ''.join(exporter.stream_dd_groups_to_drawio())),
+            ('multiple', lambda exporter: exporter.export_multiple_elements_to_drawio(elements)),
+        ):
+            with self.subTest(export=name):
+                expected = export(self.export('elementtree'))
+                xml = export(self.export('template'))
+                self.assertEqual(self.structure(xml), self.structure(expected))
+                self.assertEqual(xml, expected)
+
+    def test_compressed_documents_are_equal(self):
+        expected = self.export('elementtree', compressed=True).export_dd_groups_to_drawio()
+        xml = self.export('template', compressed=True).export_dd_groups_to_drawio()
+
+        diagram = ET.fromstring(xml).find('diagram')
+        expected_diagram = ET.fromstring(expected).find('diagram')
+        self.assertEqual(
+            self.structure(decompress_diagram(diagram.text)),
+            self.structure(decompress_diagram(expected_diagram.text)),
+        )
+        self.assertEqual(xml, expected)
+
+    def test_special_characters_survive_round_trip(self):
+        xml = self.export('template').export_dd_groups_to_drawio(self.roots[0].id)
+        objects = {element.get('c4Name'): element for element in ET.fromstring(xml).iter('object')}
+
+        group = objects['Кластер "A" & <B> {0} %c4Name%']
+        self.assertEqual(group.get('c4Specifications'), 'Cluster\nline 1\r\nline\t2')
+        self.assertEqual(group.get('label'), DrawioPalette.STYLES['dd_group'].label_template)
+        self.assertIn('<script>\n{}</script>', [element.get('c4Description') for element in objects.values()])
+
+    @override_settings(EXPORT_CELL_SERIALIZER='elementtree')
+    def test_serializer_is_selected_by_setting(self):
+        self.assertIsInstance(DrawioExporter().serializer, ElementTreeCellSerializer)
+        self.assertIsInstance(DrawioExporter(serializer='template').serializer, TemplateCellSerializer)
+        with self.assertRaises(ValueError):
+            get_cell_serializer('lxml')
+
+
+class ComponentStyleTests(TestCase):
+    """Стили компонентов по правилам ComponentTypeStyleRule"""
+
+    def component(self, type_name):
+        component_type = ComponentType.objects.create(name=type_name)
+        return DdComponent(name=type_name, type=component_type)
+
+    def test_default_rules_match_palette_styles(self):
+        expected = {
+            'Database': 'dd_component_database',
+            'RDBMS': 'dd_component_database',
+            'In-memory DB': 'dd_component_database',
+            'File Storage': 'dd_component_file_storage',
+            'Message Broker': 'dd_component_message_broker',
+            'Application': 'dd_component_application',
+            'Service': 'dd_component',
+        }
+        components = {type_name: self.component(type_name) for type_name in expected}
+
+        resolver = get_component_style_resolver()
+        with self.assertNumQueries(0):
+            for type_name, style in expected.items():
+                self.assertIs(resolver.get_component_style(components[type_name]), DrawioPalette.STYLES[style])
+
+    def test_rule_changes_rebuild_style_table(self):
+        component = self.component('Redis Cache')
+        self.assertIs(DrawioPalette.get_component_style(component), DrawioPalette.STYLES['dd_component'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rule = ComponentTypeStyleRule.objects.create(pattern=r'\bcache$', style='dd_component_database', priority=1)
+        self.assertIs(DrawioPalette.get_component_style(component), DrawioPalette.STYLES['dd_component_database'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.delete()
+        self.assertIs(DrawioPalette.get_component_style(component), DrawioPalette.STYLES['dd_component'])
+
+
+class LinkExportTests(TestCase):
+    """Экспорт связей DD"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=3)
+        cls.https = DdLinkProtocol.objects.create(name='HTTPS')
+        cls.amqp = DdLinkProtocol.objects.create(name='AMQP')
+
+    def link(self, group_from, group_to, protocol, ports=()):
+        link = DdLink.objects.create(group_from=group_from, group_to=group_to, protocol=protocol)
+        for port in ports:
+            DdLinkPort.objects.create(dd_link=link, port=port)
+        return link
+
+    def edges(self, xml):
+        return [
+            element for element in ET.fromstring(xml).iter('object')
+            if element.get('c4Type') == 'Relationship'
+        ]
+
+    def test_links_are_exported_as_edges(self):
+        first_child = DdGroup.objects.filter(parent=self.roots[0]).order_by('id').first()
+        self.link(self.roots[0], self.roots[1], self.https, ports=[8443, 443])
+        self.link(first_child, self.roots[1], self.amqp)
+
+        xml = DrawioExporter(use_layout_cache=False).export_dd_groups_to_drawio()
+        cells = {
+            element.get('id'): element.get('c4Name')
+            for element in ET.fromstring(xml).iter('object')
+        }
+        edges = self.edges(xml)
+
+        self.assertEqual([edge.get('c4Technology') for edge in edges], ['HTTPS :443, :8443', 'AMQP'])
+        source, target = edges[1].find('mxCell').get('source'), edges[1].find('mxCell').get('target')
+        self.assertEqual(cells[source], first_child.name)
+        self.assertEqual(cells[target], self.roots[1].name)
+        self.assertEqual(edges[1].find('mxCell').get('edge'), '1')
+
+    def test_subtree_export_keeps_only_links_inside_diagram(self):
+        subtree_root = DdGroup.objects.filter(parent=self.roots[0]).order_by('id').first()
+        leaf = DdGroup.objects.filter(parent=subtree_root).order_by('id').first()
+        self.link(subtree_root, leaf, self.https, ports=[443])
+        self.link(leaf, self.roots[0], self.https)  # корень - на пути до группы
+        self.link(leaf, self.roots[1], self.https)  # вне диаграммы
+
+        xml = DrawioExporter(use_layout_cache=False).export_dd_groups_to_drawio(subtree_root.id)
+        self.assertEqual(len(self.edges(xml)), 2)
+
+        xml = DrawioExporter(use_layout_cache=False, include_links=False).export_dd_groups_to_drawio(subtree_root.id)
+        self.assertEqual(self.edges(xml), [])
+
+    def test_links_load_in_constant_number_of_queries(self):
+        groups = list(DdGroup.objects.order_by('id'))
+        for index, group in enumerate(groups):
+            self.link(group, groups[-1 - index], self.https, ports=[443, 8000 + index])
+
+        # Версия стилей компонентов, группы и компоненты, связи с протоколами, порты
+        get_component_style_resolver()
+        with self.assertNumQueries(5):
+            xml = DrawioExporter(use_layout_cache=False).export_dd_groups_to_drawio()
+        self.assertEqual(len(self.edges(xml)), len(groups))
+
+
+class CompressionTests(SimpleTestCase):
+    """Сжатие диаграмм в формате draw.io"""
+
+    def test_round_trip_and_format(self):
+        xml = '<mxGraphModel><root><mxCell id="0" value="Заказы &amp; оплата (v2)!"/></root></mxGraphModel>'
+        data = compress_diagram(xml)
+        self.assertEqual(decompress_diagram(data), xml)
+        self.assertEqual(decompress_diagram(f'\n  {data}\n'), xml)
+
+        # base64(raw deflate(encodeURIComponent(xml))), как в draw.io
+        encoded = zlib.decompress(base64.b64decode(data), -zlib.MAX_WBITS).decode('ascii')
+        self.assertTrue(encoded.startswith('%3CmxGraphModel%3E%3Croot%3E'))
+        self.assertIn('%D0%97%D0%B0%D0%BA%D0%B0%D0%B7%D1%8B%20%26amp%3B', encoded)
+        self.assertIn("(v2)!", encoded)
+
+
+class MultiPageExportTests(TestCase):
+    """Многостраничный экспорт со страницей содержания"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=3)
+        cls.https = DdLinkProtocol.objects.create(name='HTTPS')
+
+    def setUp(self):
+        caches['export'].clear()
+
+    def export(self, **kwargs):
+        return DrawioExporter(use_layout_cache=False).export_pages_to_drawio(**kwargs)
+
+    def page_objects(self, diagram):
+        return list(diagram.iter('object'))
+
+    def test_page_per_root_group_with_table_of_contents(self):
+        diagrams = ET.fromstring(self.export()).findall('diagram')
+
+        self.assertEqual([diagram.get('name') for diagram in diagrams],
+                         ['Содержание'] + [root.name for root in self.roots])
+        toc_links = [element.get('link') for element in self.page_objects(diagrams[0]) if element.get('link')]
+        self.assertEqual(toc_links, [f'data:page/id,{diagram.get("id")}' for diagram in diagrams[1:]])
+
+        for root, diagram in zip(self.roots, diagrams[1:]):
+            group_ids = DdGroup.objects.descendants([root.id], include_self=True).values('pk')
+            expected = (
+                DdGroup.objects.filter(pk__in=group_ids).count()
+                + DdComponent.objects.filter(group__in=group_ids).count()
+            )
+            self.assertEqual(len(self.page_objects(diagram)), expected)
+
+    def test_groups_above_page_depth_keep_only_own_components(self):
+        diagrams = ET.fromstring(self.export(root_group_id=self.roots[0].id, page_depth=1)).findall('diagram')
+        children = list(DdGroup.objects.filter(parent=self.roots[0]).order_by('id'))
+
+        self.assertEqual(
+            [diagram.get('name') for diagram in diagrams[1:]],
+            [self.roots[0].name] + [f'{self.roots[0].name} / {child.name}' for child in children],
+        )
+        root_page = [element.get('c4Name') for element in self.page_objects(diagrams[1])]
+        self.assertEqual(
+            root_page,
+            [self.roots[0].name] + list(DdComponent.objects.filter(group=self.roots[0]).order_by('id').values_list('name', flat=True)),
+        )
+
+    def test_links_are_kept_only_inside_page(self):
+        child = DdGroup.objects.filter(parent=self.roots[0]).order_by('id').first()
+        DdLink.objects.create(group_from=self.roots[0], group_to=child, protocol=self.https)
+        DdLink.objects.create(group_from=child, group_to=self.roots[1], protocol=self.https)
+
+        diagrams = ET.fromstring(self.export()).findall('diagram')
+        edges = [
+            [element for element in self.page_objects(diagram) if element.get('c4Type') == 'Relationship']
+            for diagram in diagrams[1:]
+        ]
+        self.assertEqual([len(page_edges) for page_edges in edges], [1, 0])
+
+        cells = {element.get('id'): element.get('c4Name') for element in self.page_objects(diagrams[1])}
+        edge = edges[0][0].find('mxCell')
+        self.assertEqual((cells[edge.get('source')], cells[edge.get('target')]), (self.roots[0].name, child.name))
+
+    def test_stream_and_compressed_pages(self):
+        exporter = DrawioExporter(use_layout_cache=False)
+        chunks = list(exporter.stream_pages_to_drawio(page_depth=1, chunk_size=1024))
+        self.assertGreater(len(chunks), 1)
+        document = ''.join(chunks)
+        self.assertEqual(document, self.export(page_depth=1))
+
+        compressed = DrawioExporter(use_layout_cache=False, compressed=True).export_pages_to_drawio(page_depth=1)
+        for diagram, expected in zip(ET.fromstring(compressed), ET.fromstring(document)):
+            self.assertEqual(diagram.attrib, expected.attrib)
+            self.assertEqual(
+                decompress_diagram(diagram.text),
+                ET.tostring(expected.find('mxGraphModel'), encoding='unicode'),
+            )
+
+    def test_pages_endpoint(self):
+        client = TestClient(router)
+        response = client.post('/export/all', json={'pages': True, 'page_depth': 1})
+        self.assertEqual(response.content.decode('utf-8'), self.export(page_depth=1))
+
+        response = client.post('/export/all', json={'pages': True, 'page_depth': -1})
+        self.assertIn('error', response.json())
+
+
+class CollapsedExportTests(TestCase):
+    """Экспорт с ограничением глубины и сверткой поддеревьев в сводку"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=4)
+
+    def export(self, **kwargs):
+        root_group_id = kwargs.pop('root_group_id', None)
+        return DrawioExporter(use_layout_cache=False, **kwargs).export_dd_groups_to_drawio(root_group_id)
+
+    def objects(self, xml):
+        return {element.get('c4Name'): element for element in ET.fromstring(xml).iter('object')}
+
+    def expected_summary(self, group):
+        descendants = DdGroup.objects.descendants(group)
+        subtree = DdGroup.objects.descendants(group, include_self=True)
+        instances = sum(1 if value is None else value for value in descendants.values_list('instances', flat=True))
+        return (
+            f'групп: {descendants.count()}, '
+            f'компонентов: {DdComponent.objects.filter(group__in=subtree).count()}, '
+            f'экземпляров: {instances}'
+        )
+
+    def test_groups_below_max_depth_are_summarized(self):
+        objects = self.objects(self.export(max_depth=1))
+        children = DdGroup.objects.filter(parent__in=self.roots)
+
+        expected_names = {group.name for group in self.roots} | {group.name for group in children}
+        expected_names |= set(DdComponent.objects.filter(group__in=self.roots).values_list('name', flat=True))
+        self.assertEqual(set(objects), expected_names)
+
+        collapsed_style = DrawioPalette.get_style('dd_group_collapsed').style
+        for child in children:
+            cell = objects[child.name]
+            self.assertEqual(cell.find('mxCell').get('style'), collapsed_style)
+            self.assertIn(self.expected_summary(child), cell.get('c4Specifications'))
+        for root in self.roots:
+            self.assertEqual(objects[root.name].find('mxCell').get('style'), DrawioPalette.get_style('dd_group').style)
+
+    def test_query_count_does_not_depend_on_leaves(self):
+        DrawioExporter(use_layout_cache=False).component_styles
+        with self.assertNumQueries(6):
+            self.export(max_depth=1)
+
+        deepest = DdGroup.objects.descendants(self.roots).order_by('-id').first()
+        leaf_type = ComponentType.objects.get(name='Application')
+        for i in range(20):
+            leaf = DdGroup.objects.create(parent=deepest, name=f'leaf-{i}', type=deepest.type)
+            DdComponent.objects.create(group=leaf, name=f'leaf-component-{i}', type=leaf_type)
+
+        with self.assertNumQueries(6):
+            xml = self.export(max_depth=1)
+        self.assertNotIn('leaf-', xml)
+
+    def test_collapse_threshold(self):
+        self.assertEqual(self.export(collapse_threshold=10 ** 6), self.export())
+
+        root = self.roots[0]
+        objects = self.objects(self.export(root_group_id=root.id, collapse_threshold=0))
+        expected_names = {root.name} | set(DdGroup.objects.filter(parent=root).values_list('name', flat=True))
+        expected_names |= set(DdComponent.objects.filter(group=root).values_list('name', flat=True))
+        self.assertEqual(set(objects), expected_names)
+
+        # Сворачиваются только поддеревья больше порога
+        small = DdGroup.objects.create(parent=root, name='small', type=root.type)
+        DdGroup.objects.create(parent=small, name='small-child', type=root.type)
+        objects = self.objects(self.export(root_group_id=root.id, collapse_threshold=1))
+        self.assertIn('small-child', objects)
+        self.assertNotIn('Свернуто', objects['small'].get('c4Specifications'))
+        for child in DdGroup.objects.filter(parent=root).exclude(pk=small.pk):
+            self.assertIn(self.expected_summary(child), objects[child.name].get('c4Specifications'))
+
+    def test_level_walk_matches_recursive_cte(self):
+        nested = [self.roots[0].id, DdGroup.objects.filter(parent=self.roots[0]).order_by('id').first().id]
+        for nodes, max_depth, summary_depth in ((None, 2, None), (None, 2, 2), (None, None, None), (nested, 1, None)):
+            with self.subTest(nodes=nodes, max_depth=max_depth, summary_depth=summary_depth):
+                rows = DdGroup.objects.subtree_levels(nodes, max_depth, DdComponent, 'instances', summary_depth)
+                with mock.patch.object(HierarchyQuerySet, '_supports_recursive_cte', return_value=False):
+                    by_levels = DdGroup.objects.subtree_levels(nodes, max_depth, DdComponent, 'instances', summary_depth)
+                self.assertEqual(by_levels, rows)
+
+        root, *_ = [row for row in rows if row[0] == self.roots[0].id]
+        self.assertEqual(root[3:5], (
+            DdGroup.objects.descendants(self.roots[0]).count(),
+            DdComponent.objects.filter(group__in=DdGroup.objects.descendants(self.roots[0], include_self=True)).count(),
+        ))
+
+    def test_rollup_uses_constant_number_of_queries(self):
+        with self.assertNumQueries(1):
+            DdGroup.objects.subtree_levels(None, None, DdComponent, 'instances')
+
+    def test_rollup_reports_cycle_and_depth_limit(self):
+        group = DdGroup.objects.filter(parent=self.roots[0]).order_by('id').first()
+        child = DdGroup.objects.filter(parent=group).order_by('id').first()
+        DdGroup.objects.filter(id=group.id).update(parent=child)
+        for recursive in (True, False):
+            with self.subTest(recursive=recursive), \
+                    mock.patch.object(HierarchyQuerySet, '_supports_recursive_cte', return_value=recursive):
+                with self.assertRaises(HierarchyCycleError) as context:
+                    DdGroup.objects.subtree_levels([group.id], None, DdComponent)
+                self.assertEqual(sorted(context.exception.group_ids), sorted([group.id, child.id]))
+
+        with mock.patch('architecture.managers.MAX_TREE_DEPTH', 2), self.assertRaises(ValueError):
+            DdGroup.objects.subtree_levels([self.roots[1].id], None, DdComponent)
+
+    def test_export_endpoint_options(self):
+        client = TestClient(router)
+        response = client.post('/export/all', json={'max_depth': -1})
+        self.assertIn('error', response.json())
+
+        response = client.post('/export/all', json={'max_depth': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(self.objects(response.content)), {root.name for root in self.roots})
+
+
+class CellIdTests(TestCase):
+    """Постоянные ID ячеек и кэш фрагментов XML"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=3)
+        DdLink.objects.create(group_from=cls.roots[0], group_to=cls.roots[1],
+                              protocol=DdLinkProtocol.objects.create(name='HTTPS'))
+
+    def setUp(self):
+        caches['fragments'].clear()
+
+    def export(self, **kwargs):
+        exporter = DrawioExporter(use_layout_cache=False, **kwargs)
+        return exporter.export_dd_groups_to_drawio(), exporter
+
+    def test_ids_derive_from_primary_keys(self):
+        xml, _ = self.export(use_fragment_cache=False)
+        objects = list(ET.fromstring(xml).iter('object'))
+
+        group_cells = {element.get('id') for element in objects if element.get('c4Instances') is not None}
+        component_cells = {element.get('id') for element in objects if element.get('c4Technology')
+                           and element.get('c4Type') != 'Relationship'}
+        self.assertEqual(group_cells, {f'ddg-{pk}' for pk in DdGroup.objects.values_list('pk', flat=True)})
+        self.assertEqual(component_cells, {f'ddc-{pk}' for pk in DdComponent.objects.values_list('pk', flat=True)})
+
+        link = DdLink.objects.get()
+        edge = next(element for element in objects if element.get('c4Type') == 'Relationship')
+        self.assertEqual(edge.get('id'), f'ddl-{link.pk}')
+        self.assertEqual(
+            (edge.find('mxCell').get('source'), edge.find('mxCell').get('target')),
+            (f'ddg-{self.roots[0].pk}', f'ddg-{self.roots[1].pk}'),
+        )
+        for root in self.roots:
+            self.assertEqual(next(element for element in objects if element.get('id') == f'ddg-{root.pk}')
+                             .find('mxCell').get('parent'), '1')
+
+        self.assertEqual(self.export(use_fragment_cache=False)[0], xml)
+
+    @override_settings(EXPORT_FRAGMENT_CACHE_MIN_CELLS=2, EXPORT_FRAGMENT_CACHE_MAX_CELLS=10)
+    def test_fragment_cache_reserializes_only_changed_subtrees(self):
+        expected, _ = self.export(use_fragment_cache=False)
+        xml, exporter = self.export(use_fragment_cache=True)
+        self.assertEqual(xml, expected)
+        self.assertEqual(exporter.fragment_stats['reused'], 0)
+
+        xml, exporter = self.export(use_fragment_cache=True)
+        self.assertEqual(xml, expected)
+        self.assertGreater(exporter.fragment_stats['reused'], 0)
+
+        component = DdComponent.objects.filter(group__parent=self.roots[0]).order_by('id').first()
+        component.name = 'renamed'
+        component.save()
+
+        expected, _ = self.export(use_fragment_cache=False)
+        xml, exporter = self.export(use_fragment_cache=True)
+        self.assertEqual(xml, expected)
+        self.assertIn('c4Name="renamed"', xml)
+        self.assertGreater(exporter.fragment_stats['reused'], 0)
+        self.assertLessEqual(exporter.fragment_stats['serialized'], 30)
+
+    @override_settings(EXPORT_FRAGMENT_CACHE_MIN_CELLS=2, EXPORT_FRAGMENT_CACHE_MAX_CELLS=10)
+    def test_fragments_are_kept_per_serializer(self):
+        self.assertIsNone(DrawioExporter().fragment_cache)
+
+        self.export(use_fragment_cache=True, serializer='elementtree')
+        xml, exporter = self.export(use_fragment_cache=True, serializer='template')
+        self.assertEqual(exporter.fragment_stats['reused'], 0)
+        self.assertEqual(xml, self.export(use_fragment_cache=False, serializer='template')[0])
+
+        _, exporter = self.export(use_fragment_cache=True, serializer='elementtree')
+        self.assertGreater(exporter.fragment_stats['reused'], 0)
+
+
+class C2ExportTests(TestCase):
+    """Экспорт диаграммы контейнеров C2"""
+
+    @classmethod
+    def setUpTestData(cls):
+        system = C2GroupType.objects.create(name='System')
+        service = ComponentType.objects.create(name='Application')
+        database = ComponentType.objects.create(name='Database')
+        cls.root = C2Group.objects.create(name='Shop', type=system)
+        cls.child = C2Group.objects.create(name='Orders', type=system, parent=cls.root)
+        cls.other = C2Group.objects.create(name='Partners', type=system)
+
+        cls.api = C2Component.objects.create(name='API', type=service, group=cls.root, technology='Python')
+        cls.db = C2Component.objects.create(name='Orders DB', type=database, group=cls.child)
+        cls.partner = C2Component.objects.create(name='Bank', type=service, group=cls.other, is_external=True)
+
+        link = C2Link.objects.create(component_from=cls.api, component_to=cls.db, name='Orders',
+                                     technology='SQL', format='rows')
+        read = OperationType.objects.create(name='read')
+        write = OperationType.objects.create(name='write')
+        order = InfoObject.objects.create(name='Order')
+        C2LinksInfoObjects.objects.create(c2_link=link, infoobject=order, operation_type=write)
+        C2LinksInfoObjects.objects.create(c2_link=link, infoobject=order, operation_type=read)
+        C2Link.objects.create(component_from=cls.api, component_to=cls.partner, technology='HTTPS')
+
+    def objects(self, xml):
+        return list(ET.fromstring(xml).iter('object'))
+
+    def test_collapsed_group_summary(self):
+        xml = C2DrawioExporter(max_depth=1).export_element_to_drawio(self.root.id, 'c2group')
+        objects = {element.get('c4Name'): element for element in self.objects(xml)}
+
+        self.assertEqual(set(objects), {'Shop', 'Orders', 'API'})
+        self.assertEqual(objects['Orders'].get('c4Specifications'), 'System\nСвернуто - групп: 0, компонентов: 1')
+        self.assertEqual(objects['Orders'].find('mxCell').get('style'),
+                         DrawioPalette.get_style('c2_group_collapsed').style)
+
+    def test_group_export_connects_components(self):
+        get_component_style_resolver()
+        # Версия стилей компонентов, группы и компоненты, связи, информационные объекты
+        with self.assertNumQueries(5):
+            xml = C2DrawioExporter().export_element_to_drawio(self.root.id, 'c2group')
+        objects = self.objects(xml)
+
+        self.assertEqual([element.get('c4Name') for element in objects[:4]], ['Shop', 'Orders', 'Orders DB', 'API'])
+        self.assertEqual(objects[0].get('c4Specifications'), 'System')
+        self.assertIn('strokeColor=#666666', objects[0].find('mxCell').get('style'))
+
+        edges = [element for element in objects if element.get('c4Type') == 'Relationship']
+        self.assertEqual([edge.get('c4Technology') for edge in edges], ['Orders [SQL, rows]: Order (read), Order (write)'])
+        cells = {element.get('id'): element.get('c4Name') for element in objects}
+        edge = edges[0].find('mxCell')
+        self.assertEqual((cells[edge.get('source')], cells[edge.get('target')]), ('API', 'Orders DB'))
+
+    def test_multiple_export_with_external_component(self):
+        xml = C2DrawioExporter().export_multiple_elements_to_drawio([
+            {'id': self.root.id, 'type': 'c2group'},
+            {'id': self.partner.id, 'type': 'c2component'},
+            {'id': self.db.id, 'type': 'c2component'},
+        ])
+        objects = self.objects(xml)
+        names = [element.get('c4Name') for element in objects if element.get('c4Type') != 'Relationship']
+
+        # Компонент выбранной группы не повторяется, связь с внешним компонентом сохраняется
+        self.assertEqual(names, ['Shop', 'Orders', 'Orders DB', 'API', 'Bank'])
+        self.assertEqual(len(objects) - len(names), 2)
+        self.assertIn('fillColor=#8C8496', objects[4].find('mxCell').get('style'))
+
+    def test_export_endpoint(self):
+        client = TestClient(router)
+        response = client.post('/export', json={'element_id': self.db.id, 'element_type': 'c2component'})
+        self.assertEqual(
+            response.content.decode('utf-8'),
+            C2DrawioExporter().export_element_to_drawio(self.child.id, 'c2group'),
+        )
+
+        self.assertEqual(client.post('/export', json={'element_id': 0, 'element_type': 'c2group'}).status_code, 404)
+        response = client.post('/export/multiple', json={'elements': [
+            {'id': self.root.id, 'type': 'c2group'}, {'id': self.root.id, 'type': 'ddgroup'},
+        ]})
+        self.assertIn('error', response.json())
+
+    def test_link_label(self):
+        link = C2DrawioExporter().tree_class.load().load_links()[1]
+        self.assertEqual(get_c2_link_label(link), '[HTTPS]')
+        self.assertEqual(get_c2_link_label(link._replace(technology='', info_objects=[('Order', 'read')])),
+                         'Order (read)')
+
+
+class ConditionalRequestTests(TestCase):
+    """ETag и Last-Modified списков и документов экспорта"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=2)
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['export'].clear()
+        self.client = TestClient(router)
+
+    def test_list_not_modified_until_table_changes(self):
+        response = self.client.get('/dd-groups')
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+        # Только версии таблиц
+        with self.assertNumQueries(1):
+            response = self.client.get('/dd-groups', headers={'IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Last-Modified отдается, когда секунда последнего изменения прошла
+        CacheVersion.objects.update(modified=F('modified') - 2)
+        last_modified = self.client.get('/dd-groups', headers={'IF_NONE_MATCH': etag})['Last-Modified']
+        response = self.client.get('/dd-groups', headers={'IF_MODIFIED_SINCE': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+        # Связи не входят в список групп, тип группы - входит
+        with self.captureOnCommitCallbacks(execute=True):
+            DdLink.objects.create(group_from=self.roots[0], group_to=self.roots[1],
+                                  protocol=DdLinkProtocol.objects.create(name='HTTPS'))
+        self.assertEqual(self.client.get('/dd-groups', headers={'IF_NONE_MATCH': etag}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            group_type = self.roots[0].type
+            group_type.name = 'Kubernetes'
+            group_type.save()
+        response = self.client.get('/dd-groups', headers={'IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['type_name'], 'Kubernetes')
+
+    def test_write_in_the_same_second_is_not_hidden_by_last_modified(self):
+        key = TABLE_VERSION_KEY.format(DdGroup._meta.db_table)
+        get_table_versions([DdGroup._meta.db_table, DdGroupType._meta.db_table])
+        CacheVersion.objects.update(modified=1000.2)
+
+        # Секунда изменения еще идет: Last-Modified не отдается и не проверяется
+        with mock.patch('architecture.conditional.time.time', return_value=1000.5):
+            response = self.client.get('/dd-groups', headers={'IF_MODIFIED_SINCE': http_date(1000)})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response.headers)
+
+        with mock.patch('architecture.conditional.time.time', return_value=1001.5):
+            last_modified = self.client.get('/dd-groups')['Last-Modified']
+            self.assertEqual(last_modified, http_date(1001))
+            response = self.client.get('/dd-groups', headers={'IF_MODIFIED_SINCE': last_modified})
+            self.assertEqual(response.status_code, 304)
+
+        # Запись в ту же секунду, в которую был отдан ответ
+        CacheVersion.objects.filter(key=key).update(value=F('value') + 1, modified=1001.7)
+        with mock.patch('architecture.conditional.time.time', return_value=1002.5):
+            response = self.client.get('/dd-groups', headers={'IF_MODIFIED_SINCE': last_modified})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Last-Modified'], http_date(1002))
+
+    def test_export_not_modified_without_rendering(self):
+        response = self.client.post('/export/all', json={})
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        # Только версия модели
+        with self.assertNumQueries(1):
+            response = self.client.post('/export/all', json={}, headers={'IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, 304)
+
+        gzipped = self.client.post('/export', json={'element_id': self.roots[0].id, 'element_type': 'ddgroup'},
+                                   headers={'ACCEPT_ENCODING': 'gzip'})
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertTrue(gzipped['ETag'].endswith('-gzip"'))
+        response = self.client.post('/export', json={'element_id': self.roots[0].id, 'element_type': 'ddgroup'},
+                                    headers={'IF_NONE_MATCH': gzipped['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DdGroup.objects.create(name='new-root', type=self.roots[0].type)
+        response = self.client.post('/export/all', json={}, headers={'IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_versions_are_shared_between_processes(self):
+        group_etag = self.client.get('/dd-groups')['ETag']
+        export_etag = self.client.post('/export/all', json={})['ETag']
+
+        # Другой процесс изменил данные: его кэши недоступны, общая только база данных
+        with self.captureOnCommitCallbacks(execute=True):
+            DdGroup.objects.bulk_create([DdGroup(name='other-process', type=self.roots[0].type)])
+            bump_table_version(DdGroup._meta.db_table)
+            bump_model_version()
+        caches['default'].clear()
+
+        self.assertEqual(self.client.get('/dd-groups', headers={'IF_NONE_MATCH': group_etag}).status_code, 200)
+        response = self.client.post('/export/all', json={}, headers={'IF_NONE_MATCH': export_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('other-process', response.content.decode())
+
+    def test_version_is_bumped_after_commit(self):
+        etag = self.client.get('/dd-groups')['ETag']
+        with self.captureOnCommitCallbacks() as callbacks:
+            DdGroup.objects.create(name='uncommitted', type=self.roots[0].type)
+            # До фиксации транзакции версия прежняя
+            self.assertEqual(self.client.get('/dd-groups', headers={'IF_NONE_MATCH': etag}).status_code, 304)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get('/dd-groups', headers={'IF_NONE_MATCH': etag}).status_code, 200)
+
+
+class KeysetPaginationTests(TestCase):
+    """Keyset-пагинация списков API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=2)
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = TestClient(router)
+
+    def test_pages_follow_primary_key(self):
+        expected = self.client.get('/dd-components').json()
+        self.assertIsInstance(expected, list)
+
+        items, after, pages = [], None, 0
+        while True:
+            url = '/dd-components?limit=4' + (f'&after={after}' if after is not None else '')
+            # Версия таблицы и одна выборка limit + 1 строк без COUNT(*) на любой странице
+            with self.assertNumQueries(2):
+                page = self.client.get(url).json()
+            items.extend(page['items'])
+            pages += 1
+            after = page['next']
+            if after is None:
+                break
+            self.assertEqual(after, page['items'][-1]['id'])
+        self.assertEqual(items, sorted(expected, key=lambda item: item['id']))
+        self.assertEqual(pages, -(-len(expected) // 4))
+
+    @override_settings(API_PAGE_MAX_LIMIT=2)
+    def test_limit_validation_and_etag(self):
+        self.assertEqual(self.client.get('/dd-groups?limit=0').status_code, 422)
+        first = self.client.get('/dd-groups?limit=100')
+        self.assertEqual(len(first.json()['items']), 2)
+        second = self.client.get(f"/dd-groups?limit=100&after={first.json()['next']}")
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(self.client.get('/dd-groups?limit=100', headers={'IF_NONE_MATCH': first['ETag']})
+                         .status_code, 304)
+
+
+class ListFilterTests(TestCase):
+    """Фильтры списков API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=2)
+        cls.link = DdLink.objects.create(group_from=cls.roots[0], group_to=cls.roots[1],
+                                         protocol=DdLinkProtocol.objects.create(name='HTTPS'))
+        other = DdLink.objects.create(group_from=cls.roots[1], group_to=cls.roots[0], protocol=cls.link.protocol)
+        for port in (80, 443):
+            DdLinkPort.objects.create(dd_link=cls.link, port=port)
+        DdLinkPort.objects.create(dd_link=other, port=8080)
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = TestClient(router)
+
+    def ids(self, url):
+        return [item['id'] for item in self.client.get(url).json()]
+
+    def test_filters_match_querysets(self):
+        root = self.roots[0]
+        component_type = ComponentType.objects.get(name='Database')
+        DdComponent.objects.filter(group=root, type=component_type).update(is_external=True)
+
+        self.assertEqual(
+            sorted(self.ids(f'/dd-groups?parent_id={root.id}')),
+            sorted(DdGroup.objects.filter(parent=root).values_list('id', flat=True)),
+        )
+        self.assertEqual(
+            sorted(self.ids(f'/dd-components?group_id={root.id}&is_external=false')),
+            sorted(DdComponent.objects.filter(group=root, is_external=False).values_list('id', flat=True)),
+        )
+        self.assertEqual(
+            sorted(self.ids(f'/dd-components?type_id={component_type.id}&is_external=true')),
+            sorted(DdComponent.objects.filter(group=root, type=component_type).values_list('id', flat=True)),
+        )
+        self.assertEqual(sorted(self.ids(f'/dd-link-ports?dd_link_id={self.link.id}')),
+                         sorted(self.link.ports.values_list('id', flat=True)))
+        self.assertEqual(self.ids(f'/dd-links?group_to_id={self.roots[1].id}'), [self.link.id])
+
+    def test_filter_with_pagination(self):
+        group_id = DdGroup.objects.filter(parent=self.roots[0]).order_by('id').first().id
+        page = self.client.get(f'/dd-components?group_id={group_id}&limit=1').json()
+        items = page['items']
+        while page['next'] is not None:
+            page = self.client.get(f"/dd-components?group_id={group_id}&limit=1&after={page['next']}").json()
+            items.extend(page['items'])
+        self.assertEqual([item['id'] for item in items],
+                         list(DdComponent.objects.filter(group_id=group_id).order_by('id').values_list('id', flat=True)))
+
+
+class BulkEndpointTests(TestCase):
+    """Пакетное создание, изменение и удаление объектов DD"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=2)
+        cls.component_type = ComponentType.objects.get(name='Application')
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = TestClient(router)
+
+    def test_create_returns_ids_in_input_order(self):
+        payload = [
+            {'name': f'bulk-{i}', 'type_id': self.component_type.id, 'group_id': self.roots[i % 2].id}
+            for i in range(25)
+        ]
+        version = get_model_version()
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/dd-components/bulk', json=payload)
+        self.assertEqual(response.status_code, 200)
+
+        # Ссылки проверяются одним запросом на таблицу: типы компонентов и группы
+        # (кэш layout выключен - предки групп не читаются)
+        selects = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT') and CacheVersion._meta.db_table not in query['sql']
+        ]
+        self.assertEqual(len(selects), 2)
+        ids = response.json()['ids']
+        self.assertEqual(
+            [DdComponent.objects.in_bulk(ids)[pk].name for pk in ids],
+            [item['name'] for item in payload],
+        )
+        self.assertNotEqual(get_model_version(), version)
+        self.assertEqual(len(self.client.get(f'/dd-components?group_id={self.roots[1].id}').json()),
+                         DdComponent.objects.filter(group=self.roots[1]).count())
+
+    def test_invalid_items_reported_and_nothing_written(self):
+        count = DdGroup.objects.count()
+        response = self.client.post('/dd-groups/bulk', json=[
+            {'name': 'ok', 'type_id': self.roots[0].type_id},
+            {'name': 'orphan', 'type_id': self.roots[0].type_id, 'parent_id': 0},
+            {'name': '', 'type_id': 0},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = [(error['index'], error['field']) for error in response.json()['errors']]
+        self.assertEqual(sorted(errors), [(1, 'parent_id'), (2, 'name'), (2, 'type_id')])
+        self.assertEqual(DdGroup.objects.count(), count)
+
+    def test_update_and_delete(self):
+        child = DdGroup.objects.filter(parent=self.roots[0]).order_by('id').first()
+        link = DdLink.objects.create(group_from=self.roots[0], group_to=child,
+                                     protocol=DdLinkProtocol.objects.create(name='HTTPS'))
+
+        response = self.client.put('/dd-groups/bulk', json=[
+            {'id': child.id, 'parent_id': self.roots[1].id},
+            {'id': self.roots[0].id, 'name': 'renamed'},
+        ])
+        self.assertEqual(response.json()['ids'], [child.id, self.roots[0].id])
+        child.refresh_from_db()
+        self.assertEqual((child.parent_id, child.name), (self.roots[1].id, 'group-2-0'))
+        self.assertEqual(DdGroup.objects.get(id=self.roots[0].id).name, 'renamed')
+
+        response = self.client.put('/dd-groups/bulk', json=[{'id': child.id, 'parent_id': child.id}])
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/dd-links/bulk/delete', json={'ids': [link.id, 0]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['index'], 1)
+        self.assertTrue(DdLink.objects.filter(id=link.id).exists())
+
+        response = self.client.post('/dd-links/bulk/delete', json={'ids': [link.id]})
+        self.assertEqual(response.json()['ids'], [link.id])
+        self.assertFalse(DdLink.objects.exists())
+
+    def test_update_rejects_parent_cycles(self):
+        first, second = DdGroup.objects.filter(parent=self.roots[0]).order_by('id')[:2]
+
+        # Цикл внутри пакета: каждая группа по отдельности переносится корректно
+        response = self.client.put('/dd-groups/bulk', json=[
+            {'id': first.id, 'parent_id': second.id},
+            {'id': second.id, 'parent_id': first.id},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = [(error['index'], error['field']) for error in response.json()['errors']]
+        self.assertEqual(errors, [(0, 'parent_id'), (1, 'parent_id')])
+
+        # Перенос под собственного потомка
+        response = self.client.put('/dd-groups/bulk', json=[{'id': self.roots[0].id, 'parent_id': first.id}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['field'], 'parent_id')
+        self.assertEqual(DdGroup.objects.filter(id__in=[first.id, second.id], parent=self.roots[0]).count(), 2)
+
+        # Потомок переносится из-под группы в том же пакете - цикла нет
+        response = self.client.put('/dd-groups/bulk', json=[
+            {'id': self.roots[0].id, 'parent_id': first.id},
+            {'id': first.id, 'parent_id': self.roots[1].id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DdGroup.objects.get(id=self.roots[0].id).parent_id, first.id)
+
+    def test_delete_query_count_does_not_depend_on_batch_size(self):
+        protocol = DdLinkProtocol.objects.create(name='HTTPS')
+        children = list(DdGroup.objects.filter(parent__in=self.roots).order_by('id'))
+        for child in children:
+            DdLink.objects.create(group_from=child.parent, group_to=child, protocol=protocol)
+
+        # Первое удаление создает строки версий таблиц - оно не измеряется
+        for child in children[:2]:
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/dd-groups/bulk/delete', json={'ids': [child.id]})
+            self.assertEqual(response.json()['ids'], [child.id])
+
+        # Группы, их компоненты и связи удаляются тем же числом запросов
+        ids = [child.id for child in children[2:]]
+        with self.assertNumQueries(len(queries)), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/dd-groups/bulk/delete', json={'ids': ids})
+        self.assertEqual(response.json()['ids'], ids)
+        self.assertFalse(DdGroup.objects.filter(parent__in=self.roots).exists())
+        self.assertFalse(DdComponent.objects.exclude(group__in=self.roots).exists())
+        self.assertFalse(DdLink.objects.exists())
+
+
+class StreamingExportTests(TestCase):
+    """Потоковый экспорт совпадает с документом, собранным целиком"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=3)
+
+    def setUp(self):
+        caches['export'].clear()
+        self.client = TestClient(router)
+
+    def test_streamed_body_matches_document(self):
+        for compressed in (False, True):
+            for root_group_id in (None, self.roots[1].id):
+                with self.subTest(compressed=compressed, root_group_id=root_group_id):
+                    expected = DrawioExporter(compressed=compressed).export_dd_groups_to_drawio(root_group_id)
+                    payload = {'compressed': compressed, 'root_group_id': root_group_id}
+
+                    response = self.client.post('/export/all', json=payload)
+                    self.assertTrue(response.streaming)
+                    self.assertEqual(response['X-Export-Cache'], 'MISS')
+                    self.assertEqual(response.content, expected.encode('utf-8'))
+
+                    # Документ, закэшированный по ходу потока, совпадает побайтно
+                    response = self.client.post('/export/all', json=payload)
+                    self.assertEqual(response['X-Export-Cache'], 'HIT')
+                    self.assertEqual(response.content, expected.encode('utf-8'))
+
+    def test_layout_error_is_reported_before_streaming(self):
+        with mock.patch.object(DrawioExporter, '_iter_root_layouts', side_effect=RuntimeError('layout')):
+            response = self.client.post('/export/all', json={})
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.json(), {'error': 'Ошибка при экспорте: layout'})
+
+    def test_failed_or_closed_stream_is_not_cached(self):
+        def failing():
+            yield 'x' * 10
+            raise RuntimeError('layout')
+
+        chunks = export_cache.cache_stream('all', {'failed': True}, failing())
+        self.assertEqual(next(chunks), 'x' * 10)
+        with self.assertRaises(RuntimeError):
+            next(chunks)
+        self.assertIsNone(export_cache.get('all', {'failed': True}))
+
+        # Клиент отключился после первой части
+        chunks = export_cache.cache_stream('all', {'closed': True}, iter(['a', 'b']))
+        next(chunks)
+        chunks.close()
+        self.assertIsNone(export_cache.get('all', {'closed': True}))
+
+    def test_empty_tree(self):
+        DdGroup.objects.all().delete()
+        expected = DrawioExporter().export_dd_groups_to_drawio()
+        self.assertEqual(''.join(DrawioExporter().stream_dd_groups_to_drawio(chunk_size=1)), expected)
+
+        response = self.client.post('/export/all', json={})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected.encode('utf-8'))
+        root = ET.fromstring(response.content).find('.//root')
+        self.assertEqual([cell.get('id') for cell in root], ['0', '1'])
+
+
+class MultipleExportTests(TestCase):
+    """Экспорт нескольких элементов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=3)
+
+    def setUp(self):
+        caches['export'].clear()
+        self.client = TestClient(router)
+
+    def export(self, elements):
+        return DrawioExporter(use_layout_cache=False).export_multiple_elements_to_drawio(elements)
+
+    def test_missing_elements_are_all_reported(self):
+        component = DdComponent.objects.order_by('id').first()
+        response = self.client.post('/export/multiple', json={'elements': [
+            {'id': self.roots[0].id, 'type': 'ddgroup'},
+            {'id': 0, 'type': 'ddgroup'},
+            {'id': component.id, 'type': 'ddcomponent'},
+            {'id': -1, 'type': 'ddcomponent'},
+        ]})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['missing'], [
+            {'id': 0, 'type': 'ddgroup'},
+            {'id': -1, 'type': 'ddcomponent'},
+        ])
+
+    def test_nested_and_repeated_elements_are_laid_out_once(self):
+        child = DdGroup.objects.filter(parent=self.roots[0]).order_by('id').first()
+        grandchild = DdGroup.objects.filter(parent=child).order_by('id').first()
+        component = DdComponent.objects.filter(group=grandchild).first()
+        outside = DdComponent.objects.filter(group=self.roots[1]).first()
+
+        expected = self.export([
+            {'id': self.roots[0].id, 'type': 'ddgroup'},
+            {'id': outside.id, 'type': 'ddcomponent'},
+        ])
+        xml = self.export([
+            {'id': grandchild.id, 'type': 'ddgroup'},
+            {'id': self.roots[0].id, 'type': 'ddgroup'},
+            {'id': component.id, 'type': 'ddcomponent'},
+            {'id': child.id, 'type': 'ddgroup'},
+            {'id': outside.id, 'type': 'ddcomponent'},
+            {'id': self.roots[0].id, 'type': 'ddgroup'},
+        ])
+
+        self.assertEqual(xml, expected)
+
+    def test_elements_are_resolved_in_constant_number_of_queries(self):
+        groups = list(DdGroup.objects.order_by('id'))
+        components = list(DdComponent.objects.order_by('id'))
+
+        def elements(count):
+            return [{'id': group.id, 'type': 'ddgroup'} for group in groups[-count:]] + [
+                {'id': component.id, 'type': 'ddcomponent'} for component in components[:count]
+            ]
+
+        # Версия стилей компонентов, группы, компоненты поддеревьев, выбранные компоненты, связи, порты
+        get_component_style_resolver()
+        with self.assertNumQueries(6):
+            self.export(elements(2))
+        with self.assertNumQueries(6):
+            self.export(elements(10))
+
+
+class ExportJobTests(TestCase):
+    """Асинхронные задания экспорта"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=2)
+
+    def setUp(self):
+        jobs_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(jobs_dir.cleanup)
+        settings_override = override_settings(EXPORT_JOBS_DIR=jobs_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = TestClient(router)
+
+    def submit(self, kind, params):
+        return self.client.post('/export/jobs', json={'kind': kind, 'params': params})
+
+    def test_job_result_matches_synchronous_export(self):
+        response = self.submit('all', {'root_group_id': self.roots[0].id})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['id']
+
+        self.assertEqual(self.client.get(f'/export/jobs/{job_id}/download').status_code, 409)
+
+        call_command('export_worker', processes=0, once=True, stdout=StringIO())
+
+        job = self.client.get(f'/export/jobs/{job_id}').json()
+        self.assertEqual(job['status'], ExportJob.STATUS_DONE)
+        self.assertEqual(job['progress'], 100)
+
+        download = self.client.get(f'/export/jobs/{job_id}/download')
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(
+            download.content.decode('utf-8'),
+            DrawioExporter().export_dd_groups_to_drawio(self.roots[0].id),
+        )
+
+    def test_duplicate_active_job_is_reused(self):
+        first = self.submit('all', {})
+        second = self.submit('all', {'root_group_id': None})
+
+        self.assertEqual(first.json()['id'], second.json()['id'])
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+    def test_invalid_params_are_rejected(self):
+        self.assertEqual(self.submit('unknown', {}).status_code, 400)
+        self.assertEqual(self.submit('element', {}).status_code, 400)
+        self.assertEqual(
+            self.submit('element', {'element_id': 1, 'element_type': 'c4group'}).status_code, 400
+        )
+        self.assertEqual(self.submit('multiple', {'elements': [
+            {'id': self.roots[0].id, 'type': 'ddgroup'}, {'id': 1, 'type': 'c2group'},
+        ]}).status_code, 400)
+
+    def test_failed_export_is_reported(self):
+        job_id = self.submit('element', {'element_id': 0, 'element_type': 'ddgroup'}).json()['id']
+
+        call_command('export_worker', processes=0, once=True, stdout=StringIO())
+
+        job = ExportJob.objects.get(id=job_id)
+        self.assertEqual(job.status, ExportJob.STATUS_FAILED)
+        self.assertIn('DoesNotExist', job.error)
+
+    def test_progress_follows_root_groups(self):
+        job_id = self.submit('all', {}).json()['id']
+        progress = []
+        set_progress = jobs._set_progress
+
+        def record(job, value):
+            progress.append(value)
+            set_progress(job, value)
+
+        with mock.patch.object(jobs, '_set_progress', side_effect=record):
+            call_command('export_worker', processes=0, once=True, stdout=StringIO())
+
+        # Две корневые группы: после каждой - половина диапазона 10-90
+        self.assertEqual(sorted(set(progress)), [10, 50, 90])
+        job = ExportJob.objects.get(id=job_id)
+        self.assertEqual((job.status, job.progress), (ExportJob.STATUS_DONE, 100))
+        self.assertIsNotNone(job.heartbeat_at)
+
+    def test_expired_lease_fails_job_and_allows_resubmit(self):
+        job_id = self.submit('all', {}).json()['id']
+        self.assertEqual(jobs.claim_next_job().id, job_id)
+        self.assertEqual(self.submit('all', {}).json()['id'], job_id)
+
+        # Воркер завершился аварийно и больше не обновляет heartbeat_at
+        ExportJob.objects.filter(id=job_id).update(heartbeat_at=timezone.now() - timedelta(seconds=301))
+        response = self.submit('all', {})
+        self.assertNotEqual(response.json()['id'], job_id)
+        job = ExportJob.objects.get(id=job_id)
+        self.assertEqual(job.status, ExportJob.STATUS_FAILED)
+        self.assertIn('Воркер', job.error)
+
+        with override_settings(EXPORT_JOB_LEASE_TIMEOUT=0):
+            running = jobs.claim_next_job()
+            ExportJob.objects.filter(id=running.id).update(heartbeat_at=timezone.now() - timedelta(seconds=1))
+            self.assertIsNone(jobs.claim_next_job())
+        self.assertEqual(ExportJob.objects.get(id=running.id).status, ExportJob.STATUS_FAILED)
+
+    @override_settings(EXPORT_JOB_RETENTION=3600)
+    def test_cleanup_removes_old_jobs_and_files(self):
+        for params in ({}, {'root_group_id': self.roots[0].id}):
+            self.submit('all', params)
+        call_command('export_worker', processes=0, once=True, stdout=StringIO())
+        old, recent = ExportJob.objects.order_by('id')
+        ExportJob.objects.filter(id=old.id).update(finished_at=timezone.now() - timedelta(hours=2))
+
+        self.assertEqual(jobs.cleanup_finished_jobs(), 1)
+        self.assertFalse(ExportJob.objects.filter(id=old.id).exists())
+        self.assertFalse(os.path.exists(old.result_path))
+        self.assertTrue(os.path.exists(recent.result_path))
+
+
+class DrawioImportTests(TestCase):
+    """Импорт документов drawio в группы и компоненты DD"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roots = build_dd_tree(depth=3)
+        cls.roots[0].specification = 'CPU: 4\nRAM: 8 GB'
+        cls.roots[0].save()
+        DdComponent.objects.filter(group=cls.roots[0]).update(technology='Python', description='API')
+
+    def setUp(self):
+        self.target = DdGroup.objects.create(name='import', type=DdGroupType.objects.get(name='Cluster'))
+
+    def snapshot(self, group):
+        """Поддерево группы без ID: поля групп и компонентов в порядке названий"""
+        components = sorted(
+            (component.name, component.type.name, component.technology, component.description)
+            for component in group.ddcomponent_set.select_related('type')
+        )
+        children = sorted((self.snapshot(child) for child in group.ddgroup_set.all()), key=repr)
+        return group.name, group.type.name, group.instances, group.specification, components, children
+
+    def count(self, group):
+        """Число групп и компонентов поддерева"""
+        counts = [1, group.ddcomponent_set.count()]
+        for child in group.ddgroup_set.all():
+            counts = [a + b for a, b in zip(counts, self.count(child))]
+        return tuple(counts)
+
+    def import_xml(self, xml, **kwargs):
+        return DrawioImporter(batch_size=3).import_file(BytesIO(xml.encode('utf-8')), **kwargs)
+
+    def test_round_trip_restores_subtree(self):
+        for compressed in (False, True):
+            with self.subTest(compressed=compressed):
+                target = DdGroup.objects.create(name='import', type=self.target.type)
+                xml = DrawioExporter(compressed=compressed, use_layout_cache=False).export_dd_groups_to_drawio(
+                    self.roots[0].id
+                )
+                result = self.import_xml(xml, root_group_id=target.id)
+
+                self.assertEqual((result.groups, result.components), self.count(self.roots[0]))
+                self.assertEqual((result.group_types, result.component_types, result.skipped_components), (0, 0, 0))
+                imported = target.ddgroup_set.get()
+                self.assertEqual(self.snapshot(imported), self.snapshot(self.roots[0]))
+
+    def test_container_cells_and_new_types(self):
+        xml = """<mxfile><diagram id="p" name="Page-1"><mxGraphModel><root>
+            <mxCell id="0"/><mxCell id="1" parent="0"/>
+            <object id="g" c4Name="Zone" c4Instances="n" c4Specifications="DMZ&#xa;Свернуто - 3 групп">
+                <mxCell vertex="1" parent="1"><mxGeometry as="geometry"/></mxCell></object>
+            <mxCell id="box" vertex="1" parent="g"><mxGeometry as="geometry"/></mxCell>
+            <object id="c" c4Name="Proxy" c4Type="Gateway" c4Technology="Technology" c4Description="Description">
+                <mxCell vertex="1" parent="box"><mxGeometry as="geometry"/></mxCell></object>
+            <object id="orphan" c4Name="Lost" c4Type="Gateway">
+                <mxCell vertex="1" parent="1"><mxGeometry as="geometry"/></mxCell></object>
+            <object id="e" c4Type="Relationship" c4Technology="HTTPS">
+                <mxCell edge="1" parent="1" source="c" target="g"/></object>
+        </root></mxGraphModel></diagram></mxfile>"""
+        version = get_model_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.import_xml(xml)
+
+        self.assertEqual(tuple(result), (1, 1, 1, 1, 1))
+        group = DdGroup.objects.get(name='Zone')
+        self.assertIsNone(group.parent_id)
+        self.assertEqual((group.type.name, group.instances, group.specification), ('DMZ', 0, ''))
+        component = group.ddcomponent_set.get()
+        self.assertEqual((component.name, component.type.name, component.technology, component.description),
+                         ('Proxy', 'Gateway', '', ''))
+        self.assertNotEqual(get_model_version(), version)
+
+    def test_invalid_cells_are_reported_before_writing(self):
+        xml = """<mxfile><diagram id="p" name="Page-1"><mxGraphModel><root>
+            <mxCell id="0"/><mxCell id="1" parent="0"/>
+            <object id="g" c4Name="Zone" c4Instances="1">
+                <mxCell vertex="1" parent="1"><mxGeometry as="geometry"/></mxCell></object>
+            <object id="long" c4Name="%s" c4Type="Gateway">
+                <mxCell vertex="1" parent="g"><mxGeometry as="geometry"/></mxCell></object>
+        </root></mxGraphModel></diagram></mxfile>""" % ('x' * 256)
+        groups = DdGroup.objects.count()
+        with self.assertRaisesMessage(DrawioImportError, 'страница 1, ячейка long, поле name'):
+            self.import_xml(xml)
+
+        response = TestClient(router).post('/import', FILES={'file': SimpleUploadedFile('model.drawio', xml.encode('utf-8'))})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ячейка long', response.json()['detail'])
+        self.assertEqual(DdGroup.objects.count(), groups)
+        self.assertFalse(ComponentType.objects.filter(name='Gateway').exists())
+
+    def test_invalid_document_and_missing_root(self):
+        with self.assertRaises(DrawioImportError):
+            self.import_xml('<mxfile><diagram>')
+        with self.assertRaises(DdGroup.DoesNotExist):
+            self.import_xml('<mxfile/>', root_group_id=0)
+
+    def test_command_and_endpoint(self):
+        xml = DrawioExporter(use_layout_cache=False).export_dd_groups_to_drawio(self.roots[1].id)
+        with tempfile.NamedTemporaryFile(suffix='.drawio') as f:
+            f.write(xml.encode('utf-8'))
+            f.flush()
+            out = StringIO()
+            call_command('import_drawio', f.name, root_group=self.target.id, stdout=out)
+        self.assertIn(f'Создано групп: {self.count(self.roots[1])[0]}', out.getvalue())
+        self.assertEqual(self.snapshot(self.target.ddgroup_set.get()), self.snapshot(self.roots[1]))
+
+        client = TestClient(router)
+        response = client.post('/import', FILES={'file': SimpleUploadedFile('model.drawio', xml.encode('utf-8'))})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['groups'], self.count(self.roots[1])[0])
+        self.assertEqual(DdGroup.objects.filter(name=self.roots[1].name, parent=None).count(), 2)
+
+        response = client.post('/import', FILES={'file': SimpleUploadedFile('model.drawio', b'<mxfile')})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportBenchmarkTests(TestCase):
+    """Генераторы синтетических деревьев и бенчмарк экспорта"""
+
+    def test_tree_shapes(self):
+        depths = {}
+        for shape in SHAPES:
+            with self.subTest(shape=shape):
+                tree = generate_tree(shape, groups=30, components_per_group=2, links_per_group=1)
+                groups = DdGroup.objects.filter(type__name=f'benchmark-{shape}')
+                self.assertEqual(groups.count(), 30)
+                self.assertEqual(groups.filter(parent=None).count(), 2)
+                self.assertEqual(DdLink.objects.filter(group_from__in=groups).count(), tree['links'])
+                depths[shape] = max(
+                    len(DdGroup.objects.ancestors([group.id])) for group in groups
+                )
+
+        self.assertEqual(depths['wide'], 1)
+        self.assertEqual(depths['deep'], 14)
+        self.assertLess(depths['balanced'], depths['deep'])
+
+    def test_suite_reports_metrics_and_rolls_back(self):
+        report = run_suite(shapes=['balanced', 'skewed'], groups=20, repeat=1)
+
+        self.assertEqual(len(report['results']), 8)
+        self.assertFalse(DdGroup.objects.exists())
+        for result in report['results']:
+            self.assertGreater(result['output_bytes'], 0)
+            self.assertGreater(result['queries'], 0)
+            self.assertGreaterEqual(result['peak_memory_mb'], 0)
+
+        sizes = {(result['shape'], result['operation']): result['output_bytes'] for result in report['results']}
+        self.assertEqual(sizes['balanced', 'relayout'], sizes['balanced', 'all'])
+
+        comparison = compare(report['results'], report['results'])
+        self.assertEqual({row['time_ms'] for row in comparison}, {1.0})
@@ -93,6 +93,90 @@ DATABASES = {
     }
 }
 
+# SQLite для локального запуска тестов без PostgreSQL (DATABASE_ENGINE=sqlite3)
+if os.getenv('DATABASE_ENGINE') == 'sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / os.getenv('DATABASE_NAME', 'db.sqlite3'),
+        }
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'c4drawer-default',
+    },
+    # Готовые drawio документы. Размер ограничен количеством записей:
+    # при превышении MAX_ENTRIES бэкенд вытесняет часть записей
+    'export': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'c4drawer-export',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('EXPORT_CACHE_MAX_ENTRIES', '200')),
+            'CULL_FREQUENCY': 4,
+        },
+    },
+    # Рассчитанный layout групп DD (по записи на группу)
+    'layout': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'c4drawer-layout',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('EXPORT_LAYOUT_CACHE_MAX_ENTRIES', '100000')),
+        },
+    },
+    # XML поддеревьев групп по хэшу содержимого
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'c4drawer-fragments',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('EXPORT_FRAGMENT_CACHE_MAX_ENTRIES', '20000')),
+        },
+    },
+}
+
+# Keyset-пагинация списков API (?limit=&after=): наибольший размер страницы
+API_PAGE_MAX_LIMIT = 1000
+
+# Экспорт в drawio
+EXPORT_CACHE_ALIAS = 'export'
+EXPORT_CACHE_TIMEOUT = 3600
+# Документы больше этого размера (в символах) не кэшируются
+EXPORT_CACHE_MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+# Кэш упаковки детей групп: после изменения группы или компонента заново
+# упаковываются только сама группа и ее предки. Обход дерева остается O(n),
+# и на бенчмарке (relayout) выигрыша нет - по умолчанию выключен
+EXPORT_LAYOUT_CACHE_ENABLED = False
+EXPORT_LAYOUT_CACHE_ALIAS = 'layout'
+EXPORT_LAYOUT_CACHE_TIMEOUT = None
+# Параллельный расчет layout корневых групп: число процессов (1 - последовательно).
+# Выигрыш не подтвержден бенчмарком (на одном ядре пул медленнее в 2.6 раза) - по умолчанию выключен
+EXPORT_LAYOUT_PROCESSES = int(os.getenv('EXPORT_LAYOUT_PROCESSES', '1'))
+EXPORT_LAYOUT_PARALLEL_MIN_GROUPS = int(os.getenv('EXPORT_LAYOUT_PARALLEL_MIN_GROUPS', '20000'))
+# Кэш XML поддеревьев групп: повторный экспорт сериализует только измененные поддеревья.
+# Для сериализатора template выигрыш мал (около 8% на 5000 групп) - по умолчанию выключен
+EXPORT_FRAGMENT_CACHE_ENABLED = False
+EXPORT_FRAGMENT_CACHE_ALIAS = 'fragments'
+EXPORT_FRAGMENT_CACHE_TIMEOUT = None
+EXPORT_FRAGMENT_CACHE_MIN_CELLS = 10
+EXPORT_FRAGMENT_CACHE_MAX_CELLS = 5000
+# Сериализация ячеек: template - строковые шаблоны, elementtree - через ElementTree
+EXPORT_CELL_SERIALIZER = os.getenv('EXPORT_CELL_SERIALIZER', 'template')
+# Асинхронные задания экспорта: каталог результатов и размер пула export_worker
+EXPORT_JOBS_DIR = Path(os.getenv('EXPORT_JOBS_DIR', BASE_DIR / 'export_jobs'))
+EXPORT_WORKER_PROCESSES = int(os.getenv('EXPORT_WORKER_PROCESSES', '2'))
+# Задание running без сигнала воркера дольше этого времени (секунды) считается прерванным
+EXPORT_JOB_LEASE_TIMEOUT = int(os.getenv('EXPORT_JOB_LEASE_TIMEOUT', '300'))
+# Завершенные задания и файлы их результатов удаляются через это время (секунды)
+EXPORT_JOB_RETENTION = int(os.getenv('EXPORT_JOB_RETENTION', str(7 * 24 * 3600)))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators